@@ -1,12 +1,125 @@
+import asyncio
+import threading
+from collections import deque
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import IndexModel, ASCENDING, DESCENDING
-from datetime import datetime
+from pymongo import UpdateOne, ASCENDING, WriteConcern, monitoring
+from datetime import datetime, timezone
+from bson.codec_options import CodecOptions
+from typing import Dict, List, Optional
 import pymongo
-from config import MONGO_URI, MONGO_DB
+from config import (
+    MONGO_COMPRESSORS,
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_DB,
+    MONGO_MAINTENANCE_TIMEOUT_SECONDS,
+    MONGO_MAX_IDLE_TIME_MS,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_TIMEOUT_MS,
+    MONGO_URI
+)
 from utils import logger, mark_initialized
 
 
 
+class PoolWaitMonitor(monitoring.ConnectionPoolListener):
+    """连接池等待时间统计
+
+    记录每次从连接池取连接的耗时（含新建连接）和取连接失败次数，
+    用于判断 MONGO_MAX_POOL_SIZE / MONGO_MIN_POOL_SIZE 是否合适：
+    等待时间持续升高或出现 timeout 失败说明连接池不够用。
+    驱动在线程池中回调，统计用锁保护。
+    """
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        # 最近 window 次取连接的等待时间（秒），用于计算分位数
+        self._recent = deque(maxlen=window)
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.failures: Dict[str, int] = {}
+
+    def connection_checked_out(self, event) -> None:
+        wait = getattr(event, 'duration', None)
+        if wait is None:
+            return
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._recent.append(wait)
+
+    def connection_check_out_failed(self, event) -> None:
+        with self._lock:
+            self.failures[event.reason] = self.failures.get(event.reason, 0) + 1
+
+    # 其他连接池事件不需要统计
+    def pool_created(self, event) -> None: pass
+    def pool_ready(self, event) -> None: pass
+    def pool_cleared(self, event) -> None: pass
+    def pool_closed(self, event) -> None: pass
+    def connection_created(self, event) -> None: pass
+    def connection_ready(self, event) -> None: pass
+    def connection_closed(self, event) -> None: pass
+    def connection_check_out_started(self, event) -> None: pass
+    def connection_checked_in(self, event) -> None: pass
+
+    def stats(self) -> dict:
+        """等待时间统计（毫秒）"""
+        with self._lock:
+            recent = sorted(self._recent)
+            checkouts, total_wait, max_wait = self.checkouts, self.total_wait, self.max_wait
+            failures = dict(self.failures)
+
+        def percentile(q: float) -> float:
+            return round(recent[min(len(recent) - 1, int(len(recent) * q))] * 1000, 2) if recent else 0.0
+
+        return {
+            'checkouts': checkouts,
+            'avg_wait_ms': round(total_wait / checkouts * 1000, 2) if checkouts else 0.0,
+            'p50_wait_ms': percentile(0.5),
+            'p99_wait_ms': percentile(0.99),
+            'max_wait_ms': round(max_wait * 1000, 2),
+            'failures': failures
+        }
+
+
+# 全局连接池监控实例
+pool_monitor = PoolWaitMonitor()
+
+# 读取的时间统一为带 UTC 时区的 datetime，与 datetime.now(timezone.utc) 直接比较
+CODEC_OPTIONS = CodecOptions(tz_aware=True, tzinfo=timezone.utc)
+
+# 可容忍丢失的高频写入：只等主节点确认
+HOT_PATH_WRITE_CONCERN = WriteConcern(w=1)
+# 开奖结果、抽奖状态：等多数节点确认，主节点切换后不会回滚
+CRITICAL_WRITE_CONCERN = WriteConcern(w='majority')
+
+# 按集合指定写关注，未列出的集合使用客户端默认值（w='majority'）
+COLLECTION_WRITE_CONCERNS: Dict[str, WriteConcern] = {
+    # 发言计数桶：内存中有完整增量，丢失最近一次写回只会少计几条发言
+    'message_buckets': HOT_PATH_WRITE_CONCERN,
+    # get_chat 结果的持久化缓存，丢失后重新请求 Telegram
+    'chats': HOT_PATH_WRITE_CONCERN,
+    'lotteries': CRITICAL_WRITE_CONCERN,
+    'prize_winners': CRITICAL_WRITE_CONCERN
+}
+
+
+def get_collection(db, name: str):
+    """获取应用了该集合写关注的集合句柄
+
+    事务中的写入使用事务的写关注，集合上的设置不生效，
+    开奖事务需在 start_transaction 中指定 CRITICAL_WRITE_CONCERN。
+    """
+    write_concern = COLLECTION_WRITE_CONCERNS.get(name)
+    if write_concern is None:
+        return db[name]
+    return db.get_collection(name, write_concern=write_concern)
+
+
 class MongoDBConnection:
     _instance = None
     _db = None
@@ -20,261 +133,348 @@ class MongoDBConnection:
                     MONGO_URI,
                 #    tls=True,
                 #    tlsAllowInvalidCertificates=True,
-                    serverSelectionTimeoutMS=30000,  
-                    connectTimeoutMS=30000,
-                    socketTimeoutMS=30000,
-                    waitQueueTimeoutMS=30000,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                    compressors=MONGO_COMPRESSORS,
+                    # 单次操作总超时（含等待连接池），取代 socketTimeoutMS / waitQueueTimeoutMS，
+                    # 连接池排队时快速失败而不是卡住 30 秒
+                    timeoutMS=MONGO_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    event_listeners=[pool_monitor],
+                    tz_aware=CODEC_OPTIONS.tz_aware,
+                    tzinfo=CODEC_OPTIONS.tzinfo,
                     retryWrites=True,
                     w='majority',
                     server_api=pymongo.server_api.ServerApi(
                         version="1", 
                         strict=True, 
                         deprecation_errors=True))
-                cls._db = client[MONGO_DB]
+                cls._db = client.get_database(MONGO_DB, codec_options=CODEC_OPTIONS)
                 cls._instance = client
             except Exception as e:
                 logger.error(f"MongoDB 连接失败: {e}", exc_info=True)
                 raise
         return cls._db
 
-async def init_db():
-    """初始化数据库集合和索引"""
-    if mark_initialized('database'):
-        return
-        
-    try:
-        db = await MongoDBConnection.get_database()
-        
-        # MongoDB 集合验证规则
-        validators = {
-            'lotteries': {
-                '$jsonSchema': {
-                    'bsonType': 'object',
-                    'required': ['id', 'creator_id', 'status', 'created_at', 'updated_at'],
-                    'properties': {
-                        'id': {'bsonType': 'string'},
-                        'creator_id': {'bsonType': 'long'},
-                        'creator_name': {'bsonType': 'string'},
-                        'status': {
-                            'enum': ['draft', 'creating', 'active', 'completed', 'cancelled']
-                        },
-                        'created_at': {'bsonType': 'date'},
-                        'updated_at': {'bsonType': 'date'}
-                    }
-                }
-            },
-            'lottery_settings': {
-                '$jsonSchema': {
-                    'bsonType': 'object',
-                    'required': ['lottery_id', 'title','description','join_method', 'draw_method'],
-                    'properties': {
-                        'lottery_id': {'bsonType': 'string'},
-                        'title': {'bsonType': 'string'},
-                        'description': {'bsonType': 'string'},
-                        'media_type': {'enum': ['image', 'video', None]},
-                        'media_url': {                    
-                            'oneOf': [
-                                {'bsonType': 'string'},
-                                {'bsonType': 'null'}
-                            ]
-                        },
-                        'join_method': {
-                            'enum': ['private_chat_bot', 'send_keywords_in_group', 'send_messages_in_group']
-                        },
-                        'keyword_group_id': {
-                            'oneOf': [
-                                {'bsonType': 'string'},
-                                {'bsonType': 'null'}
-                            ]
-                        },
-                        'keyword': {
-                            'oneOf': [
-                                {'bsonType': 'string'},
-                                {'bsonType': 'null'}
-                            ]
-                        },
-                        'message_group_id': {
-                            'oneOf': [
-                                {'bsonType': 'string'},
-                                {'bsonType': 'null'}
-                            ]
-                        },
-                        'message_count': {
-                            'oneOf': [
-                                {'bsonType': 'int'},
-                                {'bsonType': 'null'}
-                            ]
-                        },
-                        'message_check_time': {
-                            'oneOf': [
-                                {'bsonType': 'int'},
-                                {'bsonType': 'null'}
-                            ]
-                        },
-                        'require_username': {'bsonType': 'bool'},
-                        'required_groups': {'bsonType': 'array'},
-                        'draw_method': {
-                            'enum': ['draw_when_full', 'draw_at_time']
-                        },
-                        'participant_count': {'bsonType': 'int'},
-                        'draw_time': {
-                            'oneOf': [
-                                {'bsonType': 'date'},
-                                {'bsonType': 'null'}
-                            ]
-                        }
-                    }
-                }
-            },
-            'prizes': {
-                '$jsonSchema': {
-                    'bsonType': 'object',
-                    'required': ['lottery_id', 'name', 'total_count'],
-                    'properties': {
-                        'lottery_id': {'bsonType': 'string'},
-                        'name': {'bsonType': 'string'},
-                        'total_count': {'bsonType': 'int'}
-                    }
-                }
-            },
-            'prize_winners': {
-                '$jsonSchema': {
-                    'bsonType': 'object',
-                    'required': ['prize_id', 'participant_id', 'lottery_id', 'status'],
-                    'properties': {
-                        'prize_id': {'bsonType': 'objectId'},
-                        'participant_id': {'bsonType': 'objectId'},
-                        'lottery_id': {'bsonType': 'string'},
-                        'status': {
-                            'enum': ['pending', 'claimed', 'expired']
-                        },
-                        'win_time': {'bsonType': 'date'}
-                    }
-                }
-            },
-            'participants': {
-                '$jsonSchema': {
-                    'bsonType': 'object',
-                    'required': ['lottery_id', 'user_id', 'nickname'],
-                    'properties': {
-                        'lottery_id': {'bsonType': 'string'},
-                        'user_id': {'bsonType': 'long'},
-                        'nickname': {'bsonType': 'string'},
-                        'username': {'bsonType': 'string'},
-                        'join_time': {'bsonType': 'date'}
-                    }
-                }
-            },
-            'message_counts': {
-                '$jsonSchema': {
-                    'bsonType': 'object',
-                    'required': ['lottery_id', 'user_id', 'group_id', 'message_count'],
-                    'properties': {
-                        'lottery_id': {'bsonType': 'string'},
-                        'user_id': {'bsonType': 'long'},
-                        'group_id': {'bsonType': 'string'},
-                        'message_count': {'bsonType': 'int'},
-                        'last_message_time': {'bsonType': 'date'}
-                    }
+    @classmethod
+    async def get_client(cls):
+        """获取 MongoDB 客户端（用于会话和事务）"""
+        await cls.get_database()
+        return cls._instance
+
+    @classmethod
+    async def warm_up(cls, connections: int = MONGO_MIN_POOL_SIZE) -> None:
+        """启动时并发执行 ping 预先建立连接，避免第一批请求排队等待建连"""
+        db = await cls.get_database()
+        if connections <= 0:
+            return
+        await asyncio.gather(*(db.command('ping') for _ in range(connections)))
+        logger.info(f"MongoDB 连接池预热完成: {connections} 个连接")
+
+
+# MongoDB 集合验证规则
+VALIDATORS = {
+    'lotteries': {
+        '$jsonSchema': {
+            'bsonType': 'object',
+            'required': ['id', 'creator_id', 'status', 'created_at', 'updated_at'],
+            'properties': {
+                'id': {'bsonType': 'string'},
+                'creator_id': {'bsonType': 'long'},
+                'creator_name': {'bsonType': 'string'},
+                'status': {
+                    'enum': ['draft', 'creating', 'active', 'drawing', 'completed', 'cancelled']
+                },
+                'participant_count': {'bsonType': ['int', 'long']},
+                'draw_owner': {'bsonType': 'string'},
+                'draw_lease_expires_at': {'bsonType': 'date'},
+                # 读模型：创建时写入的抽奖设置和奖品副本
+                'settings': {'bsonType': 'object'},
+                'prizes': {'bsonType': 'array'},
+                'created_at': {'bsonType': 'date'},
+                'updated_at': {'bsonType': 'date'}
+            }
+        }
+    },
+    'lottery_settings': {
+        '$jsonSchema': {
+            'bsonType': 'object',
+            'required': ['lottery_id', 'title','description','join_method', 'draw_method'],
+            'properties': {
+                'lottery_id': {'bsonType': 'string'},
+                'title': {'bsonType': 'string'},
+                'description': {'bsonType': 'string'},
+                'media_type': {'enum': ['image', 'video', None]},
+                'media_url': {                    
+                    'oneOf': [
+                        {'bsonType': 'string'},
+                        {'bsonType': 'null'}
+                    ]
+                },
+                'join_method': {
+                    'enum': ['private_chat_bot', 'send_keywords_in_group', 'send_messages_in_group']
+                },
+                'keyword_group_id': {
+                    'oneOf': [
+                        {'bsonType': 'string'},
+                        {'bsonType': 'null'}
+                    ]
+                },
+                'keyword': {
+                    'oneOf': [
+                        {'bsonType': 'string'},
+                        {'bsonType': 'null'}
+                    ]
+                },
+                'message_group_id': {
+                    'oneOf': [
+                        {'bsonType': 'string'},
+                        {'bsonType': 'null'}
+                    ]
+                },
+                'message_count': {
+                    'oneOf': [
+                        {'bsonType': 'int'},
+                        {'bsonType': 'null'}
+                    ]
+                },
+                'message_check_time': {
+                    'oneOf': [
+                        {'bsonType': 'int'},
+                        {'bsonType': 'null'}
+                    ]
+                },
+                'require_username': {'bsonType': 'bool'},
+                'required_groups': {'bsonType': 'array'},
+                'draw_method': {
+                    'enum': ['draw_when_full', 'draw_at_time']
+                },
+                'participant_count': {'bsonType': 'int'},
+                'draw_time': {
+                    'oneOf': [
+                        {'bsonType': 'date'},
+                        {'bsonType': 'null'}
+                    ]
                 }
             }
         }
-        
-        # 创建集合
-        collections = {
-            # 抽奖表
-            'lotteries': [
-                IndexModel([('id', ASCENDING)], unique=True),
-                IndexModel([('creator_id', ASCENDING)]),
-                IndexModel([('status', ASCENDING)]),
-                IndexModel([('updated_at', DESCENDING)])
-            ],
-            # 抽奖设置表
-            'lottery_settings': [
-                IndexModel([('lottery_id', ASCENDING)], unique=True)
-            ],
-            # 奖品表
-            'prizes': [
-                IndexModel([('lottery_id', ASCENDING)])
-            ],
-            # 中奖记录表
-            'prize_winners': [
-                IndexModel([('lottery_id', ASCENDING)]),
-                IndexModel([('participant_id', ASCENDING)])
-            ],
-            # 参与者表
-            'participants': [
-                IndexModel([('lottery_id', ASCENDING)]),
-                IndexModel([('user_id', ASCENDING)]),
-                IndexModel([('lottery_id', ASCENDING), ('user_id', ASCENDING)], unique=True)
-            ],
-            # 消息跟踪记录表
-            'message_counts': [
-                IndexModel([('lottery_id', ASCENDING)]),
-                IndexModel([('user_id', ASCENDING)]),
-                IndexModel([('group_id', ASCENDING)]),
-                IndexModel([('last_message_time', DESCENDING)]),
-                IndexModel(
-                    [('lottery_id', ASCENDING), 
-                     ('user_id', ASCENDING), 
-                     ('group_id', ASCENDING)
-                    ], 
-                    unique=True
-                )
-            ]
+    },
+    'prizes': {
+        '$jsonSchema': {
+            'bsonType': 'object',
+            'required': ['lottery_id', 'name', 'total_count'],
+            'properties': {
+                'lottery_id': {'bsonType': 'string'},
+                'name': {'bsonType': 'string'},
+                'total_count': {'bsonType': 'int'}
+            }
         }
-        
-        # 创建或更新集合和验证规则
-        for collection_name, validator in validators.items():
-            try:
-                await db.create_collection(collection_name)
-            except Exception as e:
-                if 'already exists' not in str(e):
-                    raise
-                    
-            # 设置验证规则
-            await db.command({
-                'collMod': collection_name,
-                'validator': validator,
-                'validationLevel': 'strict',
-                'validationAction': 'error'
-            })
-            
-            # 应用索引
-            if collection_name in collections:
-                await db[collection_name].create_indexes(collections[collection_name])
-                
-        logger.info("MongoDB 集合、验证规则和索引初始化完成")
-        
-    except Exception as e:
-        logger.error(f"初始化 MongoDB 时出错: {e}", exc_info=True)
-        raise
+    },
+    'prize_winners': {
+        '$jsonSchema': {
+            'bsonType': 'object',
+            'required': ['prize_id', 'participant_id', 'lottery_id', 'status'],
+            'properties': {
+                'prize_id': {'bsonType': 'objectId'},
+                'participant_id': {'bsonType': 'objectId'},
+                'lottery_id': {'bsonType': 'string'},
+                'status': {
+                    'enum': ['pending', 'claimed', 'expired']
+                },
+                'win_time': {'bsonType': 'date'}
+            }
+        }
+    },
+    'participants': {
+        '$jsonSchema': {
+            'bsonType': 'object',
+            'required': ['lottery_id', 'user_id', 'nickname'],
+            'properties': {
+                'lottery_id': {'bsonType': 'string'},
+                'user_id': {'bsonType': 'long'},
+                'nickname': {'bsonType': 'string'},
+                'username': {'bsonType': 'string'},
+                'join_time': {'bsonType': 'date'}
+            }
+        }
+    },
+    'message_buckets': {
+        '$jsonSchema': {
+            'bsonType': 'object',
+            'required': ['group_id', 'user_id', 'bucket', 'count', 'expires_at'],
+            'properties': {
+                'group_id': {'bsonType': 'string'},
+                'user_id': {'bsonType': 'long'},
+                'bucket': {'bsonType': 'date'},
+                'count': {'bsonType': ['int', 'long']},
+                'expires_at': {'bsonType': 'date'}
+            }
+        }
+    },
+    'outbox': {
+        '$jsonSchema': {
+            'bsonType': 'object',
+            'required': ['lottery_id', 'kind', 'chat_id', 'payload', 'status', 'attempts', 'next_attempt_at'],
+            'properties': {
+                'lottery_id': {'bsonType': 'string'},
+                'kind': {'enum': ['winner', 'result']},
+                'chat_id': {'bsonType': ['long', 'int', 'string']},
+                'payload': {'bsonType': 'object'},
+                'status': {
+                    'enum': ['pending', 'sending', 'delivered', 'failed']
+                },
+                'attempts': {'bsonType': 'int'},
+                'lease_owner': {'bsonType': 'string'},
+                'lease_expires_at': {'bsonType': 'date'},
+                'next_attempt_at': {'bsonType': 'date'},
+                'delivered_at': {'bsonType': 'date'}
+            }
+        }
+    },
+    'chats': {
+        '$jsonSchema': {
+            'bsonType': 'object',
+            'required': ['id', 'type', 'updated_at'],
+            'properties': {
+                'id': {'bsonType': 'long'},
+                'title': {'bsonType': ['string', 'null']},
+                'username': {'bsonType': ['string', 'null']},
+                'type': {'bsonType': 'string'},
+                'invite_link': {'bsonType': ['string', 'null']},
+                'updated_at': {'bsonType': 'date'}
+            }
+        }
+    },
+    'leases': {
+        '$jsonSchema': {
+            'bsonType': 'object',
+            'required': ['_id', 'owner', 'expires_at'],
+            'properties': {
+                '_id': {'bsonType': 'string'},
+                'owner': {'bsonType': 'string'},
+                'expires_at': {'bsonType': 'date'},
+                'renewed_at': {'bsonType': 'date'}
+            }
+        }
+    }
+}
+
 
 async def check_db():
-    """检查数据库集合是否存在"""
+    """启动时执行尚未应用的数据库迁移（验证规则、索引和数据）"""
+    if mark_initialized('database'):
+        return
+
+    # 迁移模块依赖本模块中的定义，延迟导入
+    from app.migrations import run_migrations
     try:
-        db = await MongoDBConnection.get_database()
-        collections = await db.list_collection_names()
-        required_collections = ['lotteries', 'lottery_settings', 'prizes', 'prize_winners', 'participants']
-        
-        missing_collections = set(required_collections) - set(collections)
-        if missing_collections:
-            logger.info(f"缺少以下集合: {', '.join(missing_collections)}")
-            await init_db()
-        else:
-            logger.info("MongoDB 集合结构完整")
-            
+        await run_migrations()
     except Exception as e:
-        logger.error(f"检查 MongoDB 时出错: {e}", exc_info=True)
+        logger.error(f"执行数据库迁移时出错: {e}", exc_info=True)
         raise
 
+async def repair_participant_counts(lottery_ids: Optional[List[str]] = None) -> int:
+    """根据参与者表重新计算抽奖的参与人数
+
+    Args:
+        lottery_ids: 需要修复的抽奖ID列表，为None时修复所有抽奖
+
+    Returns:
+        int: 被修正的抽奖数量
+    """
+    db = await MongoDBConnection.get_database()
+    if lottery_ids is None:
+        lottery_ids = await db.lotteries.distinct('id')
+    if not lottery_ids:
+        return 0
+
+    pipeline = [
+        {'$match': {'lottery_id': {'$in': lottery_ids}}},
+        {'$group': {'_id': '$lottery_id', 'count': {'$sum': 1}}}
+    ]
+    # 全量统计参与者表耗时可能远超 MONGO_TIMEOUT_MS
+    with pymongo.timeout(MONGO_MAINTENANCE_TIMEOUT_SECONDS):
+        counts = {
+            doc['_id']: doc['count']
+            async for doc in db.participants.aggregate(pipeline)
+        }
+
+        requests = [
+            UpdateOne(
+                {'id': lottery_id, 'participant_count': {'$ne': counts.get(lottery_id, 0)}},
+                {'$set': {'participant_count': counts.get(lottery_id, 0)}}
+            )
+            for lottery_id in lottery_ids
+        ]
+        result = await db.lotteries.bulk_write(requests, ordered=False)
+    logger.info(f"参与人数修复完成，检查 {len(lottery_ids)} 个抽奖，修正 {result.modified_count} 个")
+    return result.modified_count
+
+def build_lottery_read_model(settings: dict, prizes: List[dict]) -> dict:
+    """lotteries 文档中内嵌的设置和奖品副本（lottery_settings、prizes 创建后不再修改）"""
+    return {
+        'settings': {
+            key: value for key, value in settings.items()
+            if key not in ('_id', 'created_at', 'updated_at')
+        },
+        'prizes': [
+            {'_id': prize['_id'], 'name': prize['name'], 'total_count': prize['total_count']}
+            for prize in prizes
+        ]
+    }
+
+async def sync_lottery_read_model(lottery_ids: Optional[List[str]] = None) -> int:
+    """从 lottery_settings 和 prizes 写入 lotteries 的读模型字段
+
+    Args:
+        lottery_ids: 需要同步的抽奖ID列表，为None时同步所有缺少读模型的抽奖
+
+    Returns:
+        int: 被更新的抽奖数量
+    """
+    db = await MongoDBConnection.get_database()
+    if lottery_ids is None:
+        lottery_ids = await db.lotteries.distinct('id', {'settings': {'$exists': False}})
+    if not lottery_ids:
+        return 0
+
+    settings_list = await db.lottery_settings.find({'lottery_id': {'$in': lottery_ids}}).to_list(None)
+    prizes_by_lottery = {}
+    async for prize in db.prizes.find({'lottery_id': {'$in': lottery_ids}}).sort('_id', ASCENDING):
+        prizes_by_lottery.setdefault(prize['lottery_id'], []).append(prize)
+
+    requests = [
+        UpdateOne(
+            {'id': settings['lottery_id']},
+            {'$set': build_lottery_read_model(settings, prizes_by_lottery.get(settings['lottery_id'], []))}
+        )
+        for settings in settings_list
+    ]
+    if not requests:
+        return 0
+    result = await db.lotteries.bulk_write(requests, ordered=False)
+    return result.modified_count
+
 # 集合模式定义（用于文档参考）
 COLLECTION_SCHEMAS = {
+    'schema_version': {
+        '_id': str,  # 固定为 'schema'
+        'collections': dict,  # 集合名 → {validator: 验证规则指纹, indexes: 索引计划指纹}
+        'data_version': int,  # 已执行的数据迁移版本
+        'updated_at': datetime
+    },
     'lotteries': {
         'id': str,
         'creator_id': int,
         'creator_name': str,
-        'status': str,  # draft, creating, active, completed, cancelled
+        'status': str,  # draft, creating, active, drawing, completed, cancelled
+        'participant_count': int,  # 参与人数（随参与记录 $inc 维护）
+        'draw_owner': str,  # 正在开奖的实例
+        'draw_lease_expires_at': datetime,  # 开奖租约过期时间
+        'settings': dict,  # 读模型：lottery_settings 副本（不含 _id 和时间戳）
+        'prizes': list,  # 读模型：奖品副本 [{_id, name, total_count}]
         'created_at': datetime,
         'updated_at': datetime
     },
@@ -315,12 +515,39 @@ COLLECTION_SCHEMAS = {
         'username': str,
         'join_time': datetime
     },
-    'message_counts': {
-        'lottery_id': str,
-        'user_id': int,
+    'message_buckets': {
         'group_id': str,
-        'message_count': int,
-        'last_message_time': datetime
+        'user_id': int,
+        'bucket': datetime,  # 计数桶起始时间（UTC）
+        'count': int,
+        'expires_at': datetime  # TTL 索引字段
+    },
+    'outbox': {
+        'lottery_id': str,
+        'kind': str,  # winner, result
+        'chat_id': int,
+        'payload': dict,  # send_message 参数（text、parse_mode、reply_markup 等）
+        'status': str,  # pending, sending, delivered, failed
+        'attempts': int,
+        'lease_owner': str,
+        'lease_expires_at': datetime,
+        'next_attempt_at': datetime,
+        'delivered_at': datetime,
+        'last_error': str
+    },
+    'chats': {
+        'id': int,
+        'title': str,
+        'username': str,
+        'type': str,  # private, group, supergroup, channel
+        'invite_link': str,
+        'updated_at': datetime
+    },
+    'leases': {
+        '_id': str,  # 租约名称
+        'owner': str,  # 持有租约的实例 INSTANCE_ID
+        'expires_at': datetime,
+        'renewed_at': datetime
     }
 }
 
@@ -0,0 +1,278 @@
+import asyncio
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+from bson import Int64
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from config import MONGO_DB, MONGO_URI
+
+# chats.username 按不区分大小写比较（Telegram 用户名不区分大小写）
+CHATS_USERNAME_COLLATION = {'locale': 'en', 'strength': 2}
+
+# 索引计划：每个集合需要的索引，由迁移（app/migrations.py）按此创建
+# 新增查询时先在 QUERY_SHAPES 中登记查询形状，再在这里补充能覆盖它的索引
+INDEX_PLAN: Dict[str, List[IndexModel]] = {
+    # 抽奖表
+    'lotteries': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('creator_id', ASCENDING)]),
+        IndexModel([('status', ASCENDING)]),
+        IndexModel([('updated_at', DESCENDING)]),
+        # 进行中抽奖列表、我创建的抽奖（按创建时间倒序）
+        IndexModel([('status', ASCENDING), ('created_at', DESCENDING)]),
+        IndexModel([('creator_id', ASCENDING), ('created_at', DESCENDING)]),
+        # 开奖调度、满人对账、群组索引按开奖方式筛选进行中的抽奖
+        IndexModel([('status', ASCENDING), ('settings.draw_method', ASCENDING)])
+    ],
+    # 抽奖设置表
+    'lottery_settings': [
+        IndexModel([('lottery_id', ASCENDING)], unique=True)
+    ],
+    # 奖品表（按写入顺序读取）
+    'prizes': [
+        IndexModel([('lottery_id', ASCENDING), ('_id', ASCENDING)])
+    ],
+    # 中奖记录表
+    'prize_winners': [
+        IndexModel([('lottery_id', ASCENDING)]),
+        IndexModel([('participant_id', ASCENDING)])
+    ],
+    # 参与者表
+    'participants': [
+        IndexModel([('lottery_id', ASCENDING)]),
+        IndexModel([('user_id', ASCENDING)]),
+        IndexModel([('lottery_id', ASCENDING), ('user_id', ASCENDING)], unique=True),
+        # 我的抽奖记录（按参与时间倒序）
+        IndexModel([('user_id', ASCENDING), ('join_time', DESCENDING)]),
+        # 管理页面参与者列表（按参与时间倒序）
+        IndexModel([('lottery_id', ASCENDING), ('join_time', DESCENDING)])
+    ],
+    # 发言计数桶表（按群组和用户统计，所有抽奖共享）
+    'message_buckets': [
+        IndexModel(
+            [('group_id', ASCENDING),
+             ('user_id', ASCENDING),
+             ('bucket', ASCENDING)
+            ],
+            unique=True
+        ),
+        # 超出保留期的桶自动删除
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0)
+    ],
+    # 聊天信息表（get_chat 结果的持久化缓存）
+    'chats': [
+        IndexModel([('id', ASCENDING)], unique=True),
+        IndexModel([('username', ASCENDING)], collation=CHATS_USERNAME_COLLATION)
+    ],
+    # 通知发件箱
+    'outbox': [
+        # 领取消息的 $or 两个分支（待发送 / 租约过期）都按 next_attempt_at 有序扫描，合并排序无需内存排序
+        IndexModel([('status', ASCENDING), ('next_attempt_at', ASCENDING), ('lease_expires_at', ASCENDING)]),
+        IndexModel([('lottery_id', ASCENDING)]),
+        # 已投递的消息保留7天
+        IndexModel([('delivered_at', ASCENDING)], expireAfterSeconds=7 * 24 * 3600)
+    ]
+}
+
+# 已被上面的索引取代、迁移时删除的索引（按索引名）
+RETIRED_INDEXES: Dict[str, List[str]] = {
+    'prizes': ['lottery_id_1'],
+    'outbox': ['status_1_next_attempt_at_1', 'status_1_lease_expires_at_1']
+}
+
+
+@dataclass(frozen=True)
+class QueryShape:
+    """一类查询的形状（字段和操作符与代码一致，取值只需有代表性）"""
+    name: str
+    collection: str
+    filter: dict
+    sort: Optional[dict] = None
+    limit: int = 0
+    hint: Optional[dict] = None
+    collation: Optional[dict] = None
+
+
+def _query_shapes() -> List[QueryShape]:
+    now = datetime.now(timezone.utc)
+    lottery_id = '0'
+    user_id = Int64(1)
+    return [
+        # 抽奖
+        QueryShape('按ID读取抽奖', 'lotteries', {'id': lottery_id}),
+        QueryShape('群组消息确认进行中的抽奖', 'lotteries', {'id': {'$in': [lottery_id]}, 'status': 'active'}),
+        QueryShape(
+            '进行中抽奖列表', 'lotteries',
+            {'status': 'active', 'settings': {'$exists': True}},
+            sort={'created_at': -1}, limit=10
+        ),
+        QueryShape(
+            '我创建的抽奖', 'lotteries',
+            {'creator_id': user_id, 'settings': {'$exists': True}},
+            sort={'created_at': -1}, limit=5
+        ),
+        QueryShape('按创建者统计抽奖', 'lotteries', {'creator_id': user_id}),
+        QueryShape(
+            '开奖调度加载', 'lotteries',
+            {'status': 'active', 'settings.draw_method': 'draw_at_time', 'settings.draw_time': {'$ne': None}}
+        ),
+        QueryShape(
+            '满人开奖对账', 'lotteries',
+            {
+                'status': 'active',
+                'settings.draw_method': 'draw_when_full',
+                '$expr': {'$gte': [{'$ifNull': ['$participant_count', 0]}, '$settings.participant_count']}
+            }
+        ),
+        QueryShape(
+            '群组索引加载', 'lotteries',
+            {
+                'status': 'active',
+                '$or': [
+                    {'settings.keyword_group_id': {'$ne': None}},
+                    {'settings.message_group_id': {'$ne': None}}
+                ]
+            }
+        ),
+        QueryShape('开奖租约过期', 'lotteries', {'status': 'drawing', 'draw_lease_expires_at': {'$lt': now}}),
+        QueryShape(
+            '过期抽奖清理', 'lotteries',
+            {'status': {'$in': ['completed', 'cancelled']}, 'updated_at': {'$lt': now}}
+        ),
+        # 设置和奖品（读穿透缓存未命中时）
+        QueryShape('按ID读取抽奖设置', 'lottery_settings', {'lottery_id': lottery_id}),
+        QueryShape('读取奖品', 'prizes', {'lottery_id': lottery_id}, sort={'_id': 1}),
+        QueryShape('批量读取奖品', 'prizes', {'lottery_id': {'$in': [lottery_id, '1']}}, sort={'_id': 1}),
+        # 参与者
+        QueryShape('是否已参与', 'participants', {'lottery_id': lottery_id, 'user_id': user_id}),
+        QueryShape(
+            '群组消息查询已参与的抽奖', 'participants',
+            {'lottery_id': {'$in': [lottery_id]}, 'user_id': user_id}
+        ),
+        QueryShape(
+            '我的抽奖记录', 'participants', {'user_id': user_id},
+            sort={'join_time': -1}, limit=10
+        ),
+        QueryShape('参与者列表', 'participants', {'lottery_id': lottery_id}, sort={'join_time': -1}),
+        QueryShape(
+            '开奖抽样扫描', 'participants', {'lottery_id': lottery_id},
+            hint={'lottery_id': 1, 'user_id': 1}
+        ),
+        QueryShape('读取中奖者', 'participants', {'lottery_id': lottery_id, 'user_id': {'$in': [user_id]}}),
+        # 发言计数
+        QueryShape(
+            '读取发言计数桶', 'message_buckets',
+            {'group_id': '-1', 'user_id': user_id, 'bucket': {'$gte': now}}
+        ),
+        # 聊天信息
+        QueryShape('按ID读取聊天', 'chats', {'id': user_id}),
+        QueryShape('按用户名读取聊天', 'chats', {'username': 'name'}, collation=CHATS_USERNAME_COLLATION),
+        # 发件箱
+        QueryShape(
+            '领取待发送消息', 'outbox',
+            {
+                '$or': [
+                    {'status': 'pending', 'next_attempt_at': {'$lte': now}},
+                    {'status': 'sending', 'lease_expires_at': {'$lt': now}}
+                ]
+            },
+            sort={'next_attempt_at': 1}, limit=1
+        ),
+        # 租约
+        QueryShape(
+            '续约领导者租约', 'leases',
+            {'_id': 'background_tasks', '$or': [{'owner': 'instance'}, {'expires_at': {'$lt': now}}]}
+        )
+    ]
+
+
+# 代码中所有热点查询的形状
+QUERY_SHAPES: List[QueryShape] = _query_shapes()
+
+# 不允许出现在执行计划中的阶段：全表扫描、内存排序
+FORBIDDEN_STAGES = ('COLLSCAN', 'SORT')
+
+
+def _plan_stages(plan: dict) -> Iterable[str]:
+    """遍历执行计划树中的所有阶段名（兼容经典引擎和 SBE 的 explain 输出）"""
+    if 'stage' in plan:
+        yield plan['stage']
+    for key in ('inputStage', 'queryPlan', 'winningPlan'):
+        if isinstance(plan.get(key), dict):
+            yield from _plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from _plan_stages(child)
+
+
+async def explain_shape(db, shape: QueryShape) -> List[str]:
+    """对查询形状执行 explain，返回执行计划中的禁止阶段"""
+    command = {'find': shape.collection, 'filter': shape.filter}
+    if shape.sort:
+        command['sort'] = shape.sort
+    if shape.limit:
+        command['limit'] = shape.limit
+    if shape.hint:
+        command['hint'] = shape.hint
+    if shape.collation:
+        command['collation'] = shape.collation
+    result = await db.command('explain', command, verbosity='queryPlanner')
+    stages = _plan_stages(result['queryPlanner']['winningPlan'])
+    return sorted({stage for stage in stages if stage in FORBIDDEN_STAGES})
+
+
+def _key_spec(key) -> List[tuple]:
+    return [(field, direction if isinstance(direction, str) else int(direction)) for field, direction in key.items()]
+
+
+async def missing_indexes(db) -> List[str]:
+    """对比 INDEX_PLAN 和数据库中已有的索引（按键），返回缺失的索引（只读，不创建）"""
+    missing = []
+    for collection_name, indexes in INDEX_PLAN.items():
+        existing = await db[collection_name].index_information()
+        existing_keys = [_key_spec(dict(info['key'])) for info in existing.values()]
+        for index in indexes:
+            if _key_spec(index.document['key']) not in existing_keys:
+                missing.append(f"{collection_name}.{index.document['name']}")
+    return missing
+
+
+async def check_query_plans(db, shapes: Iterable[QueryShape] = None) -> List[str]:
+    """检查所有查询形状的执行计划，返回问题列表（为空表示全部走索引且无内存排序）"""
+    problems = []
+    for shape in shapes if shapes is not None else QUERY_SHAPES:
+        stages = await explain_shape(db, shape)
+        if stages:
+            problems.append(f"{shape.collection} / {shape.name}: {', '.join(stages)}")
+    return problems
+
+
+async def main() -> int:
+    """只读检查：报告缺失的索引并 explain 所有查询形状，索引由迁移（app/migrations.py）创建"""
+    # explain 不在 Stable API v1 中，不能使用应用的严格模式连接
+    client = AsyncIOMotorClient(MONGO_URI, serverSelectionTimeoutMS=30000)
+    try:
+        db = client[MONGO_DB]
+        missing = await missing_indexes(db)
+        problems = await check_query_plans(db)
+    finally:
+        client.close()
+
+    if missing:
+        print("以下索引尚未创建（启动应用执行迁移后创建）:")
+        for name in missing:
+            print(f"  - {name}")
+    if problems:
+        print("以下查询未被索引完整覆盖:")
+        for problem in problems:
+            print(f"  - {problem}")
+    if missing or problems:
+        return 1
+    print(f"全部 {len(QUERY_SHAPES)} 个查询形状均使用索引且无内存排序")
+    return 0
+
+
+if __name__ == '__main__':
+    # 运行方式（项目根目录）: python -m app.index_plan
+    sys.exit(asyncio.run(main()))
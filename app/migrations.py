@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Set
+import pymongo
+from pymongo.errors import OperationFailure
+from app.database import MongoDBConnection, VALIDATORS, repair_participant_counts, sync_lottery_read_model
+from app.index_plan import INDEX_PLAN, RETIRED_INDEXES
+from config import MIGRATION_BACKGROUND_INDEX_DOCS, MIGRATION_TIMEOUT_SECONDS
+from utils import logger
+
+# schema_version 集合中记录迁移状态的文档
+SCHEMA_DOC_ID = 'schema'
+
+# 后台建索引的任务（保持引用，避免被回收）
+_background_builds: Set[asyncio.Task] = set()
+
+
+@dataclass(frozen=True)
+class DataMigration:
+    version: int
+    description: str
+    run: Callable[[], Awaitable[int]]
+
+
+async def drop_legacy_message_counts() -> int:
+    """删除按抽奖统计的旧 message_counts 集合，返回删除的文档数
+
+    旧文档只有累计条数和最后发言时间，无法换算为 message_buckets 的时间桶；
+    删除后发言要求按计数桶从上线时起重新累计。
+    """
+    db = await MongoDBConnection.get_database()
+    if 'message_counts' not in await db.list_collection_names():
+        return 0
+    count = await db.message_counts.estimated_document_count()
+    await db.message_counts.drop()
+    return count
+
+
+# 数据迁移，按 version 顺序执行，每个只执行一次
+DATA_MIGRATIONS: List[DataMigration] = [
+    DataMigration(1, "为读模型上线前创建的抽奖补齐设置和奖品副本", sync_lottery_read_model),
+    DataMigration(2, "按参与者表回填反规范化的参与人数", repair_participant_counts),
+    DataMigration(3, "删除已被 message_buckets 计数桶取代的旧 message_counts 集合", drop_legacy_message_counts)
+]
+
+
+def _fingerprint(value) -> str:
+    """验证规则 / 索引定义的指纹，定义变化时重新应用"""
+    # 不排序键：复合索引的字段顺序有意义
+    return hashlib.sha1(json.dumps(value, default=str).encode()).hexdigest()[:16]
+
+
+def _index_fingerprint(collection_name: str) -> str:
+    return _fingerprint({
+        'indexes': [index.document for index in INDEX_PLAN.get(collection_name, [])],
+        'retired': RETIRED_INDEXES.get(collection_name, [])
+    })
+
+
+async def _apply_validator(db, collection_name: str) -> None:
+    with pymongo.timeout(MIGRATION_TIMEOUT_SECONDS):
+        try:
+            await db.create_collection(collection_name)
+        except Exception as e:
+            if 'already exists' not in str(e):
+                raise
+        await db.command({
+            'collMod': collection_name,
+            'validator': VALIDATORS[collection_name],
+            'validationLevel': 'strict',
+            'validationAction': 'error'
+        })
+
+
+async def _apply_indexes(db, collection_name: str) -> None:
+    """创建计划中的索引并删除已被取代的索引
+
+    MongoDB 4.2 起建索引只在开始和结束时短暂加锁，期间不阻塞读写；
+    重复执行时已存在的索引直接跳过，进行中的构建会被合并。
+    建索引耗时可能远超 MONGO_TIMEOUT_MS，使用单独的 MIGRATION_TIMEOUT_SECONDS。
+    """
+    collection = db[collection_name]
+    indexes = INDEX_PLAN.get(collection_name)
+    with pymongo.timeout(MIGRATION_TIMEOUT_SECONDS):
+        if indexes:
+            await collection.create_indexes(indexes)
+        for name in RETIRED_INDEXES.get(collection_name, []):
+            try:
+                await collection.drop_index(name)
+                logger.info(f"已删除被取代的索引 {collection_name}.{name}")
+            except OperationFailure as e:
+                # 索引不存在（新库或已删除）
+                if e.code != 27:
+                    raise
+
+
+async def _record(db, fields: dict) -> None:
+    fields['updated_at'] = datetime.now(timezone.utc)
+    await db.schema_version.update_one({'_id': SCHEMA_DOC_ID}, {'$set': fields}, upsert=True)
+
+
+async def _build_indexes_in_background(db, collection_name: str, fingerprint: str) -> None:
+    try:
+        await _apply_indexes(db, collection_name)
+        await _record(db, {f'collections.{collection_name}.indexes': fingerprint})
+        logger.info(f"集合 {collection_name} 的后台索引构建完成")
+    except Exception as e:
+        # 未记录指纹，下次启动时重试
+        logger.error(f"集合 {collection_name} 的后台索引构建失败: {e}", exc_info=True)
+
+
+async def run_migrations() -> int:
+    """执行尚未应用的迁移，返回执行的步骤数
+
+    schema_version 文档记录每个集合已应用的验证规则和索引指纹、以及数据迁移版本，
+    启动时只读取这一个文档，定义未变化时不执行任何 DDL。
+    多个实例同时启动时各步骤均可重复执行，结果相同。
+    文档数超过 MIGRATION_BACKGROUND_INDEX_DOCS 的集合在后台建索引，完成后才记录指纹。
+    """
+    db = await MongoDBConnection.get_database()
+    state = await db.schema_version.find_one({'_id': SCHEMA_DOC_ID}) or {}
+    applied = state.get('collections', {})
+    steps = 0
+
+    for collection_name in list(VALIDATORS) + [c for c in INDEX_PLAN if c not in VALIDATORS]:
+        current = applied.get(collection_name, {})
+
+        if collection_name in VALIDATORS:
+            fingerprint = _fingerprint(VALIDATORS[collection_name])
+            if current.get('validator') != fingerprint:
+                await _apply_validator(db, collection_name)
+                await _record(db, {f'collections.{collection_name}.validator': fingerprint})
+                logger.info(f"已更新集合 {collection_name} 的验证规则")
+                steps += 1
+
+        fingerprint = _index_fingerprint(collection_name)
+        if current.get('indexes') != fingerprint:
+            if await db[collection_name].estimated_document_count() > MIGRATION_BACKGROUND_INDEX_DOCS:
+                logger.info(f"集合 {collection_name} 数据量较大，在后台构建索引")
+                task = asyncio.create_task(_build_indexes_in_background(db, collection_name, fingerprint))
+                _background_builds.add(task)
+                task.add_done_callback(_background_builds.discard)
+            else:
+                await _apply_indexes(db, collection_name)
+                await _record(db, {f'collections.{collection_name}.indexes': fingerprint})
+                logger.info(f"已更新集合 {collection_name} 的索引")
+            steps += 1
+
+    data_version = state.get('data_version', 0)
+    for migration in DATA_MIGRATIONS:
+        if migration.version <= data_version:
+            continue
+        with pymongo.timeout(MIGRATION_TIMEOUT_SECONDS):
+            result = await migration.run()
+        await _record(db, {'data_version': migration.version})
+        logger.info(f"数据迁移 {migration.version} 完成: {migration.description} ({result})")
+        steps += 1
+
+    if steps:
+        logger.info(f"数据库迁移完成，共执行 {steps} 个步骤")
+    else:
+        logger.info("数据库结构已是最新")
+    return steps
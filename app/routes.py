@@ -1,5 +1,6 @@
 
 from bson import Int64
+from pymongo import ReturnDocument
 from fastapi import APIRouter, Request, Form, Depends
 from fastapi.responses import JSONResponse, HTMLResponse
 from fastapi.templating import Jinja2Templates
@@ -10,8 +11,12 @@ import json
 from bot.handlers import send_lottery_info_to_creator
 from bot.verification import check_lottery_status
 from bot.bot_instance import get_bot
-from app.database import MongoDBConnection 
-from utils import logger, parse_group_input, parse_time
+from bot.scheduler import draw_scheduler
+from bot.group_index import group_index
+from bot.chat_cache import chat_cache
+from bot.lottery_cache import lottery_cache
+from app.database import MongoDBConnection, build_lottery_read_model, get_collection
+from utils import format_timestamp, logger, parse_group_input, parse_time
 from telegram.error import TelegramError
 
 
@@ -32,42 +37,23 @@ async def get_lottery_info(lottery_id):
     try:
         db = await MongoDBConnection.get_database()
         
-        # 获取抽奖设置
-        pipeline = [
-            {
-                '$match': {
-                    'lottery_id': lottery_id
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'lotteries',
-                    'localField': 'lottery_id',
-                    'foreignField': 'id',
-                    'as': 'lottery'
-                }
-            },
-            {
-                '$unwind': '$lottery'
-            }
-        ]
-        
-        settings = await db.lottery_settings.aggregate(pipeline).to_list(1)
-        if not settings:
+        # 读模型：状态、人数、设置和奖品在同一文档中
+        lottery = await db.lotteries.find_one(
+            {'id': lottery_id},
+            {'status': 1, 'created_at': 1, 'participant_count': 1, 'settings': 1, 'prizes': 1}
+        )
+        if not lottery or not lottery.get('settings'):
             result.update({
                 "status": "error",
                 "error_title": "数据错误",
                 "message": "未找到抽奖设置信息"
             })
             return result
-            
-        setting = settings[0]
-        
-        # 获取奖品信息
-        prizes = await db.prizes.find({'lottery_id': lottery_id}).to_list(None)
+        setting = dict(lottery['settings'], lottery=lottery)
+        prizes = lottery.get('prizes', [])
         
         # 获取参与人数
-        participant_count = await db.participants.count_documents({'lottery_id': lottery_id})
+        participant_count = setting['lottery'].get('participant_count', 0)
         
         # 处理群组信息
         group_titles = []
@@ -83,7 +69,7 @@ async def get_lottery_info(lottery_id):
         # 处理开奖时间
         draw_time = setting.get('draw_time')
         if setting.get('draw_method') == 'draw_at_time':
-            draw_time = draw_time.strftime('%Y-%m-%d %H:%M:%S')
+            draw_time = format_timestamp(draw_time)
         elif setting.get('draw_method') == 'draw_when_full':
             draw_time = f"满{setting.get('participant_count')}人后自动开奖"
             
@@ -186,7 +172,7 @@ async def index(
                         "error_message": validity_check['message']
                     }
                 )
-            elif validity_check['status'] == 'active' or validity_check['status'] == 'completed':
+            elif validity_check['status'] in ('active', 'drawing', 'completed'):
                 response = await get_lottery_info(lottery_id)
                 if response['status'] == 'error':
                     return templates.TemplateResponse(
@@ -307,22 +293,9 @@ async def create_lottery(
                 'message': '未找到该抽奖活动'
             })
             
-        # 4. 更新抽奖状态
-
         now = datetime.now(timezone.utc)
-        await db.lotteries.update_one(
-            {'id': lottery_id, 'creator_id': Int64(creator_id)},
-            {
-                '$set': {
-                    'status': 'active',
-                    'updated_at': now
-                }
-            }
-        )
 
-
-        
-        # 5. 创建抽奖设置
+        # 4. 创建抽奖设置
         lottery_settings = {
             'lottery_id': lottery_id,
             'title': title,
@@ -346,7 +319,7 @@ async def create_lottery(
         
         await db.lottery_settings.insert_one(lottery_settings)
         
-        # 6. 创建奖品记录
+        # 5. 创建奖品记录
         if len(prize_name) != len(prize_count):
             return JSONResponse({'status': 'error', 'message': '奖品名称和数量不匹配'})
             
@@ -369,6 +342,29 @@ async def create_lottery(
                 
         if prizes:
             await db.prizes.insert_many(prizes)
+
+        # 6. 更新抽奖状态，同时写入读模型（设置和奖品副本），列表和页面只需读取 lotteries
+        stored = await get_collection(db, 'lotteries').find_one_and_update(
+            {'id': lottery_id, 'creator_id': Int64(creator_id)},
+            {
+                '$set': {
+                    'status': 'active',
+                    'updated_at': now,
+                    **build_lottery_read_model(lottery_settings, prizes)
+                }
+            },
+            projection={'settings': 1, '_id': 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if not stored:
+            logger.error(f"激活抽奖 {lottery_id} 失败：抽奖不存在或创建者不匹配")
+            return JSONResponse({'status': 'error', 'message': '未找到该抽奖活动'})
+
+        # 抽奖已激活，按数据库中的设置登记缓存、群组索引和定时开奖
+        lottery_cache.put(lottery_id, settings=lottery_settings, prizes=prizes)
+        group_index.add(stored['settings'])
+        if stored['settings']['draw_method'] == 'draw_at_time' and isinstance(stored['settings']['draw_time'], datetime):
+            draw_scheduler.schedule(lottery_id, stored['settings']['draw_time'])
         
         # 7. 组装返回数据
         lottery_data = {
@@ -451,7 +447,7 @@ async def get_participants(
         # 处理时间格式
         for p in participants:
             if 'join_time' in p:
-                p['join_time'] = p['join_time'].strftime('%Y-%m-%d %H:%M:%S')
+                p['join_time'] = format_timestamp(p['join_time'])
                 
         return JSONResponse({'participants': participants})
         
@@ -466,21 +462,7 @@ async def get_participants(
 async def get_prizes(request: Request, lottery_id: str):
     """获取抽奖奖品列表"""
     try:
-        # 获取数据库连接
-        db = await MongoDBConnection.get_database()
-        
-        # 执行查询
-        cursor = db.prizes.find(
-            {'lottery_id': lottery_id},
-            {
-                'name': 1,
-                'total_count': 1,
-                '_id': 1
-            }
-        )
-        
-        # 获取结果
-        prizes = await cursor.to_list(length=None)
+        prizes = await lottery_cache.get_prizes(lottery_id)
         
         # 格式化结果
         result = [{
@@ -519,7 +501,7 @@ async def cancel_lottery(request: Request, lottery_id: str):
             )
             
         # 更新抽奖状态
-        result = await db.lotteries.update_one(
+        result = await get_collection(db, 'lotteries').update_one(
             {'id': lottery_id},
             {
                 '$set': {
@@ -530,6 +512,8 @@ async def cancel_lottery(request: Request, lottery_id: str):
         )
         
         if result.modified_count > 0:
+            draw_scheduler.unschedule(lottery_id)
+            group_index.remove(lottery_id)
             return JSONResponse({'status': 'success'})
         else:
             return templates.TemplateResponse(
@@ -575,9 +559,9 @@ async def get_chat_info(query: str):
             chat = None
             try:
                 if chat_id:
-                    chat = await bot.get_chat(chat_id)
+                    chat = await chat_cache.get(chat_id)
                 elif username:
-                    chat = await bot.get_chat(username)
+                    chat = await chat_cache.get(username)
                     
             except TelegramError as e:
                 error_message = str(e).lower()
@@ -603,7 +587,7 @@ async def get_chat_info(query: str):
                     'status': 'success',
                     'data': {
                         'id': str(chat.id),
-                        'title': chat.title or chat.full_name,
+                        'title': chat.title,
                         'username': chat.username or '',
                         'type': chat.type,
                         'invite_link': getattr(chat, 'invite_link', None)
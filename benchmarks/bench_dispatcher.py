@@ -0,0 +1,93 @@
+"""消息调度器吞吐量基准测试
+
+使用模拟的 Bot API（带网络延迟，并按 Telegram 的全局/单会话限制返回 429），
+对比旧的逐条发送 + sleep(0.1) 方式与 MessageDispatcher 的持续吞吐量。
+
+运行方式（项目根目录）:
+    python -m benchmarks.bench_dispatcher --messages 600 --latency 0.05
+"""
+import argparse
+import asyncio
+import time
+from telegram.error import RetryAfter
+from bot.dispatcher import MessageDispatcher, TokenBucket
+
+
+class FakeBot:
+    """模拟 Bot API：固定延迟，超出限速时抛出 RetryAfter
+
+    服务端限速按令牌桶建模（全局 30 条/秒、单会话 1 条/秒，允许少量突发）。
+    """
+
+    def __init__(self, latency: float, global_rate: float = 30, chat_rate: float = 1, burst: float = 3):
+        self.latency = latency
+        self.sent = 0
+        self.rejected = 0
+        self._global = TokenBucket(global_rate, capacity=burst)
+        self._chat_rate = chat_rate
+        self._chats = {}
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(self.latency)
+        chat = self._chats.setdefault(chat_id, TokenBucket(self._chat_rate, capacity=1))
+        global_wait, chat_wait = self._global.reserve(), chat.reserve()
+        if global_wait > 0 or chat_wait > 0:
+            # 被拒绝的请求不消耗令牌
+            self._global.tokens += 1
+            chat.tokens += 1
+            self.rejected += 1
+            raise RetryAfter(1)
+        self.sent += 1
+        return {'chat_id': chat_id, 'text': text}
+
+
+async def bench_sequential(messages: int, latency: float) -> float:
+    """旧实现：逐条发送，每条之间固定 sleep(0.1)"""
+    bot = FakeBot(latency)
+    start = time.perf_counter()
+    for i in range(messages):
+        try:
+            await bot.send_message(chat_id=i + 1, text='test')
+        except RetryAfter:
+            pass
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - start
+    print(f"sequential : {bot.sent}/{messages} 条, {elapsed:.2f}s, {bot.sent / elapsed:.1f} 条/秒, 429: {bot.rejected}")
+    return bot.sent / elapsed
+
+
+async def bench_dispatcher(messages: int, latency: float, workers: int) -> float:
+    """新实现：令牌桶 + 并发发送协程"""
+    bot = FakeBot(latency)
+    dispatcher = MessageDispatcher(bot_getter=lambda: bot, workers=workers)
+    await dispatcher.start()
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(dispatcher.send_message(chat_id=i + 1, text='test') for i in range(messages)),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+    await dispatcher.stop()
+    failed = sum(1 for r in results if isinstance(r, Exception))
+    print(
+        f"dispatcher : {bot.sent}/{messages} 条, {elapsed:.2f}s, {bot.sent / elapsed:.1f} 条/秒, "
+        f"429: {bot.rejected}, 失败: {failed}"
+    )
+    return bot.sent / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="消息调度器吞吐量基准测试")
+    parser.add_argument('--messages', type=int, default=600)
+    parser.add_argument('--latency', type=float, default=0.05, help="模拟的 API 延迟（秒）")
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--skip-sequential', action='store_true')
+    args = parser.parse_args()
+
+    if not args.skip_sequential:
+        await bench_sequential(args.messages, args.latency)
+    await bench_dispatcher(args.messages, args.latency, args.workers)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
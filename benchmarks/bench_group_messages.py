@@ -0,0 +1,203 @@
+"""群组消息处理吞吐量基准测试
+
+对比旧的两个独立处理器（关键词参与 + 发言数量参与，每条消息各自查询数据库）
+与合并后的 handle_group_message（先查群组索引分类，只执行相关路径）。
+数据库用内存模拟，每次往返计入固定的驱动 CPU 开销并可附加网络延迟；输出单核每秒处理消息数和每条消息的数据库往返次数。
+
+运行方式（项目根目录）:
+    python -m benchmarks.bench_group_messages --messages 20000 --groups 200 --watched 2
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from telegram import Chat, Message, User
+from app.database import MongoDBConnection
+from bot.group_index import group_index
+from bot.handlers import handle_group_message
+
+
+class FakeCursor:
+    def __init__(self, collection, result):
+        self._collection = collection
+        self._result = result
+
+    async def to_list(self, length=None):
+        await self._collection.round_trip()
+        return self._result
+
+
+class FakeCollection:
+    """模拟集合：只统计往返次数，返回足以走完处理路径的结果"""
+
+    def __init__(self, db, name):
+        self._db = db
+        self._name = name
+
+    async def round_trip(self):
+        self._db.round_trips += 1
+        # 模拟驱动编解码 BSON、收发报文的 CPU 开销
+        deadline = time.perf_counter() + self._db.call_cpu
+        while time.perf_counter() < deadline:
+            pass
+        if self._db.latency:
+            await asyncio.sleep(self._db.latency)
+
+    async def find_one(self, *args, **kwargs):
+        await self.round_trip()
+        return None
+
+    def find(self, *args, **kwargs):
+        return FakeCursor(self, [])
+
+    async def update_one(self, *args, **kwargs):
+        await self.round_trip()
+
+    async def bulk_write(self, requests, **kwargs):
+        await self.round_trip()
+
+    async def distinct(self, key, query=None):
+        await self.round_trip()
+        return self._db.active_ids if self._name == 'lotteries' else []
+
+    def aggregate(self, pipeline):
+        group_id = pipeline[0]['$match']['message_group_id']
+        return FakeCursor(self, self._db.settings_by_group.get(group_id, []))
+
+
+class FakeDatabase:
+    def __init__(self, settings, latency, call_cpu):
+        self.latency = latency
+        self.call_cpu = call_cpu
+        self.round_trips = 0
+        self.active_ids = [s['lottery_id'] for s in settings]
+        self.settings_by_group = {}
+        for s in settings:
+            self.settings_by_group.setdefault(s['message_group_id'], []).append(s)
+
+    def __getattr__(self, name):
+        return FakeCollection(self, name)
+
+    def get_collection(self, name, **kwargs):
+        return FakeCollection(self, name)
+
+
+async def legacy_keyword_participate(update, db):
+    """旧关键词处理器的数据库访问：每条群组消息按群组和内容查询一次设置
+
+    （旧代码的 is_bot 判断写反，实际从未处理真人消息；这里按其本意计算开销）
+    """
+    message = update.message
+    if not message or not message.text or message.from_user.is_bot or message.forward_origin:
+        return
+    lottery = await db.lottery_settings.find_one({
+        'keyword_group_id': str(message.chat.id),
+        'keyword': message.text.strip()
+    })
+    if not lottery:
+        return
+
+
+async def legacy_message_count_participate(update, db):
+    """旧发言数量处理器的数据库访问：每条群组消息执行一次设置+抽奖状态聚合"""
+    message = update.message
+    if not message or not message.text or message.from_user.is_bot or message.forward_origin:
+        return
+    lotteries = await db.lottery_settings.aggregate([
+        {'$match': {'message_group_id': str(message.chat.id), 'message_count': {'$gt': 0}}},
+        {'$lookup': {'from': 'lotteries', 'localField': 'lottery_id', 'foreignField': 'id', 'as': 'lottery'}},
+        {'$unwind': '$lottery'},
+        {'$match': {'lottery.status': 'active'}}
+    ]).to_list(None)
+    for lottery in lotteries:
+        await db.participants.find_one({'lottery_id': lottery['lottery_id'], 'user_id': message.from_user.id})
+        # 旧 check_user_messages：每条消息读取并更新一次发言计数
+        await db.message_counts.find_one({
+            'lottery_id': lottery['lottery_id'], 'user_id': message.from_user.id, 'group_id': str(message.chat.id)
+        })
+        await db.message_counts.update_one({
+            'lottery_id': lottery['lottery_id'], 'user_id': message.from_user.id, 'group_id': str(message.chat.id)
+        }, {'$set': {'message_count': 1, 'last_message_time': message.date}}, upsert=True)
+
+
+async def legacy_handlers(update, context, db):
+    await legacy_keyword_participate(update, db)
+    await legacy_message_count_participate(update, db)
+
+
+async def merged_handler(update, context, db):
+    await handle_group_message(update, context)
+
+
+def make_updates(count: int, groups: int):
+    updates = []
+    for i in range(count):
+        group = random.randrange(groups)
+        chat_id = -1000000000000 - group
+        user = User(id=random.randrange(1, 10 ** 6), first_name='U', is_bot=False, username='u')
+        # 使用真实的 Message 对象，保证基准测试走的是生产环境的处理路径
+        message = Message(
+            message_id=i,
+            date=datetime.now(timezone.utc),
+            chat=Chat(id=chat_id, type=Chat.SUPERGROUP, title=f"group {group}", username=f"group_{group}"),
+            from_user=user,
+            text=f"hello {i}"
+        )
+        updates.append(SimpleNamespace(message=message))
+    return updates
+
+
+async def run(name, handler, updates, db, concurrency):
+    context = SimpleNamespace(bot=None)
+    db.round_trips = 0
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    for i in range(0, len(updates), concurrency):
+        await asyncio.gather(*(handler(u, context, db) for u in updates[i:i + concurrency]))
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    print(
+        f"{name:8s}: {len(updates) / cpu:10.0f} 条/秒/核, 耗时 {wall:.2f}s, "
+        f"数据库往返 {db.round_trips / len(updates):.2f} 次/条"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="群组消息处理吞吐量基准测试")
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--groups', type=int, default=200, help="机器人所在的群组数")
+    parser.add_argument('--watched', type=int, default=2, help="有进行中发言数量抽奖的群组数")
+    parser.add_argument('--latency', type=float, default=0.0, help="模拟的数据库往返延迟（秒）")
+    parser.add_argument('--call-cpu', type=float, default=0.00005, help="每次数据库往返的驱动 CPU 开销（秒）")
+    parser.add_argument('--concurrency', type=int, default=100)
+    args = parser.parse_args()
+
+    random.seed(1)
+    settings = [
+        {
+            'lottery_id': f"lottery_{g}",
+            'title': f"lottery {g}",
+            'message_group_id': str(-1000000000000 - g),
+            'message_count': 10 ** 9,
+            'message_check_time': 24
+        }
+        for g in range(args.watched)
+    ]
+    db = FakeDatabase(settings, args.latency, args.call_cpu)
+
+    async def get_database():
+        return db
+
+    MongoDBConnection.get_database = get_database
+    for s in settings:
+        group_index.add(s)
+
+    updates = make_updates(args.messages, args.groups)
+    await run('legacy', legacy_handlers, updates, db, args.concurrency)
+    await run('merged', merged_handler, updates, db, args.concurrency)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
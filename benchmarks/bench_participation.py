@@ -0,0 +1,132 @@
+"""参与抽奖吞吐量基准测试
+
+对比旧的参与流程（查询设置、查询状态、查询是否已参与、写入、更新人数）
+与 ParticipationService.join（设置可来自快照，直接写入由唯一索引去重）。
+数据库用内存模拟，每次往返计入固定的驱动 CPU 开销并可附加网络延迟；输出单核每秒参与次数和每次参与的数据库往返次数。
+
+运行方式（项目根目录）:
+    python -m benchmarks.bench_participation --joins 20000 --repeat 0.2
+"""
+import argparse
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+from bson import Int64
+from pymongo.errors import DuplicateKeyError
+from app.database import MongoDBConnection
+from bot.participation import SOURCE_BUTTON, SOURCE_KEYWORD, ParticipationService, increment_participant_count
+
+
+class FakeCollection:
+    """模拟集合：统计往返次数，participants 按 (lottery_id, user_id) 去重"""
+
+    def __init__(self, db, name):
+        self._db = db
+        self._name = name
+
+    async def round_trip(self):
+        self._db.round_trips += 1
+        # 模拟驱动编解码 BSON、收发报文的 CPU 开销
+        deadline = time.perf_counter() + self._db.call_cpu
+        while time.perf_counter() < deadline:
+            pass
+        if self._db.latency:
+            await asyncio.sleep(self._db.latency)
+
+    async def find_one(self, query, *args, **kwargs):
+        await self.round_trip()
+        if self._name == 'lottery_settings':
+            return self._db.settings
+        if self._name == 'lotteries':
+            return {'status': 'active', 'participant_count': len(self._db.joined)}
+        key = (query['lottery_id'], int(query['user_id']))
+        return {'_id': key} if key in self._db.joined else None
+
+    async def insert_one(self, doc):
+        await self.round_trip()
+        key = (doc['lottery_id'], int(doc['user_id']))
+        if key in self._db.joined:
+            raise DuplicateKeyError('E11000 duplicate key error')
+        self._db.joined.add(key)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        await self.round_trip()
+        return {'participant_count': len(self._db.joined)}
+
+
+class FakeDatabase:
+    def __init__(self, settings, latency, call_cpu):
+        self.settings = settings
+        self.latency = latency
+        self.call_cpu = call_cpu
+        self.round_trips = 0
+        self.joined = set()
+
+    def __getattr__(self, name):
+        return FakeCollection(self, name)
+
+
+async def legacy_join(lottery_id, user, db):
+    """旧参与流程的数据库访问"""
+    settings = await db.lottery_settings.find_one({'lottery_id': lottery_id})
+    if not settings:
+        return False
+    lottery = await db.lotteries.find_one({'id': lottery_id})
+    if not lottery or lottery['status'] != 'active':
+        return False
+    if await db.participants.find_one({'lottery_id': lottery_id, 'user_id': Int64(user.id)}):
+        return False
+    await db.participants.insert_one({'lottery_id': lottery_id, 'user_id': Int64(user.id)})
+    await increment_participant_count(db, lottery_id)
+    return True
+
+
+async def run(name, join, users, db, concurrency):
+    db.round_trips = 0
+    db.joined.clear()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    for i in range(0, len(users), concurrency):
+        await asyncio.gather(*(join(u) for u in users[i:i + concurrency]))
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    print(
+        f"{name:8s}: {len(users) / cpu:10.0f} 次/秒/核, 耗时 {wall:.2f}s, "
+        f"数据库往返 {db.round_trips / len(users):.2f} 次/次"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="参与抽奖吞吐量基准测试")
+    parser.add_argument('--joins', type=int, default=20000)
+    parser.add_argument('--repeat', type=float, default=0.2, help="重复参与（已参与用户再次点击）的比例")
+    parser.add_argument('--latency', type=float, default=0.0, help="模拟的数据库往返延迟（秒）")
+    parser.add_argument('--call-cpu', type=float, default=0.00005, help="每次数据库往返的驱动 CPU 开销（秒）")
+    parser.add_argument('--concurrency', type=int, default=100)
+    args = parser.parse_args()
+
+    random.seed(1)
+    lottery_id = 'lottery_bench'
+    settings = {'lottery_id': lottery_id, 'title': 'bench', 'draw_method': 'draw_at_time'}
+    db = FakeDatabase(settings, args.latency, args.call_cpu)
+
+    async def get_database():
+        return db
+
+    MongoDBConnection.get_database = get_database
+    service = ParticipationService(bot_getter=lambda: None)
+
+    unique = int(args.joins * (1 - args.repeat))
+    ids = list(range(1, unique + 1))
+    ids += [random.choice(ids) for _ in range(args.joins - unique)]
+    random.shuffle(ids)
+    users = [SimpleNamespace(id=i, username='u', full_name='U', first_name='U') for i in ids]
+
+    await run('legacy', lambda u: legacy_join(lottery_id, u, db), users, db, args.concurrency)
+    await run('button', lambda u: service.join(lottery_id, u, SOURCE_BUTTON), users, db, args.concurrency)
+    await run('keyword', lambda u: service.join(lottery_id, u, SOURCE_KEYWORD, settings=settings), users, db, args.concurrency)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
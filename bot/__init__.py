@@ -1,11 +1,17 @@
 from dataclasses import dataclass
 from typing import List, Optional
+from telegram import Update
 from telegram.ext import Application, CallbackQueryHandler
 from fastapi import FastAPI
 from bot.tasks import check_lottery_draws
-from config import TELEGRAM_BOT_TOKEN
+from bot.outbox import outbox_worker
+from bot.leader import leader_elector
+from bot.group_index import group_index
+from bot.message_counter import message_count_buffer
+from config import TELEGRAM_BOT_TOKEN, OUTBOX_WORKERS, GROUP_INDEX_REFRESH_INTERVAL
 from utils import logger, reset_initialization
 from bot.bot_instance import set_application, get_bot
+from bot.dispatcher import message_dispatcher
 
 app = FastAPI()
 from bot.commands import register_commands
@@ -44,12 +50,14 @@ async def create_bot():
 
         # 注册所有处理器
         register_commands(bot_state.application)
-        bot_state.application.add_handler(CallbackQueryHandler(handle_callback_query))
+        # 发布抽奖需要等待群组消息经限速队列发出，不阻塞其他更新的处理
+        bot_state.application.add_handler(CallbackQueryHandler(handle_callback_query, block=False))
         logger.info("所有处理器注册完成")
         
         # 启动机器人和轮询
         await bot_state.application.start()
-        await bot_state.application.updater.start_polling(drop_pending_updates=True)
+        await bot_state.application.updater.start_polling(drop_pending_updates=True, allowed_updates=Update.ALL_TYPES)
+        await message_dispatcher.start()
         logger.info("机器人初始化完成并开始轮询")
 
         return bot_state.application
@@ -64,7 +72,7 @@ async def start_bot():
         if not bot_state.application or not bot_state.application.running:  # 增加实例存在性检查
             bot_state.application = await create_bot()
             if bot_state.application:
-                await bot_state.application.updater.start_polling(drop_pending_updates=True)
+                await bot_state.application.updater.start_polling(drop_pending_updates=True, allowed_updates=Update.ALL_TYPES)
                 logger.info("机器人开始轮询")
         
         return bot_state.application
@@ -78,7 +86,9 @@ async def stop_bot():
     if bot_state.application:
         try:
             await bot_state.application.updater.stop()
+            # 等待处理中的更新（含非阻塞的回调处理）结束后再停止调度器，发送完队列中的消息
             await bot_state.application.stop()
+            await message_dispatcher.stop()
             await bot_state.application.shutdown()
             logger.info("机器人已停止")
         except Exception as e:
@@ -89,7 +99,16 @@ async def start_background_tasks():
     try:
         # 创建任务组
         bot_state.tasks = [
-            asyncio.create_task(check_lottery_draws()),
+            asyncio.create_task(check_lottery_draws(), name='check_lottery_draws'),
+            asyncio.create_task(leader_elector.run(), name='leader_elector'),
+            asyncio.create_task(
+                group_index.refresh_periodically(GROUP_INDEX_REFRESH_INTERVAL),
+                name='group_index_refresh'
+            ),
+            asyncio.create_task(message_count_buffer.run(), name='message_count_flush'),
+        ] + [
+            asyncio.create_task(outbox_worker(), name=f'outbox_worker_{i}')
+            for i in range(OUTBOX_WORKERS)
         ]
 
         def handle_task_result(task):
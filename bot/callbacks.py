@@ -3,14 +3,28 @@ from bson import Int64
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, Update
 from telegram.ext import ContextTypes
 from telegram.error import BadRequest
-from app.database import MongoDBConnection
-from bot.handlers import check_keyword_message, check_user_messages, handle_media
+from app.database import MongoDBConnection, get_collection
+from bot.handlers import handle_media
 from config import YOUR_BOT
-from utils import logger
+from utils import format_timestamp, logger
 from bot.verification import check_channel_subscription
+from bot.scheduler import draw_scheduler
+from bot.group_index import group_index
+from bot.dispatcher import message_dispatcher
+from bot.chat_cache import chat_cache
+from bot.lottery_cache import lottery_cache
+from bot.participation import SOURCE_BUTTON, participation_service
 
 
 
+async def find_active_lotteries(db, limit: int = 10) -> list:
+    """最近创建的进行中抽奖（读模型，按 (status, created_at) 索引读取）"""
+    return await db.lotteries.find(
+        {'status': 'active', 'settings': {'$exists': True}},
+        {'id': 1, 'participant_count': 1, 'settings': 1, '_id': 0}
+    ).sort('created_at', -1).limit(limit).to_list(None)
+
+
 async def verify_follow(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """处理关注验证回调"""
     query = update.callback_query
@@ -62,7 +76,7 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
                     return
                     
                 # 更新抽奖状态
-                result = await db.lotteries.update_one(
+                result = await get_collection(db, 'lotteries').update_one(
                     {'id': lottery_id},
                     {'$set': {
                         'status': 'cancelled',
@@ -72,6 +86,8 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
                     
                 # 更新消息
                 if result.modified_count > 0:
+                    draw_scheduler.unschedule(lottery_id)
+                    group_index.remove(lottery_id)
                     await query.message.edit_text("✅ 抽奖创建已取消")
                     logger.info(f"抽奖 {lottery_id} 已被用户取消")
                 else:
@@ -84,38 +100,7 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
         elif callback_data == 'view_lotteries':
             # 处理查看抽奖列表
             try:
-                pipeline = [
-                    {
-                        '$match': {'status': 'active'}
-                    },
-                    {
-                        '$lookup': {
-                            'from': 'lottery_settings',
-                            'localField': 'id',
-                            'foreignField': 'lottery_id',
-                            'as': 'settings'
-                        }
-                    },
-                    {
-                        '$unwind': '$settings'
-                    },
-                    {
-                        '$lookup': {
-                            'from': 'participants',
-                            'localField': 'id',
-                            'foreignField': 'lottery_id',
-                            'pipeline': [{'$count': 'count'}],
-                            'as': 'participant_count'
-                        }
-                    },
-                    {
-                        '$sort': {'created_at': -1}
-                    },
-                    {
-                        '$limit': 10
-                    }
-                ]
-                active_lotteries = await db.lotteries.aggregate(pipeline).to_list(None)
+                active_lotteries = await find_active_lotteries(db)
 
                 if not active_lotteries:
                     await query.message.edit_text(
@@ -128,14 +113,14 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
                 keyboard = []
 
                 for lottery in active_lotteries:
-                    current_count = lottery['participant_count'][0]['count'] if lottery['participant_count'] else 0
+                    current_count = lottery.get('participant_count', 0)
                     settings = lottery['settings']  
 
                     # 处理开奖方式显示
                     if settings['draw_method'] == 'draw_when_full':
                         draw_info = f"👥 {current_count}/{settings['participant_count']}人"
                     else:
-                        draw_info = f"⏰ {settings['draw_time']}"
+                        draw_info = f"⏰ {format_timestamp(settings['draw_time'])}"
 
                     message += (
                         f"📌 <b>{settings['title']}</b>\n"
@@ -193,64 +178,26 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
                 user_id = query.from_user.id
                 db = await MongoDBConnection.get_database()
                     
-                # 获取参与记录
-                pipeline = [
-                    {
-                        '$match': {
-                            'user_id': Int64(user_id)
-                        }
-                    },
-                    {
-                        '$lookup': {
-                            'from': 'lottery_settings',
-                            'localField': 'lottery_id',
-                            'foreignField': 'lottery_id',
-                            'pipeline': [
-                                {
-                                    '$project': {
-                                        'title': 1
-                                    }
-                                }
-                            ],
-                            'as': 'settings'
-                        }
-                    },
-                    {
-                        '$unwind': '$settings'
-                    },
-                    {
-                        '$lookup': {
-                            'from': 'lotteries',
-                            'localField': 'lottery_id',
-                            'foreignField': 'id',
-                            'pipeline': [
-                                {
-                                    '$project': {
-                                        'status': 1
-                                    }
-                                }
-                            ],
-                            'as': 'lottery'
-                        }
-                    },
-                    {
-                        '$unwind': '$lottery'
-                    },
-                    {
-                        '$project': {
-                            'title': '$settings.title',
-                            'status': '$lottery.status',
-                            'join_time': 1
-                        }
-                    },
-                    {
-                        '$sort': {'join_time': -1}
-                    },
+                # 获取参与记录，再按抽奖ID读取读模型中的标题和状态
+                participations = await db.participants.find(
+                    {'user_id': Int64(user_id)},
+                    {'lottery_id': 1, 'join_time': 1, '_id': 0}
+                ).sort('join_time', -1).limit(10).to_list(None)
+                lotteries = {
+                    lottery['id']: lottery
+                    async for lottery in db.lotteries.find(
+                        {'id': {'$in': [p['lottery_id'] for p in participations]}, 'settings': {'$exists': True}},
+                        {'id': 1, 'status': 1, 'settings.title': 1, '_id': 0}
+                    )
+                }
+                records = [
                     {
-                        '$limit': 10
+                        'title': lotteries[p['lottery_id']]['settings']['title'],
+                        'status': lotteries[p['lottery_id']]['status'],
+                        'join_time': p['join_time']
                     }
+                    for p in participations if p['lottery_id'] in lotteries
                 ]
-                records = await db.participants.aggregate(pipeline).to_list(None)
 
                 if not records:
                     await query.message.edit_text(
@@ -274,7 +221,7 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
                     message += (
                         f"📌 <b>{record['title']}</b>\n"
                         f"{status_emoji} 状态：{record['status']}\n"
-                        f"⏰ 参与时间：{record['join_time'].strftime('%Y-%m-%d %H:%M:%S')}\n"
+                        f"⏰ 参与时间：{format_timestamp(record['join_time'])}\n"
 
                     )
 
@@ -298,142 +245,23 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
             try:
                 lottery_id = callback_data.split('_')[1]
                 user = query.from_user
-
-                # 获取抽奖信息
-                db = await MongoDBConnection.get_database()
-                lottery = await db.lottery_settings.find_one(
-                    {'lottery_id': lottery_id},
-                    {
-                        'title': 1,
-                        'require_username': 1,
-                        'required_groups': 1,
-                        'keyword_group_id': 1,
-                        'keyword': 1,
-                        'message_group_id': 1,
-                        'message_count': 1,
-                        'message_check_time': 1,
-                        'participant_count': 1
-                    }
-                )
-
-                if not lottery:
-                    await query.message.edit_text("❌ 抽奖活动不存在")
-                    return
-                # 检查抽奖状态
-                lottery_status = await db.lotteries.find_one(
-                    {'id': lottery_id},
-                    {'status': 1}
-                )
-                if not lottery_status or lottery_status['status'] != 'active':
-                    await query.message.edit_text("❌ 该抽奖活动已结束或暂停")
+                result = await participation_service.join(lottery_id, user, SOURCE_BUTTON)
+                if not result.joined:
+                    text, reply_markup = await participation_service.failure_reply(result)
+                    await query.message.reply_text(text, reply_markup=reply_markup)
                     return
 
-                # 检查是否已参与
-                participant = await db.participants.find_one({
-                    'lottery_id': lottery_id,
-                    'user_id': Int64(user.id)
-                })
-                if participant:
-                    await query.message.edit_text("❌ 你已经参与过这个抽奖了")
-                    return
-
-                # 检查人数限制
-                current_count = await db.participants.count_documents({
-                    'lottery_id': lottery_id
-                })
-                if current_count >= lottery['participant_count']:
-                    await query.message.edit_text("❌ 抽奖参与人数已满")
-                    return
-
-                # 检查用户名要求
-                if lottery['require_username'] and not user.username:
-                    await query.message.reply_text("❌ 参与此抽奖需要设置用户名")
-                    return
-
-                # 检查群组要求
-                if lottery['required_groups']:
-                    for group_id in lottery['required_groups']:
-                        try:
-                            member = await context.bot.get_chat_member(group_id, user.id)
-                            if member.status in ['left', 'kicked', 'restricted']:
-                                chat = await context.bot.get_chat(group_id)
-                                keyboard = [[InlineKeyboardButton(
-                                    "👉 加入群组",
-                                    url=f"https://t.me/{chat.username}"
-                                )]]
-                                await query.message.reply_text(
-                                    f"❌ 需要先加入群组 {chat.title}",
-                                    reply_markup=InlineKeyboardMarkup(keyboard)
-                                )
-                                return
-                        except Exception as e:
-                            logger.error(f"检查群组成员状态时出错: {e}")
-                            continue
-                # 检查关键词要求
-                if lottery.get('keyword_group_id') and lottery.get('keyword'):
-                    if not await check_keyword_message(
-                        context.bot, 
-                        user.id, 
-                        lottery['keyword_group_id'], 
-                        lottery['keyword']
-                    ):
-                        chat = await context.bot.get_chat(lottery['keyword_group_id'])
-                        await query.message.reply_text(
-                            f"❌ 请先在群组 {chat.title} 中发送关键词：{lottery['keyword']}"
-                        )
-                        return
-                        
-                # 检查发言要求
-                if (lottery.get('message_group_id') and lottery.get('message_count') and lottery.get('message_check_time')):
-                    if not await check_user_messages(
-                        context.bot,
-                        user.id,
-                        lottery['message_group_id'],
-                        lottery['message_count'],
-                        lottery['message_check_time'],
-                        lottery_id,
-                        update
-                    ):
-                        chat = await context.bot.get_chat(lottery['message_group_id'])
-                        await query.message.reply_text(
-                            f"❌ 需要在群组 {chat.title} 中最近 {lottery['message_check_time']} 小时内发言 {lottery['message_count']} 条\n"
-                            "💡 提示：只统计文本消息"
-                        )
-                        return
-                # 添加参与记录
-                now = datetime.now(timezone.utc)
-                try:
-                    await db.participants.insert_one({
-                        'lottery_id': lottery_id,
-                        'user_id': Int64(user.id),
-                        'nickname': user.first_name,
-                        'username': user.username,
-                        'status': 'active',
-                        'join_time': now
-                    })
-                    chat_type = query.message.chat.type
-                    success_message = f"🎉 恭喜 {user.first_name} 成功参与抽奖《{lottery['title']}》！"
-                    if chat_type in ['group', 'supergroup']:
-                        # 添加聊天消息确认
-                        await context.bot.send_message(
-                            chat_id=query.message.chat_id,
-                            text=success_message
-                        )
-                    else:
-                        try:
-                            await context.bot.send_message(
-                                chat_id=query.message.chat_id,
-                                text=success_message
-                            )
-
-                            # 刷新抽奖列表
-                            await refresh_lottery_list(update, context)
-                        except Exception as e:
-                            logger.error(f"处理消息更新时出错: {e}", exc_info=True)
-                except Exception as e:
-                    logger.error(f"保存参与记录时出错: {e}", exc_info=True)
-                    await query.message.reply_text("❌ 参与失败，请稍后重试")
-                    return
+                success_message = f"🎉 恭喜 {user.first_name} 成功参与抽奖《{result.settings['title']}》！"
+                message_dispatcher.post_message(
+                    chat_id=query.message.chat_id,
+                    text=success_message
+                )
+                if query.message.chat.type not in ['group', 'supergroup']:
+                    try:
+                        # 刷新抽奖列表
+                        await refresh_lottery_list(update, context)
+                    except Exception as e:
+                        logger.error(f"处理消息更新时出错: {e}", exc_info=True)
             except Exception as e:
                 logger.error(f"处理参与抽奖时出错: {e}", exc_info=True)
                 await query.message.reply_text("❌ 参与失败，请稍后重试")
@@ -445,38 +273,16 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
                     await query.message.reply_text("❌ 回调数据格式错误")
                     return
                 _, lottery_id, group_id = parts
-                # 从数据库获取抽奖信息
+                # 获取抽奖信息
                 logger.info(lottery_id)
-                db = await MongoDBConnection.get_database()
-                lottery = await db.lottery_settings.find_one(
-                    {'lottery_id': lottery_id},
-                    {
-                        'title': 1,
-                        'description': 1,
-                        'media_type': 1,
-                        'media_url': 1,
-                        'draw_method': 1,
-                        'participant_count': 1,
-                        'draw_time': 1,
-                        'required_groups': 1,
-                        'keyword_group_id': 1,
-                        'keyword': 1,
-                        'message_group_id': 1,
-                        'message_count': 1,
-                        'message_check_time': 1,
-                        'require_username': 1
-                    }
-                )
+                lottery = await lottery_cache.get_settings(lottery_id)
 
                 if not lottery:
                     await query.message.reply_text("❌ 找不到抽奖信息")
                     return
                 
                 # 获取奖品信息
-                prizes = await db.prizes.find(
-                    {'lottery_id': lottery_id},
-                    {'name': 1, 'total_count': 1}
-                ).to_list(None)
+                prizes = await lottery_cache.get_prizes(lottery_id)
                 # 构建抽奖消息
                 prize_text = "\n".join([f"🎁 {p['name']} x {p['total_count']}" for p in prizes])
                 requirements = []
@@ -484,8 +290,8 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
                     requirements.append("❗️ 需要设置用户名")
                 if lottery.get('keyword') and lottery.get('keyword_group_id'):
                     try:
-                        chat = await context.bot.get_chat(lottery['keyword_group_id'])
-                        chat_link = f"<a href='https://t.me/{chat.username}'>{chat.title}</a>" if chat.username else chat.title
+                        chat = await chat_cache.get(lottery['keyword_group_id'])
+                        chat_link = chat.link_html
                         requirements.append(f"❗️ 在群组{chat_link}中发送关键词：{lottery['keyword']}")
                     except Exception as e:
                         logger.error(f"获取关键词群组{lottery['keyword_group_id']}信息失败: {e}")
@@ -493,15 +299,15 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
                 if lottery.get('required_groups'):
                     for gid in lottery['required_groups']:
                         try:
-                            chat = await context.bot.get_chat(gid)
-                            chat_link = f"<a href='https://t.me/{chat.username}'>{chat.title}</a>" if chat.username else chat.title
+                            chat = await chat_cache.get(gid)
+                            chat_link = chat.link_html
                             requirements.append(f"❗️ 需要加入：{chat_link}")
                         except Exception as e:
                             logger.error(f"获取群组 {gid} 信息失败: {e}")
                 if lottery.get('message_group_id'):
                     try:
-                        chat = await context.bot.get_chat(lottery['message_group_id'])
-                        chat_link = f"<a href='https://t.me/{chat.username}'>{chat.title}</a>" if chat.username else chat.title
+                        chat = await chat_cache.get(lottery['message_group_id'])
+                        chat_link = chat.link_html
                         requirements.append(f"❗️ {lottery['message_check_time']}小时内在群组{chat_link}中发送消息：{lottery['message_count']}条")
                     except Exception as e:
                         logger.error(f"获取消息群组 {lottery['message_group_id']} 信息失败: {e}")
@@ -510,7 +316,7 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
                 if lottery['draw_method'] == 'draw_when_full':
                     draw_info = f"👥 满{lottery['participant_count']}人自动开奖"
                 else:
-                    draw_time = lottery['draw_time'].strftime('%Y-%m-%d %H:%M:%S')
+                    draw_time = format_timestamp(lottery['draw_time'])
                     draw_info = f"⏰ {draw_time} 准时开奖"
                 message = (
                     f"养生品茶🍵： https://t.me/yangshyyds\n\n"
@@ -534,7 +340,7 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
                     media_message = None
                 # 创建参与按钮
                 try:
-                    chat = await context.bot.get_chat(group_id)
+                    chat = await chat_cache.get(group_id)
                 except Exception as e:
                     logger.error(f"获取群组/频道信息失败: {e}")
                     await query.message.reply_text("❌ 获取群组信息失败，请重试")
@@ -581,7 +387,7 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
                             )
                 else:
                     # 发送纯文本消息
-                    sent_message = await context.bot.send_message(
+                    sent_message = await message_dispatcher.send_message(
                         chat_id=group_id,
                         text=message,
                         reply_markup=reply_markup,
@@ -590,7 +396,7 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
                     )    
                 if sent_message:
                     # 发布成功提示    
-                    await context.bot.send_message(chat_id=query.message.chat_id, text="✅ 发布成功！")
+                    message_dispatcher.post_message(chat_id=query.message.chat_id, text="✅ 发布成功！")
                     if group_id != "-1001526013692" and group_id != "-1001638087196":
                         if media_message:
                             # 发送带媒体的消息
@@ -620,7 +426,7 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
                                     )
                             else:
                                 # 发送纯文本消息
-                                await context.bot.send_message(
+                                message_dispatcher.post_message(
                                     chat_id="-1001526013692",
                                     text=message,
                                     reply_markup=reply_markup,
@@ -628,10 +434,10 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
                                     disable_web_page_preview=False
                                 )  
                 else:
-                    await context.bot.send_message(chat_id=query.message.chat_id, text="❌ 发布失败，请重试")
+                    message_dispatcher.post_message(chat_id=query.message.chat_id, text="❌ 发布失败，请重试")
             except Exception as e:
                 logger.error(f"发布抽奖时出错: {e}", exc_info=True)
-                await context.bot.send_message(chat_id=query.message.chat_id, text="❌ 发布失败，请稍后重试")
+                message_dispatcher.post_message(chat_id=query.message.chat_id, text="❌ 发布失败，请稍后重试")
 
     except Exception as e:
         logger.error(f"处理回调查询时出错: {e}", exc_info=True)
@@ -642,38 +448,7 @@ async def refresh_lottery_list(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     try:
         db = await MongoDBConnection.get_database()
-        pipeline = [
-            {
-                '$match': {'status': 'active'}
-            },
-            {
-                '$lookup': {
-                    'from': 'lottery_settings',
-                    'localField': 'id',
-                    'foreignField': 'lottery_id',
-                    'as': 'settings'
-                }
-            },
-            {
-                '$unwind': '$settings'
-            },
-            {
-                '$lookup': {
-                    'from': 'participants',
-                    'localField': 'id',
-                    'foreignField': 'lottery_id',
-                    'pipeline': [{'$count': 'count'}],
-                    'as': 'participant_count'
-                }
-            },
-            {
-                '$sort': {'created_at': -1}
-            },
-            {
-                '$limit': 10
-            }
-        ]
-        active_lotteries = await db.lotteries.aggregate(pipeline).to_list(None)
+        active_lotteries = await find_active_lotteries(db)
 
         message = "🎲 <b>当前进行中的抽奖活动</b>\n\n"
         keyboard = []
@@ -682,14 +457,14 @@ async def refresh_lottery_list(update: Update, context: ContextTypes.DEFAULT_TYP
             message += "😔 目前没有正在进行的抽奖活动\n"
         else:
             for lottery in active_lotteries:
-                current_count = lottery['participant_count'][0]['count'] if lottery['participant_count'] else 0
+                current_count = lottery.get('participant_count', 0)
                 settings = lottery['settings']
                     
                 # 处理开奖方式显示
                 if settings['draw_method'] == 'draw_when_full':
                     draw_info = f"👥 {current_count}/{settings['participant_count']}人"
                 else:
-                    draw_time = settings['draw_time'].strftime('%Y-%m-%d %H:%M:%S')
+                    draw_time = format_timestamp(settings['draw_time'])
                     draw_info = f"⏰ {draw_time}"
 
                 message += (
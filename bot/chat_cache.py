@@ -0,0 +1,197 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional, Set, Union
+from bson import Int64
+from app.cache import MISSING, AsyncTTLCache
+from app.database import MongoDBConnection, get_collection
+from app.index_plan import CHATS_USERNAME_COLLATION
+from bot.bot_instance import get_bot
+from config import CHAT_CACHE_SIZE, CHAT_CACHE_TTL, CHAT_STORE_TTL
+from utils import logger
+
+
+@dataclass(frozen=True)
+class ChatInfo:
+    """群组/频道/用户的基本信息"""
+    id: int
+    type: str
+    title: Optional[str] = None
+    username: Optional[str] = None
+    invite_link: Optional[str] = None
+
+    @classmethod
+    def from_chat(cls, chat) -> 'ChatInfo':
+        return cls(
+            id=chat.id,
+            type=chat.type,
+            # 私聊没有标题，使用用户名字
+            title=chat.title or getattr(chat, 'full_name', None),
+            username=chat.username,
+            invite_link=getattr(chat, 'invite_link', None)
+        )
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> 'ChatInfo':
+        return cls(
+            id=doc['id'],
+            type=doc['type'],
+            title=doc.get('title'),
+            username=doc.get('username'),
+            invite_link=doc.get('invite_link')
+        )
+
+    @property
+    def link_html(self) -> str:
+        """带链接的名称（HTML），没有用户名时只显示名称"""
+        if self.username:
+            return f"<a href='https://t.me/{self.username}'>{self.title}</a>"
+        return self.title or str(self.id)
+
+
+def _cache_key(chat_id: Union[int, str]) -> str:
+    """数字 ID 和 @用户名 统一为字符串键，用户名不区分大小写"""
+    key = str(chat_id).strip()
+    if key.lstrip('-').isdigit():
+        return str(int(key))
+    return '@' + key.lstrip('@').lower()
+
+
+class ChatInfoCache:
+    """bot.get_chat 结果的两级缓存
+
+    - 内存：按 ID 和 @用户名 两个键缓存同一份信息，过期时间 CHAT_CACHE_TTL，容量 CHAT_CACHE_SIZE，
+      并发未命中只加载一次
+    - chats 集合：机器人见过的聊天都会写入，重启后内存为空时优先读取；
+      超过 CHAT_STORE_TTL 未更新时重新请求 Bot API，请求失败则继续使用旧记录
+    机器人在群组中的状态变化（my_chat_member）时使缓存失效，下次读取时跳过 chats 记录直接请求 Bot API。
+    """
+
+    def __init__(
+        self,
+        bot_getter: Callable = get_bot,
+        maxsize: int = CHAT_CACHE_SIZE,
+        ttl: float = CHAT_CACHE_TTL,
+        store_ttl: float = CHAT_STORE_TTL
+    ):
+        self._bot_getter = bot_getter
+        self._cache = AsyncTTLCache(maxsize, ttl, name='chat_info')
+        self._store_ttl = timedelta(seconds=store_ttl)
+        # 最近已写入 chats 的聊天，避免每条消息都写库
+        self._observed = AsyncTTLCache(maxsize, ttl, name='chat_observed')
+        self._pending_writes: Set[asyncio.Task] = set()
+        # 已失效的缓存键：下次加载时不使用 chats 记录，直接请求 Bot API
+        self._force_refresh: Set[str] = set()
+
+    async def get(self, chat_id: Union[int, str]) -> ChatInfo:
+        """获取聊天信息，Bot API 请求失败且没有存储记录时抛出异常"""
+        key = _cache_key(chat_id)
+        return await self._cache.get_or_load(key, lambda: self._load(chat_id))
+
+    async def _load(self, chat_id: Union[int, str]) -> ChatInfo:
+        key = _cache_key(chat_id)
+        doc = None
+        try:
+            doc = await self._find_stored(key)
+        except Exception as e:
+            logger.error(f"读取聊天记录 {chat_id} 时出错: {e}", exc_info=True)
+
+        if key not in self._force_refresh and doc and doc['updated_at'] > datetime.now(timezone.utc) - self._store_ttl:
+            info = ChatInfo.from_doc(doc)
+            self.put(info)
+            return info
+
+        try:
+            bot = self._bot_getter()
+            if not bot:
+                raise RuntimeError("机器人实例未初始化")
+            info = ChatInfo.from_chat(await bot.get_chat(chat_id))
+        except Exception as e:
+            if not doc:
+                raise
+            logger.warning(f"获取聊天 {chat_id} 信息失败，使用存储的记录: {e}")
+            info = ChatInfo.from_doc(doc)
+        else:
+            await self._store(info, with_invite_link=True)
+            self._force_refresh.discard(key)
+            self._force_refresh.discard(_cache_key(info.id))
+            if info.username:
+                self._force_refresh.discard(_cache_key(info.username))
+        self.put(info)
+        return info
+
+    async def _find_stored(self, key: str) -> Optional[dict]:
+        db = await MongoDBConnection.get_database()
+        if key.startswith('@'):
+            return await db.chats.find_one(
+                {'username': key[1:]},
+                {'_id': 0},
+                collation=CHATS_USERNAME_COLLATION
+            )
+        return await db.chats.find_one({'id': Int64(int(key))}, {'_id': 0})
+
+    async def _store(self, info: ChatInfo, with_invite_link: bool = False) -> None:
+        """写入 chats 集合（来自消息的聊天对象不含邀请链接，不覆盖已有链接）"""
+        fields = {
+            'title': info.title,
+            'username': info.username,
+            'type': info.type,
+            'updated_at': datetime.now(timezone.utc)
+        }
+        if with_invite_link:
+            fields['invite_link'] = info.invite_link
+        try:
+            db = await MongoDBConnection.get_database()
+            await get_collection(db, 'chats').update_one({'id': Int64(info.id)}, {'$set': fields}, upsert=True)
+            self._observed.set(info.id, True)
+        except Exception as e:
+            logger.error(f"保存聊天记录 {info.id} 时出错: {e}", exc_info=True)
+
+    def observe(self, chat) -> None:
+        """登记机器人见到的聊天（群组消息、成员变更等），异步写入 chats 集合"""
+        if chat is None or self._observed.get(chat.id) is not MISSING:
+            return
+        self._observed.set(chat.id, True)
+        task = asyncio.create_task(self._store(ChatInfo.from_chat(chat)))
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+
+    async def resolve_username(self, username: str) -> Optional[int]:
+        """按 @用户名 查找聊天 ID，只查缓存和 chats 集合，不请求 Bot API"""
+        key = _cache_key(username)
+        info = self._cache.get(key)
+        if info is not MISSING:
+            return info.id
+        try:
+            doc = await self._find_stored(key)
+        except Exception as e:
+            logger.error(f"查找用户名 {username} 时出错: {e}", exc_info=True)
+            return None
+        return doc['id'] if doc else None
+
+    def put(self, info: ChatInfo) -> None:
+        """写入内存缓存（同时登记 ID 和用户名两个键）"""
+        self._cache.set(_cache_key(info.id), info)
+        if info.username:
+            self._cache.set(_cache_key(info.username), info)
+
+    def invalidate(self, chat_id: Union[int, str]) -> None:
+        """使聊天信息失效，下次读取时重新请求 Bot API（不使用 chats 中的记录）"""
+        key = _cache_key(chat_id)
+        keys = {key}
+        info = self._cache.get(key)
+        if isinstance(info, ChatInfo):
+            keys.add(_cache_key(info.id))
+            if info.username:
+                keys.add(_cache_key(info.username))
+        for stale_key in keys:
+            self._cache.invalidate(stale_key)
+            self._force_refresh.add(stale_key)
+            # 允许 observe() 再次写入 chats
+            if not stale_key.startswith('@'):
+                self._observed.invalidate(int(stale_key))
+        logger.debug(f"聊天信息缓存已失效: {chat_id}")
+
+
+# 全局聊天信息缓存实例
+chat_cache = ChatInfoCache()
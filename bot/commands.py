@@ -1,14 +1,14 @@
 from datetime import datetime, timezone
-from app.database import MongoDBConnection
+from app.database import MongoDBConnection, repair_participant_counts
 from bot.callbacks import verify_follow
-from utils import logger
+from utils import format_timestamp, logger
 from bson import Int64
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler, MessageHandler, filters
+from telegram.ext import ContextTypes, ChatMemberHandler, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 from config import YOUR_DOMAIN
 from bot.verification import check_channel_subscription, check_lottery_creation
-from bot.callbacks import handle_callback_query
-from bot.handlers import handle_keyword_participate, handle_media_message, handle_message_count_participate
+from bot.participation import SOURCE_BUTTON, participation_service
+from bot.handlers import handle_chat_member, handle_group_message, handle_media_message, handle_my_chat_member
 
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -21,48 +21,13 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # 提取抽奖 ID
             lottery_id = args[1].replace('join_', '')
             
-            # 创建模拟的 callback_query 对象
-            class FakeCallbackQuery:
-                def __init__(self, data, message, user):
-                    self.data = data
-                    self.message = message
-                    self.from_user = user
-                    self.id = "fake_query_" + str(message.message_id)
-                    
-                async def answer(self, text=None, show_alert=False):
-                    if text:
-                        await self.message.reply_text(text)
-                    
-                async def edit_message_text(self, text, reply_markup=None, parse_mode=None):
-                    try:
-                        return await self.message.edit_text(
-                            text,
-                            reply_markup=reply_markup,
-                            parse_mode=parse_mode
-                        )
-                    except Exception as e:
-                        return await self.message.reply_text(
-                            text,
-                            reply_markup=reply_markup,
-                            parse_mode=parse_mode
-                        )
-                    
-            # 创建模拟的 Update 对象
-            class FakeUpdate:
-                def __init__(self, callback_query):
-                    self.callback_query = callback_query
-                    self.effective_user = callback_query.from_user
-                    
-            # 创建模拟对象
-            fake_query = FakeCallbackQuery(
-                data=f'join_{lottery_id}',
-                message=message,
-                user=message.from_user
-            )
-            fake_update = FakeUpdate(fake_query)
-            
-            # 使用模拟的 Update 对象调用回调处理
-            await handle_callback_query(fake_update, context)
+            user = message.from_user
+            result = await participation_service.join(lottery_id, user, SOURCE_BUTTON)
+            if result.joined:
+                await message.reply_text(f"🎉 恭喜 {user.first_name} 成功参与抽奖《{result.settings['title']}》！")
+            else:
+                text, reply_markup = await participation_service.failure_reply(result)
+                await message.reply_text(text, reply_markup=reply_markup)
             return
         
         # 默认欢迎消息
@@ -99,6 +64,7 @@ async def create_lottery(user, context, chat_id):
             'creator_id': Int64(user.id),
             'creator_name': user.first_name,
             'status': 'draft',
+            'participant_count': 0,
             'created_at': now,
             'updated_at': now
         }
@@ -165,7 +131,6 @@ async def new_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         # 用户已关注频道，继续创建抽奖
-        from bot.callbacks import verify_follow
         await create_lottery(user, context, update.message.chat_id)
         
     except Exception as e:
@@ -180,46 +145,11 @@ async def mylottery_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
         # 从数据库获取用户创建的抽奖列表
         db = await MongoDBConnection.get_database() 
-        pipeline = [
-            {
-                '$match': {
-                    'creator_id': Int64(user.id)
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'lottery_settings',
-                    'localField': 'id',
-                    'foreignField': 'lottery_id',
-                    'pipeline': [
-                        {
-                            '$project': {
-                                'title': 1
-                            }
-                        }
-                    ],
-                    'as': 'settings'
-                }
-            },
-            {
-                '$unwind': '$settings'
-            },
-            {
-                '$project': {
-                    'id': 1,
-                    'title': '$settings.title',
-                    'status': 1,
-                    'created_at': 1
-                }
-            },
-            {
-                '$sort': {'created_at': -1}
-            },
-            {
-                '$limit': 5
-            }
-        ]
-        lotteries = await db.lotteries.aggregate(pipeline).to_list(length=None)
+        # 读模型：标题在 settings 中，草稿没有 settings，不列出
+        lotteries = await db.lotteries.find(
+            {'creator_id': Int64(user.id), 'settings': {'$exists': True}},
+            {'id': 1, 'settings.title': 1, 'status': 1, 'created_at': 1, '_id': 0}
+        ).sort('created_at', -1).limit(5).to_list(None)
 
         if not lotteries:
             await update.message.reply_text("你还没有创建过抽奖活动。")
@@ -228,8 +158,8 @@ async def mylottery_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # 构建抽奖列表消息
         message = "📋 你最近创建的抽奖活动：\n\n"
         for lottery in lotteries:
-            created_at = lottery['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-            message += f"🎲 {lottery['title']}\n"
+            created_at = format_timestamp(lottery['created_at'])
+            message += f"🎲 {lottery['settings']['title']}\n"
             message += f"状态: {lottery['status']}\n"
             message += f"创建时间: {created_at}\n"
             message += f"管理链接: {YOUR_DOMAIN}/?lottery_id={lottery['id']}&user_id={user.id}\n\n"
@@ -242,6 +172,25 @@ async def mylottery_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"处理 /mylottery 命令时出错: {e}", exc_info=True)
         await update.message.reply_text("获取抽奖列表时发生错误，请稍后重试。")
 
+async def recount_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /recount 命令 - 根据参与记录重新统计我创建的抽奖的参与人数"""
+    try:
+        user = update.effective_user
+        db = await MongoDBConnection.get_database()
+        lottery_ids = await db.lotteries.distinct('id', {'creator_id': Int64(user.id)})
+        if not lottery_ids:
+            await update.message.reply_text("你还没有创建过抽奖活动。")
+            return
+
+        fixed = await repair_participant_counts(lottery_ids)
+        await update.message.reply_text(
+            f"✅ 参与人数统计完成\n\n"
+            f"共检查 {len(lottery_ids)} 个抽奖，修正 {fixed} 个"
+        )
+    except Exception as e:
+        logger.error(f"处理 /recount 命令时出错: {e}", exc_info=True)
+        await update.message.reply_text("重新统计参与人数时发生错误，请稍后重试。")
+
 async def get_media_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """处理 /media_id 命令 - 获取媒体文件的 ID"""
     try:
@@ -320,15 +269,16 @@ async def get_media_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def register_commands(app):
     """注册所有命令处理器"""
-    keyword_filter = (filters.TEXT & ~filters.COMMAND & filters.ChatType.GROUPS)
-    message_count_filter = (filters.TEXT & ~filters.COMMAND & filters.ChatType.GROUPS)
+    group_message_filter = (filters.TEXT & ~filters.COMMAND & ~filters.FORWARDED & filters.ChatType.GROUPS)
     app.add_handler(CommandHandler("start", start_command))
     app.add_handler(CommandHandler("new", new_command))
     app.add_handler(CommandHandler("mylottery", mylottery_command))
     app.add_handler(CommandHandler("media_id", get_media_id))
+    app.add_handler(CommandHandler("recount", recount_command))
     app.add_handler(CallbackQueryHandler(verify_follow, pattern='^verify_follow$'))
-    app.add_handler(MessageHandler(keyword_filter, handle_keyword_participate), group=1)
-    app.add_handler(MessageHandler(message_count_filter, handle_message_count_participate), group=2)
+    app.add_handler(MessageHandler(group_message_filter, handle_group_message), group=1)
+    app.add_handler(ChatMemberHandler(handle_my_chat_member, ChatMemberHandler.MY_CHAT_MEMBER))
+    app.add_handler(ChatMemberHandler(handle_chat_member, ChatMemberHandler.CHAT_MEMBER))
     media_filter = (
         (filters.PHOTO | filters.VIDEO | filters.Document.ALL | filters.AUDIO | filters.Sticker.ALL) & 
         filters.ChatType.PRIVATE
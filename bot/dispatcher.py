@@ -0,0 +1,305 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+from config import (
+    DISPATCH_GLOBAL_RATE,
+    DISPATCH_GROUP_CHAT_RATE,
+    DISPATCH_MAX_RETRIES,
+    DISPATCH_PRIVATE_CHAT_RATE,
+    DISPATCH_WORKERS
+)
+from utils import logger
+from bot.bot_instance import get_bot
+
+
+class TokenBucket:
+    """令牌桶限速器（预占式，仅在事件循环线程中使用）"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """预占一个令牌，返回需要等待的秒数"""
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def penalize(self, seconds: float) -> None:
+        """在指定时间内不再发放令牌（用于 429 RetryAfter）"""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def is_idle(self) -> bool:
+        """令牌已回满，可以丢弃"""
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.capacity
+
+
+@dataclass
+class _Job:
+    method: str
+    chat_id: Any
+    kwargs: Dict[str, Any]
+    future: asyncio.Future
+    attempts: int = 0
+    chat_reserved: bool = False
+
+
+@dataclass
+class DispatcherStats:
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    rate_limited: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+
+class MessageDispatcher:
+    """出站消息调度器
+
+    所有发送请求进入同一个队列，由固定数量的发送协程消费：
+    - 全局令牌桶控制总发送速率
+    - 每个会话独立的令牌桶控制单会话速率，未到时间的请求延迟重新入队，不占用发送协程
+    - 遇到 429 时读取 retry_after 暂停对应令牌桶并重试，网络错误按指数退避重试
+    """
+
+    # 会话令牌桶数量超过该值时清理空闲的桶
+    MAX_CHAT_BUCKETS = 10000
+
+    def __init__(
+        self,
+        bot_getter: Callable = get_bot,
+        global_rate: float = DISPATCH_GLOBAL_RATE,
+        private_chat_rate: float = DISPATCH_PRIVATE_CHAT_RATE,
+        group_chat_rate: float = DISPATCH_GROUP_CHAT_RATE,
+        workers: int = DISPATCH_WORKERS,
+        max_retries: int = DISPATCH_MAX_RETRIES
+    ):
+        self._bot_getter = bot_getter
+        self._global = TokenBucket(global_rate, capacity=1)
+        self._private_chat_rate = private_chat_rate
+        self._group_chat_rate = group_chat_rate
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+        self._worker_count = workers
+        self._max_retries = max_retries
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # 等待延迟重新入队的任务（会话限速、重试），不计入队列的未完成数
+        self._delayed: Dict[int, Tuple[asyncio.TimerHandle, _Job]] = {}
+        # stop() 之后不再接受新消息，直到再次调用 start()
+        self._closed = False
+        self.stats = DispatcherStats()
+
+    @property
+    def running(self) -> bool:
+        return any(not worker.done() for worker in self._workers)
+
+    async def start(self) -> None:
+        """启动发送协程"""
+        self._closed = False
+        self._ensure_started()
+
+    def _ensure_started(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"dispatcher_{i}")
+            for i in range(self._worker_count)
+        ]
+        self.stats = DispatcherStats()
+        logger.info(f"消息调度器已启动，发送协程数: {self._worker_count}")
+
+    async def stop(self, timeout: float = 10) -> None:
+        """等待队列中和延迟重新入队的消息发送完毕后停止，超时未发送的消息以异常结束"""
+        self._closed = True
+        if not self._workers:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                await asyncio.wait_for(self._queue.join(), max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                break
+            if not self._delayed:
+                break
+            # 等到最早的延迟任务重新入队
+            wake_at = min(handle.when() for handle, _ in self._delayed.values())
+            if wake_at > deadline:
+                break
+            await asyncio.sleep(max(wake_at - loop.time(), 0))
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        unsent = self._abandon_pending()
+        if unsent:
+            logger.warning(f"消息调度器停止时仍有 {unsent} 条消息未发送")
+        logger.info("消息调度器已停止")
+
+    def _abandon_pending(self) -> int:
+        """取消延迟任务并清空队列，未完成的 future 以异常结束，返回被放弃的消息数"""
+        jobs = []
+        for handle, job in self._delayed.values():
+            handle.cancel()
+            jobs.append(job)
+        self._delayed.clear()
+        while not self._queue.empty():
+            jobs.append(self._queue.get_nowait())
+            self._queue.task_done()
+
+        error = RuntimeError("消息调度器已停止，消息未发送")
+        unsent = 0
+        for job in jobs:
+            if not job.future.done():
+                job.future.set_exception(error)
+                unsent += 1
+        return unsent
+
+    def submit(self, method: str, chat_id, **kwargs) -> asyncio.Future:
+        """将 Bot API 调用加入队列，返回在发送完成（或最终失败）时结束的 future"""
+        if self._closed:
+            raise RuntimeError("消息调度器已停止，不再接受新消息")
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Job(method, chat_id, kwargs, future))
+        return future
+
+    async def call(self, method: str, chat_id, **kwargs):
+        """通过调度器调用 Bot API 方法，返回 API 调用结果"""
+        return await self.submit(method, chat_id, **kwargs)
+
+    async def send_message(self, chat_id, text: str, **kwargs):
+        """限速发送文本消息"""
+        return await self.call('send_message', chat_id, text=text, **kwargs)
+
+    def post_message(self, chat_id, text: str, **kwargs) -> asyncio.Future:
+        """限速发送文本消息，不等待发送完成（失败只记录日志）
+
+        用于处理更新时的通知类消息：单会话限速下排队可能要数秒，
+        等待发送会阻塞整个机器人的更新处理。
+        """
+        future = self.submit('send_message', chat_id, text=text, **kwargs)
+        future.add_done_callback(_log_post_failure)
+        return future
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        key = str(chat_id)
+        bucket = self._chat_buckets.get(key)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.MAX_CHAT_BUCKETS:
+                self._chat_buckets = {
+                    k: b for k, b in self._chat_buckets.items() if not b.is_idle()
+                }
+            # 群组/频道 ID 为负数，用户 ID 为正数
+            rate = self._group_chat_rate if key.startswith('-') or key.startswith('@') else self._private_chat_rate
+            bucket = TokenBucket(rate, capacity=1)
+            self._chat_buckets[key] = bucket
+        return bucket
+
+    def _requeue(self, job: _Job, delay: float) -> None:
+        handle = asyncio.get_running_loop().call_later(delay, self._release_delayed, job)
+        self._delayed[id(job)] = (handle, job)
+
+    def _release_delayed(self, job: _Job) -> None:
+        self._delayed.pop(id(job), None)
+        self._queue.put_nowait(job)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                logger.error(f"消息调度器处理任务时出错: {e}", exc_info=True)
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job: _Job) -> None:
+        if job.future.cancelled():
+            return
+
+        # 会话限速：未到时间则延迟重新入队，释放发送协程
+        if not job.chat_reserved:
+            delay = self._chat_bucket(job.chat_id).reserve()
+            job.chat_reserved = True
+            if delay > 0:
+                self._requeue(job, delay)
+                return
+
+        # 全局限速
+        delay = self._global.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        bot = self._bot_getter()
+        if not bot:
+            raise RuntimeError("机器人实例未初始化")
+
+        try:
+            result = await getattr(bot, job.method)(chat_id=job.chat_id, **job.kwargs)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            self.stats.rate_limited += 1
+            self._global.penalize(retry_after)
+            self._chat_bucket(job.chat_id).penalize(retry_after)
+            self._retry(job, retry_after, e)
+            return
+        except (BadRequest, Forbidden) as e:
+            # 永久性错误（会话不存在、被拉黑、格式错误等）不重试；BadRequest 是 NetworkError 的子类，需先捕获
+            self.stats.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+        except (TimedOut, NetworkError) as e:
+            self._retry(job, 2 ** job.attempts, e)
+            return
+        except Exception as e:
+            self.stats.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+
+        self.stats.sent += 1
+        if not job.future.done():
+            job.future.set_result(result)
+
+    def _retry(self, job: _Job, delay: float, error: Exception) -> None:
+        job.attempts += 1
+        if job.attempts > self._max_retries:
+            self.stats.failed += 1
+            if not job.future.done():
+                job.future.set_exception(error)
+            return
+        self.stats.retried += 1
+        job.chat_reserved = False
+        logger.warning(f"发送消息到 {job.chat_id} 失败，{delay:.1f}秒后重试: {error}")
+        self._requeue(job, delay)
+
+
+def _log_post_failure(future: asyncio.Future) -> None:
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error(f"发送通知消息失败: {error}")
+
+
+# 全局消息调度器实例
+message_dispatcher = MessageDispatcher()
@@ -0,0 +1,149 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from app.database import MongoDBConnection
+from bot.keyword_matcher import AhoCorasick, normalize_keyword
+from config import KEYWORD_CONTAINS_MATCH
+from utils import logger
+
+# 群组消息参与路径需要的抽奖设置字段
+WATCH_FIELDS = (
+    'lottery_id', 'title', 'join_method', 'keyword_group_id', 'keyword',
+    'message_group_id', 'message_count', 'message_check_time',
+    'require_username', 'required_groups', 'draw_method', 'participant_count'
+)
+
+
+@dataclass
+class GroupWatch:
+    """单个群组中进行中的关键词/发言数量抽奖
+
+    keywords 以归一化后的关键词为键；开启包含匹配时按需构建 Aho-Corasick 自动机，
+    关键词变化时清空重建。
+    """
+    keywords: Dict[str, List[dict]] = field(default_factory=dict)
+    message_lotteries: List[dict] = field(default_factory=list)
+    _automaton: Optional[AhoCorasick] = field(default=None, repr=False)
+
+    def __bool__(self) -> bool:
+        return bool(self.keywords or self.message_lotteries)
+
+    def keywords_changed(self) -> None:
+        self._automaton = None
+
+    def match_keywords(self, text: str, contains: bool = KEYWORD_CONTAINS_MATCH) -> List[dict]:
+        """返回消息命中的关键词抽奖，耗时与消息长度成正比
+
+        Args:
+            text: 消息内容
+            contains: 为 True 时消息包含关键词即命中，否则要求归一化后完全一致
+        """
+        if not self.keywords:
+            return []
+        text = normalize_keyword(text)
+        if not contains:
+            return self.keywords.get(text, [])
+
+        if self._automaton is None:
+            self._automaton = AhoCorasick(self.keywords)
+        matched = []
+        for keyword in self._automaton.search(text):
+            matched.extend(self.keywords[keyword])
+        return matched
+
+
+class GroupIndex:
+    """进行中抽奖的群组索引
+
+    群组 ID → 关键词抽奖和发言数量抽奖的设置快照，常驻内存。群组消息处理时先查本索引，
+    没有进行中抽奖的群组直接返回，不访问数据库。创建、取消、开奖时增量维护，
+    并定期从数据库全量同步，以覆盖其他实例上的变更。
+    """
+
+    def __init__(self):
+        self._lotteries: Dict[str, dict] = {}
+        self._groups: Dict[str, GroupWatch] = {}
+
+    def __len__(self) -> int:
+        return len(self._lotteries)
+
+    def get(self, group_id) -> Optional[GroupWatch]:
+        """获取群组的进行中抽奖，群组没有进行中抽奖时返回 None"""
+        return self._groups.get(str(group_id))
+
+    def add(self, settings: dict) -> None:
+        """登记（或更新）一个进行中的抽奖"""
+        lottery_id = settings['lottery_id']
+        if lottery_id in self._lotteries:
+            self.remove(lottery_id)
+
+        snapshot = {key: settings.get(key) for key in WATCH_FIELDS}
+        watched = False
+        keyword = normalize_keyword(snapshot.get('keyword') or '')
+        if snapshot.get('keyword_group_id') and keyword:
+            watch = self._groups.setdefault(str(snapshot['keyword_group_id']), GroupWatch())
+            watch.keywords.setdefault(keyword, []).append(snapshot)
+            watch.keywords_changed()
+            watched = True
+        if snapshot.get('message_group_id') and (snapshot.get('message_count') or 0) > 0:
+            watch = self._groups.setdefault(str(snapshot['message_group_id']), GroupWatch())
+            watch.message_lotteries.append(snapshot)
+            watched = True
+
+        if watched:
+            self._lotteries[lottery_id] = snapshot
+
+    def remove(self, lottery_id: str) -> None:
+        """移除抽奖（取消、已开奖等情况）"""
+        snapshot = self._lotteries.pop(lottery_id, None)
+        if not snapshot:
+            return
+
+        for group_id in {snapshot.get('keyword_group_id'), snapshot.get('message_group_id')}:
+            watch = self._groups.get(str(group_id)) if group_id else None
+            if not watch:
+                continue
+            for keyword, lotteries in list(watch.keywords.items()):
+                lotteries[:] = [s for s in lotteries if s['lottery_id'] != lottery_id]
+                if not lotteries:
+                    del watch.keywords[keyword]
+                    watch.keywords_changed()
+            watch.message_lotteries[:] = [
+                s for s in watch.message_lotteries if s['lottery_id'] != lottery_id
+            ]
+            if not watch:
+                del self._groups[str(group_id)]
+
+    async def load(self) -> int:
+        """从数据库重建索引，返回登记的抽奖数量"""
+        db = await MongoDBConnection.get_database()
+        lotteries = await db.lotteries.find(
+            {
+                'status': 'active',
+                '$or': [
+                    {'settings.keyword_group_id': {'$ne': None}},
+                    {'settings.message_group_id': {'$ne': None}}
+                ]
+            },
+            dict({f'settings.{key}': 1 for key in WATCH_FIELDS}, _id=0)
+        ).to_list(None)
+
+        self._lotteries = {}
+        self._groups = {}
+        for lottery in lotteries:
+            self.add(lottery['settings'])
+        return len(self._lotteries)
+
+    async def refresh_periodically(self, interval: float) -> None:
+        """定期全量同步索引"""
+        while True:
+            try:
+                count = await self.load()
+                logger.debug(f"群组索引已同步，进行中的群组抽奖数: {count}，群组数: {len(self._groups)}")
+            except Exception as e:
+                logger.error(f"同步群组索引时出错: {e}", exc_info=True)
+            await asyncio.sleep(interval)
+
+
+# 全局群组索引实例
+group_index = GroupIndex()
@@ -1,14 +1,25 @@
 import asyncio
-from datetime import datetime, timedelta, timezone
 import aiohttp
 from bson import Int64
+from app.cache import MISSING, AsyncTTLCache
 from app.database import MongoDBConnection
-from bson.objectid import ObjectId 
-from config import YOUR_BOT
-from utils import logger
+from config import GROUP_JOINED_CACHE_SIZE, GROUP_JOINED_CACHE_TTL, YOUR_BOT
+from utils import format_timestamp, logger
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, Update
 from telegram.ext import MessageHandler, filters, ContextTypes
 from .bot_instance import get_bot
+from .dispatcher import message_dispatcher
+from .group_index import group_index
+from .message_counter import message_count_buffer
+from .participation import (
+    ALREADY_JOINED,
+    SOURCE_KEYWORD,
+    SOURCE_MESSAGE,
+    check_user_messages,
+    participation_service
+)
+from .chat_cache import chat_cache
+from .verification import membership_verifier
 
 
 async def handle_media(media_url):
@@ -71,23 +82,23 @@ async def send_lottery_info_to_creator(creator_id: str, lottery_data: dict):
             requirements.append("❗️ 参与者必须设置用户名\n")
         if keyword and keyword_group_id:
             try:
-                chat = await bot.get_chat(keyword_group_id)
-                chat_link = f"<a href='https://t.me/{chat.username}'>{chat.title}</a>" if chat.username else chat.title
+                chat = await chat_cache.get(keyword_group_id)
+                chat_link = chat.link_html
                 requirements.append(f"❗️ 在群组{chat_link}中发送关键词：{keyword}\n")
             except Exception as e:
                 logger.error(f"获取关键词群组{keyword_group_id}信息失败: {e}")
         if message_group_id:
             try:
-                chat = await bot.get_chat(message_group_id)
-                chat_link = f"<a href='https://t.me/{chat.username}'>{chat.title}</a>" if chat.username else chat.title
+                chat = await chat_cache.get(message_group_id)
+                chat_link = chat.link_html
                 requirements.append(f"❗️ {message_check_time}小时内在群组{chat_link}中发送消息：{message_count}条\n")
             except Exception as e:
                 logger.error(f"获取消息群组 {message_group_id} 信息失败: {e}")
         if required_groups:
             for gid in required_groups:
                 try:
-                    chat = await bot.get_chat(gid)
-                    chat_link = f"<a href='https://t.me/{chat.username}'>{chat.title}</a>" if chat.username else chat.title
+                    chat = await chat_cache.get(gid)
+                    chat_link = chat.link_html
                     if chat.type == 'supergroup': 
                         requirements.append(f"❗️ 需要加入群组：{chat_link}\n")
                     elif chat.type == 'channel':
@@ -102,7 +113,7 @@ async def send_lottery_info_to_creator(creator_id: str, lottery_data: dict):
         draw_time_text = (
             f"满{lottery_data['participant_count']}人自动开奖" 
             if lottery_data['draw_method'] == 'draw_when_full'
-            else lottery_data['draw_time']
+            else format_timestamp(lottery_data['draw_time'])
         )
 
         # 构建消息文本
@@ -125,7 +136,7 @@ async def send_lottery_info_to_creator(creator_id: str, lottery_data: dict):
         for group_id in set(required_groups):
             if group_id:
                 try:
-                    chat = await bot.get_chat(group_id)
+                    chat = await chat_cache.get(group_id)
                     if chat.type == 'supergroup':
                         keyboard.append([
                             InlineKeyboardButton(
@@ -181,7 +192,7 @@ async def send_lottery_info_to_creator(creator_id: str, lottery_data: dict):
                 )
         else:
             # 发送纯文本消息
-            await bot.send_message(
+            await message_dispatcher.send_message(
                 chat_id=creator_id,
                 text=message,
                 reply_markup=reply_markup,
@@ -194,342 +205,236 @@ async def send_lottery_info_to_creator(creator_id: str, lottery_data: dict):
         logger.error(f"发送抽奖信息给创建者时出错: {e}", exc_info=True)
         return False
 
-async def send_winner_notification(winner_id: int, lottery_info: dict, prize_info: dict):
-    """发送中奖通知给获奖者
+def build_winner_notification(winner: dict) -> dict:
+    """构建中奖通知消息
     
     Args:
-        winner_id: 获奖者的用户ID
-        lottery_info: 抽奖信息字典
-        prize_info: 奖品信息字典
-    """
-    try:
-        bot = get_bot()
-        if not bot:
-            logger.error("无法获取机器人实例")
-            return False
-
-        # 构建中奖通知消息
-        message = (
-            f"🎉 恭喜你中奖了！\n\n"
-            f"🎲 抽奖活动：{lottery_info['title']}\n"
-            f"🎁 获得奖品：{prize_info['name']}\n\n"
-            f"📋 领奖说明：\n"
-            f"请联系抽奖创建人领取奖品\n"
-            f"🔔 温馨提示：\n"
-            f"• 请确保你的账号可以接收私信\n"
-            f"• 领奖时请提供本中奖通知截图"
-        )
-
-        # 添加确认按钮
-        keyboard = [[
-            InlineKeyboardButton("📞 联系创建人", url=f"https://t.me/{lottery_info['creator_name']}")
-        ],
-        [
-            InlineKeyboardButton("🛒流量套餐", url="https://hy.yunhaoka.com/#/pages/micro_store/index?agent_id=b7b9c654d9c97709b967e505d8255dd7")
-        ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        # 发送通知
-        try:
-            await bot.send_message(
-                chat_id=winner_id,
-                text=message,
-                reply_markup=reply_markup,
-                parse_mode='HTML'
-            )
-            return True
-
-        except Exception as e:
-            logger.error(f"发送中奖通知给用户 {winner_id} 时出错: {e}")
-            # 如果是因为用户封禁机器人导致的错误，记录到数据库
-            if "Forbidden" in str(e):
-                logger.warning(f"用户 {winner_id} 封禁了机器人")
-            return False
+        winner: 开奖生成的中奖记录（user_id、prize_name、title、creator_name 等）
 
-    except Exception as e:
-        logger.error(f"准备中奖通知时出错: {e}", exc_info=True)
-        return False
-
-# 批量发送中奖通知
-async def send_batch_winner_notifications(winners: list, creator_id: str):
-    """批量发送某个抽奖活动的所有中奖通知"""
-    try:
-        bot = get_bot()
-        if not bot:
-            logger.error("无法获取机器人实例")
-            return False
-        creator = await bot.get_chat(creator_id)
-        creator_name = creator.username
-        db = await MongoDBConnection.get_database()
-        for _ in winners:
-            prize_id, participant_id, lottery_id = _
-            # 获取参与者信息
-            participant = await db.participants.find_one(
-                {'_id': ObjectId(participant_id)},
-                {'user_id': 1}
-            )
-            if not participant:
-                continue
-            # 获取奖品信息
-            prize = await db.prizes.find_one(
-                {'_id': ObjectId(prize_id)},
-                {'name': 1}
-            )
-            if not prize:
-                continue
-            # 获取抽奖信息
-            lottery = await db.lottery_settings.find_one(
-                {'lottery_id': lottery_id},
-                {'title': 1}
-            )
-            if not lottery:
-                continue
-            await send_winner_notification(
-                participant['user_id'],
-                {
-                    'lottery_id': lottery_id,
-                    'title': lottery['title'],
-                    'creator_name': creator_name
-                },
-                {
-                    'id': str(prize['_id']),
-                    'name': prize['name']
-                }
-            )
-            # 添加延迟避免触发限制
-            await asyncio.sleep(0.1)
-
-    except Exception as e:
-        logger.error(f"批量发送中奖通知时出错: {e}", exc_info=True)
-
-async def send_lottery_result_to_group(winners: list, groups: list):
-    """发送抽奖结果到群组
+    Returns:
+        dict: 可写入发件箱的消息（chat_id、text、parse_mode、reply_markup）
+    """
+    # 构建中奖通知消息
+    message = (
+        f"🎉 恭喜你中奖了！\n\n"
+        f"🎲 抽奖活动：{winner['title']}\n"
+        f"🎁 获得奖品：{winner['prize_name']}\n\n"
+        f"📋 领奖说明：\n"
+        f"请联系抽奖创建人领取奖品\n"
+        f"🔔 温馨提示：\n"
+        f"• 请确保你的账号可以接收私信\n"
+        f"• 领奖时请提供本中奖通知截图"
+    )
+
+    # 添加确认按钮
+    keyboard = [[
+        InlineKeyboardButton("📞 联系创建人", url=f"https://t.me/{winner['creator_name']}")
+    ],
+    [
+        InlineKeyboardButton("🛒流量套餐", url="https://hy.yunhaoka.com/#/pages/micro_store/index?agent_id=b7b9c654d9c97709b967e505d8255dd7")
+    ]
+    ]
+
+    return {
+        'chat_id': winner['user_id'],
+        'text': message,
+        'parse_mode': 'HTML',
+        'reply_markup': InlineKeyboardMarkup(keyboard).to_dict()
+    }
+
+def build_lottery_result_messages(winners: list, groups: list, lottery_info: dict) -> list:
+    """构建发送到群组的开奖结果消息
     
     Args:
-        winners: 中奖者信息列表
+        winners: 中奖记录列表
         groups: 群组ID列表
-    """
-    try:
-        bot = get_bot()
-        if not bot:
-            logger.error("无法获取机器人实例")
-            return False
-        lottery_id = winners[0][2]  # 获取抽奖ID
-        db = await MongoDBConnection.get_database()
-        # 获取抽奖信息
-        pipeline = [
-            {
-                '$match': {'lottery_id': lottery_id}
-            },
-            {
-                '$lookup': {
-                    'from': 'lotteries',
-                    'localField': 'lottery_id',
-                    'foreignField': 'id',
-                    'as': 'lottery'
-                }
-            },
-            {
-                '$unwind': '$lottery'
-            },
-            {
-                '$project': {
-                    'title': 1,
-                    'description': 1,
-                    'creator_id': '$lottery.creator_id'
-                }
-            }
-        ]
-        lottery_info = await db.lottery_settings.aggregate(pipeline).to_list(1)
-        if not lottery_info:
-            logger.error(f"未找到抽奖活动: {lottery_id}")
-            return False
-            
-        lottery_info = lottery_info[0]
-                
-        # 获取参与人数
-        total_participants = await db.participants.count_documents({'lottery_id': lottery_id})
-        
-        # 获取创建者信息
-        creator = await bot.get_chat(lottery_info['creator_id'])
-        creator_name = creator.username
-        # 获取中奖信息
-        winners_info = []
-        for winner in winners:
-            prize_id, participant_id, _ = winner
-            
-            # 获取参与者信息
-            participant = await db.participants.find_one(
-                {'_id': ObjectId(participant_id)},
-                {'nickname': 1, 'username': 1}
-            )
-            
-            # 获取奖品信息
-            prize = await db.prizes.find_one(
-                {'_id': ObjectId(prize_id)},
-                {'name': 1}
-            )
-            
-            if participant and prize:
-                winners_info.append((
-                    participant['nickname'],
-                    participant.get('username'),
-                    prize['name']
-                ))
-
-        # 构建开奖结果消息
-        message = (
-            f"🎉 抽奖结果公布！\n\n"
-            f"📑 活动标题：{lottery_info['title']}\n"
-            f"👥 参与人数：{total_participants}\n\n"
-            f"🎯 中奖名单：\n"
-        )
-
-        # 添加中奖者信息
-        for winner in winners_info:
-            nickname, username, prize_name = winner
-            winner_text = f"@{username}" if username else nickname
-            message += f"🎁 {prize_name}：{winner_text}\n"
-
-        message += (
-            f"\n📋 领奖方式：\n"
-            f"请中奖者联系创建人 @{creator_name} 领取奖品\n\n"
-            f"🔔 温馨提示：\n"
-            f"• 请在规定时间内联系领取\n"
-            f"• 逾期未领取视为自动放弃"
-        )
+        lottery_info: 抽奖信息（title、creator_name、participant_count）
 
-        # 添加抽奖工具推广信息
-        message += (
-            f"\n\n🤖 机器人推荐：\n"
-            f"使用 @{YOUR_BOT} 轻松创建抽奖"
-            f"以下内容为广告\n"
-        )
-        keyboard = [[
-            InlineKeyboardButton("🛒流量套餐", url="https://hy.yunhaoka.com/#/pages/micro_store/index?agent_id=b7b9c654d9c97709b967e505d8255dd7")
-        ]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        # 发送消息到群组
-        for group_id in groups:
-            try:
-                await bot.send_message(
-                    chat_id=group_id,
-                    text=message,
-                    parse_mode='HTML',
-                    disable_web_page_preview=True,
-                    reply_markup=reply_markup
-                )
-            except Exception as e:
-                logger.error(f"发送开奖结果到群组 {group_id} 时出错: {e}")
-    except Exception as e:
-        logger.error(f"准备开奖结果通知时出错: {e}", exc_info=True)
+    Returns:
+        list: 每个群组一条、可写入发件箱的消息
+    """
+    total_participants = lottery_info.get('participant_count', 0)
+    creator_name = lottery_info.get('creator_name')
+
+    # 构建开奖结果消息
+    message = (
+        f"🎉 抽奖结果公布！\n\n"
+        f"📑 活动标题：{lottery_info['title']}\n"
+        f"👥 参与人数：{total_participants}\n\n"
+        f"🎯 中奖名单：\n"
+    )
+
+    # 添加中奖者信息
+    for winner in winners:
+        winner_text = f"@{winner['username']}" if winner.get('username') else winner['nickname']
+        message += f"🎁 {winner['prize_name']}：{winner_text}\n"
+
+    message += (
+        f"\n📋 领奖方式：\n"
+        f"请中奖者联系创建人 @{creator_name} 领取奖品\n\n"
+        f"🔔 温馨提示：\n"
+        f"• 请在规定时间内联系领取\n"
+        f"• 逾期未领取视为自动放弃"
+    )
+
+    # 添加抽奖工具推广信息
+    message += (
+        f"\n\n🤖 机器人推荐：\n"
+        f"使用 @{YOUR_BOT} 轻松创建抽奖"
+        f"以下内容为广告\n"
+    )
+    keyboard = [[
+        InlineKeyboardButton("🛒流量套餐", url="https://hy.yunhaoka.com/#/pages/micro_store/index?agent_id=b7b9c654d9c97709b967e505d8255dd7")
+    ]]
+    reply_markup = InlineKeyboardMarkup(keyboard).to_dict()
+
+    return [
+        {
+            'chat_id': group_id,
+            'text': message,
+            'parse_mode': 'HTML',
+            'disable_web_page_preview': True,
+            'reply_markup': reply_markup
+        }
+        for group_id in groups
+    ]
+
+
+# 已参与发言数量抽奖的 (lottery_id, user_id)，达标用户后续发言不再查询数据库
+_joined_cache = AsyncTTLCache(GROUP_JOINED_CACHE_SIZE, GROUP_JOINED_CACHE_TTL, name='group_joined')
+
+
+async def join_lottery_from_message(message, user, lottery: dict, source: str) -> bool:
+    """群组消息参与抽奖：通过参与服务写入参与记录并回复
 
+    Args:
+        message: 触发参与的群组消息
+        user: 发送者
+        lottery: 群组索引中的抽奖设置快照
+        source: 参与来源（SOURCE_KEYWORD / SOURCE_MESSAGE）
 
-async def handle_keyword_participate(update: Update, context):
-    """处理用户发送关键词参与抽奖"""
+    Returns:
+        bool: 是否参与成功（含已参与）
+    """
+    result = await participation_service.join(lottery['lottery_id'], user, source, settings=lottery)
+    if not result.joined:
+        # 发言来源在并发参与时可能已写入，不再提示
+        if not (source == SOURCE_MESSAGE and result.status == ALREADY_JOINED):
+            text, reply_markup = await participation_service.failure_reply(result)
+            await message.reply_text(
+                text,
+                reply_markup=reply_markup,
+                reply_to_message_id=message.message_id
+            )
+        return result.status == ALREADY_JOINED
+
+    # 发送参与成功提示
+    await message.reply_text(
+        f"✅ 参与成功！\n\n"
+        f"🎲 抽奖活动：{lottery['title']}\n"
+        f"👥 当前参与人数：{result.participant_count}\n\n"
+        f"🔔 开奖后会通过机器人私信通知",
+        reply_to_message_id=message.message_id
+    )
+    return True
+
+
+async def handle_group_message(update: Update, context):
+    """群组文本消息统一入口：先分类，再只执行相关的参与路径
+
+    - 关键词抽奖：消息内容与群组中进行中抽奖的关键词一致
+    - 发言数量抽奖：群组中有进行中的发言数量抽奖，计入发言并按内存计数检查是否达到要求
+    群组索引未命中、关键词未命中且发言数量未达标时只在内存中计数，不访问数据库；
+    需要参与时状态和重复参与检查各合并为一次查询。
+    """
     try:
         message = update.message
         if not message or not message.text:
             return
-        
+
         # 获取发送者信息
         user = message.from_user
-        if not user or not user.is_bot:
+        if not user or user.is_bot:
             return
-        if message.forward:
+        # 转发的消息不计入关键词和发言数量参与
+        if message.forward_origin:
             return
-        
+
         chat_id = message.chat.id
         # 检查是否是群组消息
         if message.chat.type not in ['group', 'supergroup']:
-            logger.debug(f"不是群组消息: {message.chat.type}")
-            return
-        
-        # 获取对应的抽奖活动
-        db = await MongoDBConnection.get_database()
-        # 查找对应的抽奖活动
-        lottery = await db.lottery_settings.find_one({
-            'keyword_group_id': str(chat_id),
-            'keyword': message.text.strip()
-        })
-        
-        if not lottery:
             return
 
-        # 检查抽奖状态
-        lottery_status = await db.lotteries.find_one(
-            {'id': lottery['lottery_id']},
-            {'status': 1}
-        )
-        
-        if not lottery_status or lottery_status['status'] != 'active':
-            return
-            
-        # 检查重复参与
-        existing = await db.participants.find_one({
-            'lottery_id': lottery['lottery_id'],
-            'user_id': user.id
-        })
-        
-        if existing:
-            await message.reply_text(
-                "❌ 你已经参与过这个抽奖了",
-                reply_to_message_id=message.message_id
-            )
-            return
-            
-        # 检查用户名要求
-        required_username = lottery.get('require_username', False)
-        if required_username and not user.username:
-            await message.reply_text(
-                "❌ 参与失败：请先设置用户名后再参与抽奖",
-                reply_to_message_id=message.message_id
-            )
+        # 登记见到的群组（异步写入 chats，同一群组一段时间内只写一次）
+        chat_cache.observe(message.chat)
+
+        # 消息分类：只查内存索引，未命中时不访问数据库
+        watch = group_index.get(chat_id)
+        if not watch:
             return
-            
-        # 检查群组要求
-        required_groups = lottery.get('required_groups', [])
-        for group_id in required_groups:
-            if group_id and group_id.strip():
-                try:
-                    member = await context.bot.get_chat_member(group_id, user.id)
-                    if member.status not in ['member', 'administrator', 'creator']:
-                        chat = await context.bot.get_chat(group_id)
-                        await message.reply_text(
-                            f"❌ 参与失败：请先加入群组 {chat.title}",
-                            reply_to_message_id=message.message_id
-                        )
-                        return
-                except Exception as e:
-                    logger.error(f"检查用户群组成员状态时出错: {e}")
+        keyword_lotteries = watch.match_keywords(message.text)
+        message_lotteries = watch.message_lotteries
+
+        # 发言数量参与：本条发言只计一次（内存计数），群组内所有抽奖共享计数
+        reached_lotteries = []
+        if message_lotteries:
+            await message_count_buffer.record(chat_id, user.id, message.date)
+            for lottery in message_lotteries:
+                if _joined_cache.get((lottery['lottery_id'], user.id)) is not MISSING:
                     continue
+                if await check_user_messages(
+                    user.id,
+                    chat_id,
+                    lottery['message_count'],
+                    lottery['message_check_time']
+                ):
+                    reached_lotteries.append(lottery)
+
+        # 关键词未命中且发言数量未达标：不访问数据库
+        if not keyword_lotteries and not reached_lotteries:
+            return
 
-        # 添加参与记录
-        now = datetime.now(timezone.utc)
-        await db.participants.insert_one({
-            'lottery_id': lottery['lottery_id'],
-            'user_id': Int64(user.id),
-            'nickname': user.full_name,
-            'username': user.username,
-            'join_time': now,
-            'created_at': now
+        candidate_ids = list({
+            lottery['lottery_id'] for lottery in keyword_lotteries + reached_lotteries
         })
-            
-        # 发送参与成功提示
-        current_count = await db.participants.count_documents({
-            'lottery_id': lottery['lottery_id']
-        })
-        await message.reply_text(
-            f"✅ 参与成功！\n\n"
-            f"🎲 抽奖活动：{lottery['title']}\n"
-            f"👥 当前参与人数：{current_count}\n\n"
-            f"🔔 开奖后会通过机器人私信通知",
-            reply_to_message_id=message.message_id
+        db = await MongoDBConnection.get_database()
+
+        # 确认抽奖仍在进行中（索引可能尚未同步其他实例上的变更），并一次查出已参与的抽奖
+        active_ids, joined_ids = await asyncio.gather(
+            db.lotteries.distinct('id', {'id': {'$in': candidate_ids}, 'status': 'active'}),
+            db.participants.distinct('lottery_id', {
+                'lottery_id': {'$in': candidate_ids},
+                'user_id': Int64(user.id)
+            })
         )
+        active_ids = set(active_ids)
+        joined_ids = set(joined_ids)
+
+        # 关键词参与
+        for lottery in keyword_lotteries:
+            lottery_id = lottery['lottery_id']
+            if lottery_id not in active_ids:
+                continue
+            if lottery_id in joined_ids:
+                await message.reply_text(
+                    "❌ 你已经参与过这个抽奖了",
+                    reply_to_message_id=message.message_id
+                )
+                continue
+            if await join_lottery_from_message(message, user, lottery, SOURCE_KEYWORD):
+                joined_ids.add(lottery_id)
+
+        # 发言数量已达标的抽奖
+        for lottery in reached_lotteries:
+            lottery_id = lottery['lottery_id']
+            if lottery_id not in active_ids:
+                continue
+            if lottery_id in joined_ids or await join_lottery_from_message(message, user, lottery, SOURCE_MESSAGE):
+                joined_ids.add(lottery_id)
+                _joined_cache.set((lottery_id, user.id), True)
 
     except Exception as e:
-        logger.error(f"处理关键词参与抽奖时出错: {e}", exc_info=True)
+        logger.error(f"处理群组消息参与抽奖时出错: {e}", exc_info=True)
 
 async def handle_media_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """处理接收到的媒体消息"""
@@ -581,264 +486,36 @@ async def handle_media_message(update: Update, context: ContextTypes.DEFAULT_TYP
         )
 
 
-async def check_user_messages(bot, user_id: int, group_id: str, required_count: int, check_hours: int, lottery_id: int, update=None) -> bool:
-    """检查用户在群组中的发言数量（实时统计）
-    
-    Args:
-        bot: Telegram bot 实例
-        user_id: 用户ID
-        group_id: 群组ID
-        required_count: 要求的发言数量
-        check_hours: 检查时间范围(小时)
-        lottery_id: 抽奖ID
-        update: 可选的消息更新对象
-
-    Returns:
-        bool: 是否满足发言要求
-    """
-    try:
-        db = await MongoDBConnection.get_database()
-        current_time = datetime.now(timezone.utc)
-        check_start_time = current_time - timedelta(hours=check_hours)
-        
-        # 获取消息记录
-        message_record = await db.message_counts.find_one({
-            'lottery_id': lottery_id,
-            'user_id': Int64(user_id),
-            'group_id': str(group_id)
-        })
-
-        if message_record:
-            # 检查是否超时
-            last_message_time = message_record.get('last_message_time')
-            if last_message_time:
-                # 如果时间没有时区信息，添加 UTC 时区
-                if last_message_time.tzinfo is None:
-                    last_message_time = last_message_time.replace(tzinfo=timezone.utc)
-                  
-                if last_message_time and last_message_time < check_start_time:
-                    # 超时清除记录
-                    await db.message_counts.delete_one({
-                        'lottery_id': lottery_id,
-                        'user_id': Int64(user_id),
-                        'group_id': str(group_id)
-                    })
-                    message_count = 0
-                else:
-                    message_count = message_record.get('message_count', 0)
-            else:
-                message_count = message_record.get('message_count', 0)
-        else:
-            message_count = 0
-
-        # 如果有新消息且是文本消息，增加计数
-        if (update and update.message and 
-            update.message.text and 
-            str(update.message.chat.id) == str(group_id) and 
-            update.message.from_user.id == user_id):
-            
-            message_time = update.message.date.replace(tzinfo=timezone.utc)
-            if message_time >= check_start_time:
-                message_count += 1
-
-                # 更新或插入消息计数
-                await db.message_counts.update_one(
-                    {
-                        'lottery_id': lottery_id,
-                        'user_id': Int64(user_id),
-                        'group_id': str(group_id)
-                    },
-                    {
-                        '$set': {
-                            'message_count': message_count,
-                            'last_message_time': message_time,
-                            'updated_at': current_time
-                        },
-                        '$setOnInsert': {
-                            'created_at': current_time
-                        }
-                    },
-                    upsert=True
-                )
-
-        # 检查是否达到要求
-        if message_count >= required_count:
-            return True
-
-        # 如果发言数量不足且超过时间范围，返回 False
-        return False
-
-    except Exception as e:
-        logger.error(f"检查用户发言数量时出错: {e}", exc_info=True)
-        return False
-
-
-async def handle_message_count_participate(update: Update, context):
-    """处理用户通过发言数量参与抽奖"""
+async def handle_my_chat_member(update: Update, context):
+    """机器人在群组/频道中的状态变化（被添加、移除、权限变更等）时刷新聊天信息缓存"""
     try:
-        message = update.message
-        if not message or not message.text:
-            return
-            
-        user = message.from_user
-        if not user or user.is_bot:
+        member_update = update.my_chat_member
+        if not member_update:
             return
-        if message.forward:
-            return
-        chat_id = message.chat.id
-        
-        # 检查是否是群组消息
-        if message.chat.type not in ['group', 'supergroup']:
-            return
-            
-        # 获取该群组的发言要求抽奖
-        db = await MongoDBConnection.get_database()
-        pipeline = [
-            {
-                '$match': {
-                    'message_group_id': str(chat_id),
-                    'message_count': {'$gt': 0}
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'lotteries',
-                    'localField': 'id',
-                    'foreignField': 'lottery_id',
-                    'as': 'lottery'
-                }
-            },
-            {
-                '$unwind': '$lottery'
-            },
-            {
-                '$match': {
-                    'lottery.status': 'active'
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'participants',
-                    'localField': 'lottery_id',
-                    'foreignField': 'lottery_id',
-                    'pipeline': [{'$count': 'count'}],
-                    'as': 'participant_count'
-                }
-            }
-        ]
-            
-        lotteries = await db.lottery_settings.aggregate(pipeline).to_list(None)
-        if not lotteries:
-            return
-        for lottery in lotteries:
-            lottery_id = lottery['lottery_id']
-            title = lottery['title']
-
-            # 检查重复参与
-            existing = await db.participants.find_one({
-                'lottery_id': lottery_id,
-                'user_id': Int64(user.id)
-            })
-
-            if existing:
-                return
-            
-            # 检查用户名要求
-            if lottery.get('require_username') and not user.username:
-                await message.reply_text(
-                    "❌ 参与失败：请先设置用户名后再参与抽奖",
-                    reply_to_message_id=message.message_id
-                )
-                return
-            # 检查群组要求
-            if lottery.get('required_groups'):
-                for group_id in lottery['required_groups']:
-                    if not group_id:
-                        continue
-                    try:
-                        member = await context.bot.get_chat_member(group_id, user.id)
-                        if member.status not in ['member', 'administrator', 'creator']:
-                            chat = await context.bot.get_chat(group_id)
-                            await message.reply_text(
-                                f"❌ 参与失败：请先加入群组 {chat.title}",
-                                reply_to_message_id=message.message_id
-                            )
-                            return
-                    except Exception as e:
-                        logger.error(f"检查用户群组成员状态时出错: {e}")
-                        continue
-
-            # 检查发言数量
-            if not await check_user_messages(
-                context.bot,
-                user.id,
-                chat_id,
-                lottery['message_count'],
-                lottery['message_check_time'],
-                lottery_id,
-                update
-            ):
-                return
-
-            # 添加参与记录
-            now = datetime.now(timezone.utc)
-            await db.participants.insert_one({
-                'lottery_id': lottery_id,
-                'user_id': Int64(user.id),
-                'nickname': user.full_name,
-                'username': user.username,
-                'join_time': now,
-                'created_at': now
-            })
-            
-            # 获取当前参与人数
-            current_count = lottery['participant_count'][0]['count'] if lottery['participant_count'] else 0
-            
-            # 发送参与成功提示
-            await message.reply_text(
-                f"✅ 参与成功！\n\n"
-                f"🎲 抽奖活动：{title}\n"
-                f"👥 当前参与人数：{current_count + 1}\n\n"
-                f"🔔 开奖后会通过机器人私信通知",
-                reply_to_message_id=message.message_id
-            )
-            
-            # 清除该用户的消息记录数据
-            await db.message_counts.delete_one({
-                'lottery_id': lottery_id,
-                'user_id': user.id,
-                'group_id': chat_id
-            })
-            
+        chat_cache.invalidate(member_update.chat.id)
+        chat_cache.observe(member_update.chat)
+        logger.info(
+            f"机器人在 {member_update.chat.title or member_update.chat.id} 中的状态变更: "
+            f"{member_update.old_chat_member.status} -> {member_update.new_chat_member.status}"
+        )
     except Exception as e:
-        logger.error(f"处理发言数量参与抽奖时出错: {e}", exc_info=True)
+        logger.error(f"处理机器人成员状态变更时出错: {e}", exc_info=True)
 
-async def check_keyword_message(bot, user_id: int, group_id: str, keyword: str) -> bool:
-    """检查用户是否在群组发送过关键词"""
+async def handle_chat_member(update: Update, context):
+    """群组/频道成员状态变化时使成员验证缓存失效"""
     try:
-        current_time = datetime.now()
-        check_time = current_time - timedelta(hours=1)  # 检查最近1小时
-        
-        async for message in bot.get_chat_history(
-            chat_id=group_id,
-            offset_date=check_time,
-            limit=1000
-        ):
-            if (message.from_user and 
-                message.from_user.id == user_id and 
-                message.text and 
-                message.text.strip() == keyword):
-                return True
-        
-        return False
+        member_update = update.chat_member
+        if not member_update:
+            return
+        membership_verifier.invalidate(member_update.chat.id, member_update.new_chat_member.user.id)
+        if member_update.chat.username:
+            membership_verifier.invalidate(f"@{member_update.chat.username}", member_update.new_chat_member.user.id)
     except Exception as e:
-        logger.error(f"检查关键词发送记录时出错: {e}")
-        return False
+        logger.error(f"处理成员状态变更时出错: {e}", exc_info=True)
 
 def register_handlers(app):
     """注册所有非命令处理器"""
     logger.info("开始注册处理器")
     app.add_handler(MessageHandler(filters.PHOTO | filters.VIDEO, handle_media_message))
-    app.add_handler(MessageHandler(filters.TEXT & (filters.GroupChat | filters.SUPERGROUP) & ~filters.FORWARDED & ~filters.Bot, handle_keyword_participate))
-    app.add_handler(MessageHandler(filters.TEXT & (filters.GroupChat | filters.SUPERGROUP) & ~filters.FORWARDED & ~filters.Bot, handle_message_count_participate))
+    app.add_handler(MessageHandler(filters.TEXT & filters.ChatType.GROUPS & ~filters.FORWARDED & ~filters.Bot, handle_group_message))
     logger.info("处理器注册完成")
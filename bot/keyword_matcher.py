@@ -0,0 +1,62 @@
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+
+def normalize_keyword(text: str) -> str:
+    """关键词归一化：全角转半角（NFKC）、忽略大小写、合并连续空白"""
+    return ' '.join(unicodedata.normalize('NFKC', text).casefold().split())
+
+
+class AhoCorasick:
+    """Aho-Corasick 多模式匹配自动机
+
+    一次扫描消息即可找出其中包含的所有关键词，耗时与消息长度成正比，与关键词数量无关。
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        # 每个节点：子节点表、失配指针、以该节点结尾的关键词
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[str]] = [set()]
+        for pattern in patterns:
+            if pattern:
+                self._insert(pattern)
+        self._build()
+
+    def _insert(self, pattern: str) -> None:
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            node = next_node
+        self._output[node].add(pattern)
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] |= self._output[self._fail[child]]
+
+    def search(self, text: str) -> Set[str]:
+        """返回文本中出现的所有关键词"""
+        found: Set[str] = set()
+        node = 0
+        for char in text:
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            if self._output[node]:
+                found |= self._output[node]
+        return found
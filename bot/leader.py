@@ -0,0 +1,128 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.database import MongoDBConnection
+from bot.tasks import reconcile_lottery_draws_periodically
+from config import INSTANCE_ID, LEADER_LEASE_SECONDS
+from utils import logger
+
+
+class LeaderElector:
+    """基于 MongoDB 租约的领导者选举
+
+    leases 集合中每个名称对应一条记录，持有者每隔租约时长的 1/3 续约一次。
+    持有者崩溃或失联时租约过期，其他实例在下一次心跳时接管，故障转移时间不超过
+    租约时长加一次心跳间隔。只有领导者运行注册的后台任务。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        task_factories: Dict[str, Callable[[], Awaitable]],
+        lease_seconds: int = LEADER_LEASE_SECONDS
+    ):
+        self.name = name
+        self._task_factories = task_factories
+        self._lease_seconds = lease_seconds
+        self._heartbeat = max(lease_seconds / 3, 1)
+        self._tasks: List[asyncio.Task] = []
+        # 本地记录的租约到期时间（单调时钟），心跳失败时据此主动降级
+        self._local_expires = 0.0
+        self.is_leader = False
+        self.leader_id: Optional[str] = None
+
+    @property
+    def role(self) -> str:
+        return 'leader' if self.is_leader else 'follower'
+
+    async def try_acquire(self) -> bool:
+        """获取或续约租约，返回本实例是否持有租约"""
+        db = await MongoDBConnection.get_database()
+        started = time.monotonic()
+        now = datetime.now(timezone.utc)
+        try:
+            lease = await db.leases.find_one_and_update(
+                {
+                    '_id': self.name,
+                    '$or': [
+                        {'owner': INSTANCE_ID},
+                        {'expires_at': {'$lt': now}}
+                    ]
+                },
+                {
+                    '$set': {
+                        'owner': INSTANCE_ID,
+                        'expires_at': now + timedelta(seconds=self._lease_seconds),
+                        'renewed_at': now
+                    }
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # 租约由其他实例持有且未过期，upsert 与已有记录冲突
+            lease = None
+
+        if lease and lease['owner'] == INSTANCE_ID:
+            self._local_expires = started + self._lease_seconds
+            self.leader_id = INSTANCE_ID
+            return True
+
+        current = await db.leases.find_one({'_id': self.name}, {'owner': 1})
+        self.leader_id = current['owner'] if current else None
+        return False
+
+    async def release(self) -> None:
+        """主动释放租约，便于其他实例立即接管"""
+        try:
+            db = await MongoDBConnection.get_database()
+            await db.leases.delete_one({'_id': self.name, 'owner': INSTANCE_ID})
+        except Exception as e:
+            logger.error(f"释放租约 {self.name} 时出错: {e}", exc_info=True)
+
+    def _promote(self) -> None:
+        self.is_leader = True
+        self._tasks = [
+            asyncio.create_task(factory(), name=name)
+            for name, factory in self._task_factories.items()
+        ]
+        logger.info(f"实例 {INSTANCE_ID} 成为 {self.name} 领导者，启动任务: {', '.join(self._task_factories)}")
+
+    async def _demote(self) -> None:
+        self.is_leader = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.warning(f"实例 {INSTANCE_ID} 不再是 {self.name} 领导者，已停止领导者任务")
+
+    async def run(self) -> None:
+        """选举循环：按心跳间隔获取或续约租约，并随角色变化启停领导者任务"""
+        try:
+            while True:
+                try:
+                    acquired = await self.try_acquire()
+                    if acquired and not self.is_leader:
+                        self._promote()
+                    elif not acquired and self.is_leader:
+                        await self._demote()
+                except Exception as e:
+                    logger.error(f"续约租约 {self.name} 时出错: {e}", exc_info=True)
+                    # 无法确认租约时，到期前主动降级，避免与新领导者同时运行
+                    if self.is_leader and time.monotonic() >= self._local_expires - self._heartbeat:
+                        await self._demote()
+                await asyncio.sleep(self._heartbeat)
+        finally:
+            if self.is_leader:
+                await self._demote()
+                await self.release()
+
+
+# 全局领导者选举实例：只有领导者运行开奖对账和过期记录清理
+leader_elector = LeaderElector(
+    'background_tasks',
+    {'reconcile_lottery_draws': reconcile_lottery_draws_periodically}
+)
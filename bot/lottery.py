@@ -1,99 +1,196 @@
+import asyncio
 import random
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from pymongo import ReturnDocument
 from telegram import Bot 
-from app.database import MongoDBConnection
-from bot.handlers import send_batch_winner_notifications, send_lottery_result_to_group
+from app.database import CRITICAL_WRITE_CONCERN, MongoDBConnection, get_collection
+from config import DRAW_LEASE_SECONDS, INSTANCE_ID
+from bot.handlers import build_winner_notification, build_lottery_result_messages
+from bot.outbox import build_outbox_docs, notify_outbox
+from bot.group_index import group_index
+from bot.chat_cache import chat_cache
+from bot.lottery_cache import lottery_cache
 from utils import logger
 
+# 正在执行的开奖任务，按抽奖 ID 去重
+_running_draws: Dict[str, asyncio.Task] = {}
+
+# 开奖时流式读取参与者的批大小
+DRAW_BATCH_SIZE = 10000
+
+
+async def sample_participants(db, lottery_id: str, k: int) -> List[dict]:
+    """从抽奖的参与者中无放回地随机抽取 k 人
+
+    先在 [0, N) 上抽取 k 个位置，再按批流式扫描 (lottery_id, user_id) 覆盖索引，
+    只保留命中位置的 user_id，内存占用为 O(k)，与参与人数无关。
+
+    Returns:
+        List[dict]: 按抽取顺序排列的中奖参与者（含 _id、user_id、nickname、username）
+    """
+    total = await db.participants.count_documents({'lottery_id': lottery_id})
+    k = min(k, total)
+    if k <= 0:
+        return []
+
+    # positions[i] 为第 i 个中奖者在扫描顺序中的位置
+    positions = random.sample(range(total), k)
+    ranks = sorted(range(k), key=positions.__getitem__)
+    user_ids = [None] * k
+
+    cursor = db.participants.find(
+        {'lottery_id': lottery_id},
+        {'_id': 0, 'user_id': 1}
+    ).hint([('lottery_id', 1), ('user_id', 1)]).batch_size(DRAW_BATCH_SIZE)
+    try:
+        offset = 0
+        j = 0
+        while j < k:
+            batch = await cursor.to_list(DRAW_BATCH_SIZE)
+            if not batch:
+                break
+            end = offset + len(batch)
+            while j < k and positions[ranks[j]] < end:
+                user_ids[ranks[j]] = batch[positions[ranks[j]] - offset]['user_id']
+                j += 1
+            offset = end
+    finally:
+        await cursor.close()
+
+    # 参与者在统计后被删除时，扫描会提前结束
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+
+    # 只取回中奖者的完整记录
+    docs = await db.participants.find(
+        {'lottery_id': lottery_id, 'user_id': {'$in': user_ids}},
+        {'user_id': 1, 'nickname': 1, 'username': 1}
+    ).to_list(None)
+    by_user = {doc['user_id']: doc for doc in docs}
+    return [by_user[user_id] for user_id in user_ids if user_id in by_user]
+
+
+async def claim_lottery(db, lottery_id: str) -> Optional[dict]:
+    """原子地领取开奖权：active（或开奖租约已过期的 drawing）→ drawing
+
+    Returns:
+        Optional[dict]: 领取成功时返回抽奖记录，已被其他实例领取或状态不可开奖时返回 None
+    """
+    now = datetime.now(timezone.utc)
+    return await get_collection(db, 'lotteries').find_one_and_update(
+        {
+            'id': lottery_id,
+            '$or': [
+                {'status': 'active'},
+                {'status': 'drawing', 'draw_lease_expires_at': {'$lt': now}}
+            ]
+        },
+        {
+            '$set': {
+                'status': 'drawing',
+                'draw_owner': INSTANCE_ID,
+                'draw_lease_expires_at': now + timedelta(seconds=DRAW_LEASE_SECONDS),
+                'updated_at': now
+            }
+        },
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def release_lottery(db, lottery_id: str):
+    """开奖未完成时释放开奖权，恢复为 active"""
+    try:
+        await get_collection(db, 'lotteries').update_one(
+            {'id': lottery_id, 'status': 'drawing', 'draw_owner': INSTANCE_ID},
+            {
+                '$set': {'status': 'active', 'updated_at': datetime.now(timezone.utc)},
+                '$unset': {'draw_owner': '', 'draw_lease_expires_at': ''}
+            }
+        )
+    except Exception as e:
+        logger.error(f"释放抽奖 {lottery_id} 的开奖权时出错: {e}", exc_info=True)
+
 
 async def draw_lottery(bot: Bot, lottery_id: str):
     """执行开奖"""
+    db = None
+    claimed = False
+    committed = False
     try:
         # 获取数据库连接
         db = await MongoDBConnection.get_database()
 
-        # 获取抽奖和设置信息
-        pipeline = [
-            {
-                '$match': {'id': lottery_id}
-            },
-            {
-                '$lookup': {
-                    'from': 'lottery_settings',
-                    'localField': 'lottery_id',
-                    'foreignField': 'id',
-                    'as': 'settings'
-                }
-            },
-            {
-                '$unwind': '$settings'
-            }
-        ]
-        
-        lottery_data = await db.lotteries.aggregate(pipeline).to_list(1)
+        # 领取开奖权，保证多实例下同一抽奖只开奖一次
+        lottery_data = await claim_lottery(db, lottery_id)
         if not lottery_data:
-            logger.error(f"未找到抽奖 {lottery_id}")
-            return
-            
-        lottery_data = lottery_data[0]
+            logger.info(f"抽奖 {lottery_id} 已由其他实例开奖或不可开奖")
+            return False
+        claimed = True
+
+        # 获取抽奖设置（读模型，缺失时读取缓存）
+        settings = lottery_data.get('settings') or await lottery_cache.get_settings(lottery_id)
+        if not settings:
+            logger.error(f"未找到抽奖 {lottery_id} 的设置")
+            return False
+
         creator_id = lottery_data['creator_id']
+        title = settings['title']
         
         # 处理群组信息
         groups = []
-        if lottery_data['settings'].get('keyword_group_id'):
-            groups.append(lottery_data['settings']['keyword_group_id'])
-        if lottery_data['settings'].get('required_groups'):
-            groups.extend(lottery_data['settings']['required_groups'])
+        if settings.get('keyword_group_id'):
+            groups.append(settings['keyword_group_id'])
+        if settings.get('required_groups'):
+            groups.extend(settings['required_groups'])
         groups = list(set(filter(None, groups)))
         
+        # 获取创建者用户名（整个开奖只查询一次）
+        creator_name = None
+        try:
+            creator = await chat_cache.get(creator_id)
+            creator_name = creator.username
+        except Exception as e:
+            logger.error(f"获取创建者 {creator_id} 信息失败: {e}")
+
         lottery_info = {
             'lottery_id': lottery_id,
+            'title': title,
+            'creator_name': creator_name,
+            'participant_count': lottery_data.get('participant_count', 0),
             'groups': groups
         }
 
         # 获取奖品信息
-        prizes = await db.prizes.find(
-            {'lottery_id': lottery_id},
-            {'name': 1, 'total_count': 1}
-        ).to_list(None)
+        prizes = lottery_data.get('prizes') or await lottery_cache.get_prizes(lottery_id)
 
-        # 获取参与者
-        participants = await db.participants.find(
-            {
-                'lottery_id': lottery_id
-            },
-            {
-                'user_id': 1,
-                'nickname': 1
-            }
-        ).to_list(None)
+        if not prizes:
+            logger.error(f"抽奖 {lottery_id} 缺少奖品")
+            return False
 
-        if not prizes or not participants:
-            logger.error(f"抽奖 {lottery_id} 缺少奖品或参与者")
-            return
-
-        # 随机选择中奖者
-        winners = []
-        available_participants = participants.copy()
+        # 一次性为所有奖品抽取中奖者（按抽取顺序）
         total_prize_count = sum(prize['total_count'] for prize in prizes)
-        
+        participants = await sample_participants(db, lottery_id, total_prize_count)
+        if not participants:
+            logger.error(f"抽奖 {lottery_id} 缺少参与者")
+            return False
+
         if len(participants) < total_prize_count:
             logger.warning(f"参与人数({len(participants)})少于奖品总数({total_prize_count})")
-        
+
         now = datetime.now(timezone.utc)
+        winners = []
         winners_to_insert = []
-        
+        offset = 0
+
         for prize in prizes:
-            if not available_participants:
+            if offset >= len(participants):
                 logger.warning(f"奖品 {prize['name']} 因参与者不足无法完全抽取")
                 break
-                
-            # 确定本轮可抽取的数量
-            actual_count = min(prize['total_count'], len(available_participants))
-            
-            # 随机选择指定数量的中奖者
-            current_winners = random.sample(available_participants, actual_count)
-            
+
+            # 按顺序为本奖品分配中奖者
+            current_winners = participants[offset:offset + prize['total_count']]
+            offset += len(current_winners)
+
             # 准备中奖记录
             for winner in current_winners:
                 winner_doc = {
@@ -104,43 +201,98 @@ async def draw_lottery(bot: Bot, lottery_id: str):
                     'win_time': now
                 }
                 winners_to_insert.append(winner_doc)
-                
-                # 添加到winners列表用于通知
-                winners.append((str(prize['_id']), str(winner['_id']), lottery_id))
-                
-            # 从可用池中移除已中奖者
-            available_participants = [
-                p for p in available_participants 
-                if p not in current_winners
-            ]
 
-        # 批量插入中奖记录
-        if winners_to_insert:
-            await db.prize_winners.insert_many(winners_to_insert)
+                # 添加到winners列表用于通知
+                winners.append({
+                    'lottery_id': lottery_id,
+                    'prize_id': str(prize['_id']),
+                    'participant_id': str(winner['_id']),
+                    'user_id': winner['user_id'],
+                    'nickname': winner['nickname'],
+                    'username': winner.get('username'),
+                    'prize_name': prize['name'],
+                    'title': title,
+                    'creator_name': creator_name
+                })
 
-        # 更新抽奖状态
-        await db.lotteries.update_one(
-            {'id': lottery_id},
-            {
-                '$set': {
-                    'status': 'completed',
-                    'updated_at': now
-                }
-            }
+        # 待发送的中奖私信和群组开奖结果
+        outbox_docs = build_outbox_docs(
+            lottery_id, 'winner', [build_winner_notification(w) for w in winners], now
         )
-
-        # 发送中奖通知
-        await send_batch_winner_notifications(winners, creator_id)
-        
-        # 发送群组通知
         if lottery_info['groups']:
-            await send_lottery_result_to_group(
-                winners,
-                lottery_info['groups']
+            outbox_docs += build_outbox_docs(
+                lottery_id,
+                'result',
+                build_lottery_result_messages(winners, lottery_info['groups'], lottery_info),
+                now
             )
 
+        # 中奖记录、发件箱消息和抽奖状态在同一事务中写入，多数节点确认后才算提交
+        client = await MongoDBConnection.get_client()
+        async with await client.start_session() as session:
+            async with session.start_transaction(write_concern=CRITICAL_WRITE_CONCERN):
+                if winners_to_insert:
+                    await db.prize_winners.insert_many(winners_to_insert, session=session)
+                if outbox_docs:
+                    await db.outbox.insert_many(outbox_docs, session=session)
+                result = await db.lotteries.update_one(
+                    {'id': lottery_id, 'status': 'drawing', 'draw_owner': INSTANCE_ID},
+                    {
+                        '$set': {
+                            'status': 'completed',
+                            'updated_at': now
+                        },
+                        '$unset': {'draw_owner': '', 'draw_lease_expires_at': ''}
+                    },
+                    session=session
+                )
+                if result.matched_count == 0:
+                    # 租约已过期并被其他实例领取，或抽奖已被取消，放弃本次开奖
+                    raise RuntimeError(f"抽奖 {lottery_id} 的开奖权已失效")
+        committed = True
+        group_index.remove(lottery_id)
+
+        # 通知由发件箱投递协程异步发送
+        notify_outbox()
+        logger.info(f"抽奖 {lottery_id} 开奖完成，{len(outbox_docs)} 条通知已写入发件箱")
+
         return True
         
     except Exception as e:
         logger.error(f"执行开奖时出错: {e}", exc_info=True)
-        return False
\ No newline at end of file
+        return False
+
+    finally:
+        if claimed and not committed:
+            await release_lottery(db, lottery_id)
+
+
+def trigger_draw(bot: Bot, lottery_id: str) -> asyncio.Task:
+    """在后台立即执行开奖，同一抽奖同时只会有一个开奖任务"""
+    task = _running_draws.get(lottery_id)
+    if task and not task.done():
+        return task
+
+    task = asyncio.create_task(draw_lottery(bot, lottery_id), name=f"draw_{lottery_id}")
+    _running_draws[lottery_id] = task
+    task.add_done_callback(lambda _: _running_draws.pop(lottery_id, None))
+    return task
+
+
+def trigger_draw_if_full(bot: Bot, lottery_id: str, current_count: int, settings: dict) -> Optional[asyncio.Task]:
+    """参与人数达到要求时立即触发满人开奖
+
+    Args:
+        bot: Telegram bot 实例
+        lottery_id: 抽奖ID
+        current_count: 插入参与记录后的参与人数
+        settings: 抽奖设置（需包含 draw_method 和 participant_count）
+    """
+    if settings.get('draw_method') != 'draw_when_full':
+        return None
+    required_count = settings.get('participant_count')
+    if not required_count or current_count < required_count:
+        return None
+
+    logger.info(f"抽奖 {lottery_id} 已满员 ({current_count}/{required_count})，立即开奖")
+    return trigger_draw(bot, lottery_id)
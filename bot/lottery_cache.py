@@ -0,0 +1,67 @@
+import copy
+from typing import Dict, List, Optional
+from app.cache import AsyncTTLCache
+from app.database import MongoDBConnection
+from config import LOTTERY_CACHE_SIZE, LOTTERY_CACHE_TTL
+from utils import logger
+
+
+class LotteryDataCache:
+    """lottery_settings 和 prizes 的读穿透缓存（按 lottery_id）
+
+    两者在 create_lottery 写入后不再修改，参与、发布、页面展示、开奖都直接读缓存；
+    创建时写入缓存，删除抽奖时失效。容量 LOTTERY_CACHE_SIZE，按 LRU 淘汰；
+    LOTTERY_CACHE_TTL 只用于兜底其他实例上的删除。不存在的抽奖不缓存。
+    返回值为副本，调用方可以修改。
+    """
+
+    def __init__(self, maxsize: int = LOTTERY_CACHE_SIZE, ttl: float = LOTTERY_CACHE_TTL):
+        self._settings = AsyncTTLCache(maxsize, ttl, name='lottery_settings')
+        self._prizes = AsyncTTLCache(maxsize, ttl, name='prizes')
+
+    async def get_settings(self, lottery_id: str) -> Optional[dict]:
+        """获取抽奖设置，不存在时返回 None"""
+        settings = await self._settings.get_or_load(lottery_id, lambda: self._load_settings(lottery_id))
+        if settings is None:
+            self._settings.invalidate(lottery_id)
+            return None
+        return copy.deepcopy(settings)
+
+    async def get_prizes(self, lottery_id: str) -> List[dict]:
+        """获取奖品列表（按写入顺序），没有奖品时返回空列表"""
+        prizes = await self._prizes.get_or_load(lottery_id, lambda: self._load_prizes(lottery_id))
+        if not prizes:
+            self._prizes.invalidate(lottery_id)
+        return copy.deepcopy(prizes)
+
+    async def _load_settings(self, lottery_id: str) -> Optional[dict]:
+        db = await MongoDBConnection.get_database()
+        return await db.lottery_settings.find_one({'lottery_id': lottery_id})
+
+    async def _load_prizes(self, lottery_id: str) -> List[dict]:
+        db = await MongoDBConnection.get_database()
+        return await db.prizes.find({'lottery_id': lottery_id}).sort('_id', 1).to_list(None)
+
+    def put(self, lottery_id: str, settings: Optional[dict] = None, prizes: Optional[List[dict]] = None) -> None:
+        """写入刚创建的抽奖数据（需包含数据库生成的 _id）"""
+        if settings is not None:
+            self._settings.set(lottery_id, copy.deepcopy(settings))
+        if prizes is not None:
+            self._prizes.set(lottery_id, copy.deepcopy(prizes))
+
+    def invalidate(self, lottery_id: str) -> None:
+        """使抽奖的设置和奖品缓存失效"""
+        self._settings.invalidate(lottery_id)
+        self._prizes.invalidate(lottery_id)
+        logger.debug(f"抽奖数据缓存已失效: {lottery_id}")
+
+    def stats(self) -> Dict[str, dict]:
+        """各缓存的条目数和命中/未命中次数"""
+        return {
+            cache.name: {'size': len(cache), 'hits': cache.hits, 'misses': cache.misses}
+            for cache in (self._settings, self._prizes)
+        }
+
+
+# 全局抽奖数据缓存实例
+lottery_cache = LotteryDataCache()
@@ -0,0 +1,170 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Tuple
+from bson import Int64
+from pymongo import UpdateOne
+from app.database import MongoDBConnection, get_collection
+from config import (
+    MESSAGE_BUCKET_RETENTION_HOURS,
+    MESSAGE_BUCKET_SECONDS,
+    MESSAGE_COUNT_CACHE_TTL,
+    MESSAGE_COUNT_FLUSH_INTERVAL,
+    MESSAGE_COUNT_FLUSH_SIZE
+)
+from utils import logger
+
+# (group_id, user_id)
+CounterKey = Tuple[str, int]
+
+# 整除一小时时，此前按小时写入的桶仍与新桶对齐
+BUCKET_SECONDS = MESSAGE_BUCKET_SECONDS
+
+
+def bucket_start(value: datetime) -> datetime:
+    """时间所在计数桶的起始时间（UTC）"""
+    seconds = int(value.timestamp())
+    return datetime.fromtimestamp(seconds - seconds % BUCKET_SECONDS, timezone.utc)
+
+
+@dataclass
+class _Counter:
+    # 计数桶起始时间 → 发言数（含未写回的增量）
+    buckets: Dict[datetime, int] = field(default_factory=dict)
+    # 计数桶起始时间 → 尚未写回的增量
+    pending: Dict[datetime, int] = field(default_factory=dict)
+    touched: float = 0.0
+
+
+class MessageCountBuffer:
+    """按 (群组, 用户) 统计的分桶发言计数（每桶 BUCKET_SECONDS 秒），带写缓冲
+
+    每条发言只记一次，所有抽奖共享同一组计数，按各自的 message_check_time 窗口求和。
+    每个 (群组, 用户) 首次出现时从 message_buckets 读取保留期内的桶，之后在内存中累加；
+    增量每隔 MESSAGE_COUNT_FLUSH_INTERVAL 毫秒或累计 MESSAGE_COUNT_FLUSH_SIZE 个
+    脏计数时用一次无序 bulk_write 以 $inc 写回，过期的桶由 TTL 索引删除。
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = MESSAGE_COUNT_FLUSH_INTERVAL / 1000,
+        flush_size: int = MESSAGE_COUNT_FLUSH_SIZE,
+        cache_ttl: float = MESSAGE_COUNT_CACHE_TTL,
+        retention_hours: int = MESSAGE_BUCKET_RETENTION_HOURS
+    ):
+        self._flush_interval = flush_interval
+        self._flush_size = flush_size
+        self._cache_ttl = cache_ttl
+        self._retention = timedelta(hours=retention_hours)
+        self._counters: Dict[CounterKey, _Counter] = {}
+        self._dirty = 0
+        self._flush_event = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+    async def _get(self, group_id, user_id: int) -> _Counter:
+        key = (str(group_id), int(user_id))
+        counter = self._counters.get(key)
+        if counter is None:
+            db = await MongoDBConnection.get_database()
+            oldest = bucket_start(datetime.now(timezone.utc) - self._retention)
+            records = await db.message_buckets.find(
+                {'group_id': key[0], 'user_id': Int64(key[1]), 'bucket': {'$gte': oldest}},
+                {'bucket': 1, 'count': 1, '_id': 0}
+            ).to_list(None)
+            loaded = _Counter(buckets={r['bucket']: r['count'] for r in records})
+            # 并发首次读取时以先写入内存的为准
+            counter = self._counters.setdefault(key, loaded)
+        counter.touched = time.monotonic()
+        return counter
+
+    async def record(self, group_id, user_id: int, message_time: datetime) -> None:
+        """计入一条发言"""
+        counter = await self._get(group_id, user_id)
+        bucket = bucket_start(message_time)
+        counter.buckets[bucket] = counter.buckets.get(bucket, 0) + 1
+        if not counter.pending:
+            self._dirty += 1
+            if self._dirty >= self._flush_size:
+                self._flush_event.set()
+        counter.pending[bucket] = counter.pending.get(bucket, 0) + 1
+
+    async def count(self, group_id, user_id: int, window_start: datetime) -> int:
+        """统计窗口内的发言数
+
+        只对完全落在窗口内的桶求和，不会计入窗口之前的发言；
+        窗口起点所在的桶不计入，最多少计窗口开头不足 BUCKET_SECONDS 秒内的发言。
+        """
+        counter = await self._get(group_id, user_id)
+        return sum(count for bucket, count in counter.buckets.items() if bucket >= window_start)
+
+    async def flush(self) -> int:
+        """将增量写回 message_buckets，返回写入的桶数"""
+        async with self._flush_lock:
+            requests = []
+            flushed = []
+            for (group_id, user_id), counter in self._counters.items():
+                if not counter.pending:
+                    continue
+                for bucket, delta in counter.pending.items():
+                    requests.append(UpdateOne(
+                        {'group_id': group_id, 'user_id': Int64(user_id), 'bucket': bucket},
+                        {
+                            '$inc': {'count': delta},
+                            '$setOnInsert': {'expires_at': bucket + self._retention + timedelta(seconds=BUCKET_SECONDS)}
+                        },
+                        upsert=True
+                    ))
+                flushed.append((counter, counter.pending))
+                counter.pending = {}
+            self._dirty = 0
+
+            if not requests:
+                return 0
+            try:
+                db = await MongoDBConnection.get_database()
+                await get_collection(db, 'message_buckets').bulk_write(requests, ordered=False)
+            except BaseException:
+                # 写回失败（含被取消）时合并回未写回的增量，下次重试
+                for counter, pending in flushed:
+                    if not counter.pending:
+                        self._dirty += 1
+                    for bucket, delta in pending.items():
+                        counter.pending[bucket] = counter.pending.get(bucket, 0) + delta
+                raise
+            return len(requests)
+
+    def _evict_idle(self) -> None:
+        """清理长时间无发言的已写回计数，并丢弃超出保留期的桶"""
+        deadline = time.monotonic() - self._cache_ttl
+        oldest = bucket_start(datetime.now(timezone.utc) - self._retention)
+        counters = {}
+        for key, counter in self._counters.items():
+            if not counter.pending and counter.touched < deadline:
+                continue
+            counter.buckets = {b: c for b, c in counter.buckets.items() if b >= oldest}
+            counters[key] = counter
+        self._counters = counters
+
+    async def run(self) -> None:
+        """定期写回协程"""
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._flush_event.wait(), self._flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_event.clear()
+                # 关闭时本协程会被取消，进行中的写回继续完成，
+                # 之后的最终写回在 _flush_lock 上排队，增量不会丢失也不会重复写入
+                written = await asyncio.shield(self.flush())
+                if written:
+                    logger.debug(f"发言计数已写回: {written} 个计数桶")
+                self._evict_idle()
+            except Exception as e:
+                logger.error(f"写回发言计数时出错: {e}", exc_info=True)
+                await asyncio.sleep(self._flush_interval)
+
+
+# 全局发言计数缓冲实例
+message_count_buffer = MessageCountBuffer()
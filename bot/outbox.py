@@ -0,0 +1,150 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from pymongo import ReturnDocument
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden
+from app.database import MongoDBConnection
+from bot.bot_instance import get_bot
+from bot.dispatcher import message_dispatcher
+from config import (
+    INSTANCE_ID,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_LEASE_SECONDS,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_POLL_INTERVAL
+)
+from utils import logger
+
+# 有新消息写入时唤醒本实例的投递协程
+_outbox_event = asyncio.Event()
+
+
+def build_outbox_docs(lottery_id: str, kind: str, messages: List[dict], now: datetime) -> List[dict]:
+    """将待发送消息转换为发件箱记录
+
+    Args:
+        lottery_id: 抽奖ID
+        kind: 消息类型（winner: 中奖私信, result: 群组开奖结果）
+        messages: 包含 chat_id 及 send_message 参数的消息列表
+        now: 写入时间
+    """
+    docs = []
+    for message in messages:
+        payload = dict(message)
+        chat_id = payload.pop('chat_id')
+        docs.append({
+            'lottery_id': lottery_id,
+            'kind': kind,
+            'chat_id': chat_id,
+            'payload': payload,
+            'status': 'pending',
+            'attempts': 0,
+            'next_attempt_at': now,
+            'created_at': now,
+            'updated_at': now
+        })
+    return docs
+
+
+def notify_outbox() -> None:
+    """通知本实例的投递协程有新消息"""
+    _outbox_event.set()
+
+
+async def claim_messages(db, limit: int = OUTBOX_BATCH_SIZE) -> List[dict]:
+    """领取一批待发送消息（待发送或租约已过期），并记录本实例的租约"""
+    claimed = []
+    for _ in range(limit):
+        now = datetime.now(timezone.utc)
+        doc = await db.outbox.find_one_and_update(
+            {
+                '$or': [
+                    {'status': 'pending', 'next_attempt_at': {'$lte': now}},
+                    {'status': 'sending', 'lease_expires_at': {'$lt': now}}
+                ]
+            },
+            {
+                '$set': {
+                    'status': 'sending',
+                    'lease_owner': INSTANCE_ID,
+                    'lease_expires_at': now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+                    'updated_at': now
+                },
+                '$inc': {'attempts': 1}
+            },
+            sort=[('next_attempt_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if not doc:
+            break
+        claimed.append(doc)
+    return claimed
+
+
+async def deliver_message(db, doc: dict) -> bool:
+    """发送一条发件箱消息并更新投递状态"""
+    payload = dict(doc['payload'])
+    error: Optional[Exception] = None
+    try:
+        if payload.get('reply_markup'):
+            payload['reply_markup'] = InlineKeyboardMarkup.de_json(payload['reply_markup'], get_bot())
+        await message_dispatcher.send_message(chat_id=doc['chat_id'], **payload)
+    except Exception as e:
+        error = e
+
+    now = datetime.now(timezone.utc)
+    owned = {'_id': doc['_id'], 'lease_owner': INSTANCE_ID}
+    if error is None:
+        await db.outbox.update_one(
+            owned,
+            {'$set': {'status': 'delivered', 'delivered_at': now, 'updated_at': now},
+             '$unset': {'lease_owner': '', 'lease_expires_at': ''}}
+        )
+        return True
+
+    # 用户封禁机器人、会话不存在等错误重试也无法成功
+    permanent = isinstance(error, (Forbidden, BadRequest))
+    if permanent or doc['attempts'] >= OUTBOX_MAX_ATTEMPTS:
+        logger.error(f"发件箱消息 {doc['_id']} 发送到 {doc['chat_id']} 失败，不再重试: {error}")
+        update = {'status': 'failed', 'last_error': str(error), 'updated_at': now}
+    else:
+        delay = min(30 * 2 ** doc['attempts'], 3600)
+        logger.warning(f"发件箱消息 {doc['_id']} 发送到 {doc['chat_id']} 失败，{delay}秒后重试: {error}")
+        update = {
+            'status': 'pending',
+            'next_attempt_at': now + timedelta(seconds=delay),
+            'last_error': str(error),
+            'updated_at': now
+        }
+    await db.outbox.update_one(
+        owned,
+        {'$set': update, '$unset': {'lease_owner': '', 'lease_expires_at': ''}}
+    )
+    return False
+
+
+async def outbox_worker():
+    """发件箱投递协程：批量领取消息并发送，至少投递一次"""
+    while True:
+        try:
+            db = await MongoDBConnection.get_database()
+            _outbox_event.clear()
+            batch = await claim_messages(db)
+            if not batch:
+                try:
+                    await asyncio.wait_for(_outbox_event.wait(), OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            results = await asyncio.gather(
+                *(deliver_message(db, doc) for doc in batch),
+                return_exceptions=True
+            )
+            delivered = sum(1 for r in results if r is True)
+            logger.info(f"发件箱投递完成: 成功 {delivered}/{len(batch)}")
+
+        except Exception as e:
+            logger.error(f"发件箱投递时出错: {e}", exc_info=True)
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL)
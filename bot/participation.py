@@ -0,0 +1,252 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+from bson import Int64
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from app.database import MongoDBConnection
+from utils import logger
+from .bot_instance import get_bot
+from .chat_cache import chat_cache
+from .lottery_cache import lottery_cache
+from .message_counter import message_count_buffer
+from .verification import membership_verifier
+
+# 参与来源
+SOURCE_BUTTON = 'button'    # 抽奖列表按钮、/start join_ 链接
+SOURCE_KEYWORD = 'keyword'  # 群组中发送关键词
+SOURCE_MESSAGE = 'message'  # 群组中发言达到数量
+
+# 参与结果
+JOINED = 'joined'
+ALREADY_JOINED = 'already_joined'
+NOT_FOUND = 'not_found'
+NOT_ACTIVE = 'not_active'
+FULL = 'full'
+USERNAME_REQUIRED = 'username_required'
+GROUP_REQUIRED = 'group_required'
+KEYWORD_REQUIRED = 'keyword_required'
+MESSAGES_REQUIRED = 'messages_required'
+
+@dataclass
+class JoinResult:
+    status: str
+    settings: Optional[dict] = None
+    # 参与成功后的参与人数
+    participant_count: int = 0
+    # 未加入的群组（GROUP_REQUIRED）
+    group_id: Optional[str] = None
+
+    @property
+    def joined(self) -> bool:
+        return self.status == JOINED
+
+
+async def increment_participant_count(db, lottery_id: str) -> int:
+    """参与人数 +1，返回最新的参与人数"""
+    lottery = await db.lotteries.find_one_and_update(
+        {'id': lottery_id},
+        {'$inc': {'participant_count': 1}},
+        projection={'participant_count': 1, '_id': 0},
+        return_document=ReturnDocument.AFTER
+    )
+    return lottery.get('participant_count', 0) if lottery else 0
+
+
+async def check_user_messages(user_id: int, group_id: str, required_count: int, check_hours: int) -> bool:
+    """检查用户在群组中最近 check_hours 小时内的发言数量
+
+    按计数桶统计，窗口起点所在的桶不计入：不会把窗口之前的发言算进来，
+    但最多少计窗口开头不足 MESSAGE_BUCKET_SECONDS 秒内的发言。
+
+    Args:
+        user_id: 用户ID
+        group_id: 群组ID
+        required_count: 要求的发言数量
+        check_hours: 检查时间范围(小时)
+
+    Returns:
+        bool: 是否满足发言要求
+    """
+    try:
+        check_start_time = datetime.now(timezone.utc) - timedelta(hours=check_hours)
+        message_count = await message_count_buffer.count(group_id, user_id, check_start_time)
+        return message_count >= required_count
+
+    except Exception as e:
+        logger.error(f"检查用户发言数量时出错: {e}", exc_info=True)
+        return False
+
+
+async def check_keyword_message(bot, user_id: int, group_id: str, keyword: str) -> bool:
+    """检查用户是否在群组发送过关键词"""
+    try:
+        current_time = datetime.now()
+        check_time = current_time - timedelta(hours=1)  # 检查最近1小时
+
+        async for message in bot.get_chat_history(
+            chat_id=group_id,
+            offset_date=check_time,
+            limit=1000
+        ):
+            if (message.from_user and
+                message.from_user.id == user_id and
+                message.text and
+                message.text.strip() == keyword):
+                return True
+
+        return False
+    except Exception as e:
+        logger.error(f"检查关键词发送记录时出错: {e}")
+        return False
+
+
+class ParticipationService:
+    """参与抽奖的统一入口（按钮、/start 链接、群组关键词、群组发言）
+
+    - 抽奖设置优先使用调用方传入的快照（如群组索引），否则读取抽奖数据缓存
+    - 人数限制使用 lotteries 中反规范化的 participant_count，和状态一起查询
+    - 不预先查询是否已参与，直接写入参与记录，由 (lottery_id, user_id) 唯一索引去重，
+      DuplicateKeyError 即已参与；条件检查未通过时才补查一次，优先提示已参与
+    """
+
+    def __init__(self, bot_getter=get_bot):
+        self._bot_getter = bot_getter
+
+    async def join(self, lottery_id: str, user, source: str = SOURCE_BUTTON, settings: Optional[dict] = None) -> JoinResult:
+        """检查参与条件并写入参与记录
+
+        Args:
+            lottery_id: 抽奖ID
+            user: Telegram 用户
+            source: 参与来源（SOURCE_*），群组来源已满足对应的关键词/发言条件
+            settings: 抽奖设置快照，为空时从抽奖数据缓存读取
+
+        Returns:
+            JoinResult: 参与结果，数据库错误时抛出异常
+        """
+        db = await MongoDBConnection.get_database()
+        if settings is None:
+            settings = await lottery_cache.get_settings(lottery_id)
+            if not settings:
+                return JoinResult(NOT_FOUND)
+
+        # 检查抽奖状态和人数限制
+        lottery = await db.lotteries.find_one(
+            {'id': lottery_id},
+            {'status': 1, 'participant_count': 1, '_id': 0}
+        )
+        if not lottery or lottery['status'] != 'active':
+            return JoinResult(NOT_ACTIVE, settings)
+        required_count = settings.get('participant_count')
+        if required_count and lottery.get('participant_count', 0) >= required_count:
+            return await self._rejected(db, lottery_id, user, JoinResult(FULL, settings))
+
+        # 检查用户名要求
+        if settings.get('require_username') and not user.username:
+            return await self._rejected(db, lottery_id, user, JoinResult(USERNAME_REQUIRED, settings))
+
+        # 检查发言要求（内存计数），发言来源已由调用方检查
+        if (source != SOURCE_MESSAGE and settings.get('message_group_id')
+                and settings.get('message_count') and settings.get('message_check_time')):
+            if not await check_user_messages(
+                user.id,
+                settings['message_group_id'],
+                settings['message_count'],
+                settings['message_check_time']
+            ):
+                return await self._rejected(db, lottery_id, user, JoinResult(MESSAGES_REQUIRED, settings))
+
+        # 检查群组要求（并发验证）
+        missing_group = await membership_verifier.first_missing_group(settings.get('required_groups') or [], user.id)
+        if missing_group:
+            return await self._rejected(
+                db, lottery_id, user, JoinResult(GROUP_REQUIRED, settings, group_id=missing_group)
+            )
+
+        # 检查关键词要求，关键词来源本身就是发送了关键词
+        if source == SOURCE_BUTTON and settings.get('keyword_group_id') and settings.get('keyword'):
+            if not await check_keyword_message(
+                self._bot_getter(),
+                user.id,
+                settings['keyword_group_id'],
+                settings['keyword']
+            ):
+                return await self._rejected(db, lottery_id, user, JoinResult(KEYWORD_REQUIRED, settings))
+
+        # 添加参与记录
+        now = datetime.now(timezone.utc)
+        try:
+            await db.participants.insert_one({
+                'lottery_id': lottery_id,
+                'user_id': Int64(user.id),
+                'nickname': user.full_name,
+                'username': user.username,
+                'status': 'active',
+                'join_time': now,
+                'created_at': now
+            })
+        except DuplicateKeyError:
+            return JoinResult(ALREADY_JOINED, settings)
+
+        current_count = await increment_participant_count(db, lottery_id)
+
+        # 满人开奖
+        from bot.lottery import trigger_draw_if_full
+        trigger_draw_if_full(self._bot_getter(), lottery_id, current_count, settings)
+        return JoinResult(JOINED, settings, participant_count=current_count)
+
+    async def _rejected(self, db, lottery_id: str, user, result: JoinResult) -> JoinResult:
+        """条件未满足时确认是否已参与（已参与的用户不提示条件）"""
+        participant = await db.participants.find_one(
+            {'lottery_id': lottery_id, 'user_id': Int64(user.id)},
+            {'_id': 1}
+        )
+        return JoinResult(ALREADY_JOINED, result.settings) if participant else result
+
+    async def failure_reply(self, result: JoinResult) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """参与失败的提示文本和按钮"""
+        settings = result.settings or {}
+        if result.status == ALREADY_JOINED:
+            return "❌ 你已经参与过这个抽奖了", None
+        if result.status == NOT_FOUND:
+            return "❌ 抽奖活动不存在", None
+        if result.status == NOT_ACTIVE:
+            return "❌ 该抽奖活动已结束或暂停", None
+        if result.status == FULL:
+            return "❌ 抽奖参与人数已满", None
+        if result.status == USERNAME_REQUIRED:
+            return "❌ 参与失败：请先设置用户名后再参与抽奖", None
+        if result.status == GROUP_REQUIRED:
+            try:
+                chat = await chat_cache.get(result.group_id)
+            except Exception as e:
+                logger.error(f"获取群组 {result.group_id} 信息失败: {e}")
+                return f"❌ 需要先加入群组 {result.group_id}", None
+            keyboard = [[InlineKeyboardButton(
+                "👉 加入群组",
+                url=f"https://t.me/{chat.username}"
+            )]] if chat.username else []
+            return f"❌ 需要先加入群组 {chat.title}", InlineKeyboardMarkup(keyboard)
+        if result.status == KEYWORD_REQUIRED:
+            title = await self._chat_title(settings['keyword_group_id'])
+            return f"❌ 请先在群组 {title} 中发送关键词：{settings['keyword']}", None
+        if result.status == MESSAGES_REQUIRED:
+            title = await self._chat_title(settings['message_group_id'])
+            return (
+                f"❌ 需要在群组 {title} 中最近 {settings['message_check_time']} 小时内发言 {settings['message_count']} 条\n"
+                "💡 提示：只统计文本消息"
+            ), None
+        return "❌ 参与失败，请稍后重试", None
+
+    async def _chat_title(self, chat_id) -> str:
+        try:
+            return (await chat_cache.get(chat_id)).title
+        except Exception as e:
+            logger.error(f"获取群组 {chat_id} 信息失败: {e}")
+            return str(chat_id)
+
+
+# 全局参与抽奖服务实例
+participation_service = ParticipationService()
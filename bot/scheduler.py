@@ -0,0 +1,90 @@
+import asyncio
+import heapq
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from app.database import MongoDBConnection
+from utils import logger
+
+
+class DrawScheduler:
+    """定时开奖调度器
+
+    用最小堆保存所有待开奖的截止时间，调度循环只在最近的截止时间醒来；
+    取消或修改开奖时间时采用惰性删除，过期的堆元素在出堆时丢弃。
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, str]] = []
+        self._deadlines: Dict[str, float] = {}
+        self._wakeup = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def schedule(self, lottery_id: str, draw_time: datetime) -> None:
+        """登记（或更新）抽奖的开奖时间"""
+        deadline = draw_time.timestamp()
+        if self._deadlines.get(lottery_id) == deadline:
+            return
+        self._deadlines[lottery_id] = deadline
+        heapq.heappush(self._heap, (deadline, lottery_id))
+        self._wakeup.set()
+        logger.debug(f"已登记抽奖 {lottery_id} 的开奖时间: {draw_time}")
+
+    def unschedule(self, lottery_id: str) -> None:
+        """移除抽奖的开奖时间（取消、已开奖等情况）"""
+        if self._deadlines.pop(lottery_id, None) is not None:
+            logger.debug(f"已移除抽奖 {lottery_id} 的开奖时间")
+
+    def next_deadline(self) -> Optional[float]:
+        """获取最近的有效截止时间"""
+        while self._heap:
+            deadline, lottery_id = self._heap[0]
+            if self._deadlines.get(lottery_id) == deadline:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now: Optional[float] = None) -> List[str]:
+        """取出所有已到期的抽奖 ID"""
+        if now is None:
+            now = datetime.now(timezone.utc).timestamp()
+        due = []
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > now:
+                break
+            _, lottery_id = heapq.heappop(self._heap)
+            del self._deadlines[lottery_id]
+            due.append(lottery_id)
+        return due
+
+    async def wait(self, timeout: Optional[float]) -> None:
+        """等待到超时或有新的开奖时间登记"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def load(self) -> int:
+        """从数据库重建调度堆，返回登记的抽奖数量"""
+        db = await MongoDBConnection.get_database()
+        lotteries = await db.lotteries.find(
+            {
+                'status': 'active',
+                'settings.draw_method': 'draw_at_time',
+                'settings.draw_time': {'$ne': None}
+            },
+            {'id': 1, 'settings.draw_time': 1, '_id': 0}
+        ).to_list(None)
+
+        self._heap = [(lottery['settings']['draw_time'].timestamp(), lottery['id']) for lottery in lotteries]
+        heapq.heapify(self._heap)
+        self._deadlines = {lottery_id: deadline for deadline, lottery_id in self._heap}
+        self._wakeup.set()
+        return len(self._deadlines)
+
+
+# 全局调度器实例
+draw_scheduler = DrawScheduler()
@@ -1,12 +1,22 @@
 import asyncio
 from datetime import datetime, timedelta, timezone
+import pymongo
 from utils import logger
 from bot.bot_instance import get_bot
-from bot.lottery import draw_lottery
+from bot.lottery import trigger_draw
+from bot.scheduler import draw_scheduler
+from bot.lottery_cache import lottery_cache
 from app.database import MongoDBConnection
+from config import DRAW_RECONCILE_INTERVAL, MONGO_MAINTENANCE_TIMEOUT_SECONDS
 
 async def check_lottery_draws():
-    """检查并执行需要开奖的抽奖活动"""
+    """按开奖截止时间调度执行开奖（各实例均运行，开奖由数据库领取保证只执行一次）"""
+    # 启动时载入已有的定时开奖，之后由本实例创建/取消抽奖时维护，领导者对账时全量同步
+    try:
+        await draw_scheduler.load()
+    except Exception as e:
+        logger.error(f"载入开奖调度时出错: {e}", exc_info=True)
+
     while True:
         try:
             bot = get_bot()
@@ -14,133 +24,94 @@ async def check_lottery_draws():
                 logger.warning("机器人实例不可用，等待1分钟后重试")
                 await asyncio.sleep(60)
                 continue
-                
-            try:
-                # 尝试获取机器人信息来检查是否在运行
-                await bot.get_me()
-            except Exception as e:
-                logger.error(f"机器人未响应: {e}")
-                await asyncio.sleep(60)
-                continue
 
-            current_time = datetime.now(timezone.utc)
-            db = await MongoDBConnection.get_database()
-            # 1. 查找定时开奖的抽奖
-            pipeline_time = [
-                {
-                    '$match': {
-                        'status': 'active'
-                    }
-                },
-                {
-                    '$lookup': {
-                        'from': 'lottery_settings',
-                        'localField': 'id',
-                        'foreignField': 'lottery_id',
-                        'as': 'settings'
-                    }
-                },
-                {
-                    '$unwind': '$settings'
-                },
-                {
-                    '$match': {
-                        'settings.draw_method': 'draw_at_time',
-                        'settings.draw_time': {'$lte': current_time}
-                    }
-                },
-                {
-                    '$project': {
-                        'id': 1,
-                        'title': '$settings.title'
-                    }
-                }
-            ]
-            time_draws = await db.lotteries.aggregate(pipeline_time).to_list(None)
-
-            # 2. 查找满人开奖的抽奖
-            pipeline_full = [
-                {
-                    '$match': {
-                        'status': 'active'
-                    }
-                },
-                {
-                    '$lookup': {
-                        'from': 'lottery_settings',
-                        'localField': 'id',
-                        'foreignField': 'lottery_id',
-                        'as': 'settings'
-                    }
-                },
-                {
-                    '$unwind': '$settings'
-                },
-                {
-                    '$match': {
-                        'settings.draw_method': 'draw_when_full'
-                    }
-                },
-                {
-                    '$lookup': {
-                        'from': 'participants',
-                        'localField': 'id',
-                        'foreignField': 'lottery_id',
-                        'pipeline': [{'$count': 'count'}],
-                        'as': 'participant_count'
-                    }
-                },
-                {
-                    '$match': {
-                        '$expr': {
-                            '$gte': [
-                                {'$first': '$participant_count.count'},
-                                '$settings.participant_count'
-                            ]
-                        }
-                    }
-                },
-                {
-                    '$project': {
-                        'id': 1,
-                        'title': '$settings.title',
-                        'required_count': '$settings.participant_count',
-                        'current_count': {'$first': '$participant_count.count'}
-                    }
-                }
-            ]
-            full_draws = await db.lotteries.aggregate(pipeline_full).to_list(None)
-
-            # 处理定时开奖
-            for lottery in time_draws:
-                try:
-                    logger.info(f"执行定时开奖: {lottery['title']} (ID: {lottery['id']})")
-                    await draw_lottery(bot, lottery['id'])
-                    logger.info(f"定时开奖完成: {lottery['title']}")
-                except Exception as e:
-                    logger.error(f"执行定时开奖 {lottery['title']} 时出错: {e}", exc_info=True)
-
-            # 处理满人开奖
-            for lottery in full_draws:
-                try:
-                    logger.info(
-                        f"执行满人开奖: {lottery['title']} "
-                        f"(ID: {lottery['id']}, "
-                        f"参与人数: {lottery['current_count']}/{lottery['required_count']})"
-                    )
-                    await draw_lottery(bot, lottery['id'])
-                    logger.info(f"满人开奖完成: {lottery['title']}")
-                except Exception as e:
-                    logger.error(f"执行满人开奖 {lottery['title']} 时出错: {e}", exc_info=True)
+            # 执行所有已到期的定时开奖
+            due_ids = draw_scheduler.pop_due()
+            if due_ids:
+                await asyncio.gather(*(run_timed_draw(bot, lottery_id) for lottery_id in due_ids))
+
+            # 睡眠到最近的开奖时间或有新的开奖时间登记
+            deadline = draw_scheduler.next_deadline()
+            timeout = None
+            if deadline is not None:
+                timeout = max(deadline - datetime.now(timezone.utc).timestamp(), 0)
+            await draw_scheduler.wait(timeout)
 
-            # 清理过期抽奖记录
-            await cleanup_old_lotteries()
-            await asyncio.sleep(60)
-            
         except Exception as e:
             logger.error(f"检查抽奖任务时出错: {e}", exc_info=True)
             await asyncio.sleep(60)
 
+async def run_timed_draw(bot, lottery_id: str):
+    """执行单个定时开奖"""
+    try:
+        logger.info(f"执行定时开奖: {lottery_id}")
+        await trigger_draw(bot, lottery_id)
+        logger.info(f"定时开奖完成: {lottery_id}")
+    except Exception as e:
+        logger.error(f"执行定时开奖 {lottery_id} 时出错: {e}", exc_info=True)
+
+async def reconcile_lottery_draws_periodically():
+    """定期执行开奖对账和过期记录清理（仅由领导者实例运行）"""
+    while True:
+        try:
+            bot = get_bot()
+            if bot:
+                await reconcile_lottery_draws(bot)
+            else:
+                logger.warning("机器人实例不可用，跳过本次开奖对账")
+        except Exception as e:
+            logger.error(f"开奖对账任务出错: {e}", exc_info=True)
+        await asyncio.sleep(DRAW_RECONCILE_INTERVAL)
+
+async def reconcile_lottery_draws(bot):
+    """对账扫描：重建开奖调度堆，处理满人开奖并清理过期记录"""
+    try:
+        count = await draw_scheduler.load()
+        logger.info(f"开奖调度已同步，待开奖抽奖数: {count}")
+
+        db = await MongoDBConnection.get_database()
+        # 查找满人开奖的抽奖
+        full_draws = await db.lotteries.find(
+            {
+                'status': 'active',
+                'settings.draw_method': 'draw_when_full',
+                '$expr': {
+                    '$gte': [
+                        {'$ifNull': ['$participant_count', 0]},
+                        '$settings.participant_count'
+                    ]
+                }
+            },
+            {'id': 1, 'participant_count': 1, 'settings.title': 1, 'settings.participant_count': 1, '_id': 0}
+        ).to_list(None)
+
+        # 兜底处理漏触发的满人开奖（正常情况下参与时已立即触发）
+        for lottery in full_draws:
+            logger.warning(
+                f"对账发现未开奖的满人抽奖: {lottery['settings']['title']} "
+                f"(ID: {lottery['id']}, "
+                f"参与人数: {lottery.get('participant_count', 0)}/{lottery['settings']['participant_count']})"
+            )
+            trigger_draw(bot, lottery['id'])
+
+        # 接管开奖租约已过期的抽奖（开奖实例崩溃或失联）
+        stale_draws = await db.lotteries.find(
+            {
+                'status': 'drawing',
+                'draw_lease_expires_at': {'$lt': datetime.now(timezone.utc)}
+            },
+            {'id': 1, 'draw_owner': 1}
+        ).to_list(None)
+        for lottery in stale_draws:
+            logger.warning(f"抽奖 {lottery['id']} 的开奖租约已过期 (原实例: {lottery.get('draw_owner')})，重新开奖")
+            trigger_draw(bot, lottery['id'])
+
+        # 清理过期抽奖记录
+        await cleanup_old_lotteries()
+
+    except Exception as e:
+        logger.error(f"开奖对账扫描时出错: {e}", exc_info=True)
+
 async def cleanup_old_lotteries():
     """清理过期的抽奖记录"""
     try:
@@ -150,57 +121,32 @@ async def cleanup_old_lotteries():
         
 
         # 获取需要清理的抽奖
-        pipeline = [
+        old_lotteries = await db.lotteries.find(
             {
-                '$match': {
-                    'status': {'$in': ['completed', 'cancelled']},
-                    'updated_at': {'$lt': one_day_ago}
-                }
+                'status': {'$in': ['completed', 'cancelled']},
+                'updated_at': {'$lt': one_day_ago}
             },
-            {
-                # 先获取基本信息
-                '$project': {
-                    'id': 1,
-                    'status': 1,
-                    'updated_at': 1
-                }
-            }
-        ]
-        
-        
-        old_lotteries = await db.lotteries.aggregate(pipeline).to_list(None)
+            {'id': 1, 'status': 1, 'settings.title': 1}
+        ).to_list(None)
 
         
         for lottery in old_lotteries:
             
             try:
                 lottery_id = lottery['id']
-                pipe = [
-                    {
-                        '$match': {
-                            'lottery_id': lottery_id,
-                        }
-                    },
-                    {
-                        '$project': {
-                            'title': 1
-                        }
-                    }
-                ]
-                title = await db.lottery_settings.find_one(pipe)
-                if title:
-                    title = title['title']
-                else:
-                    title = None
-
-                # 删除相关记录
-                delete_results = await asyncio.gather(
-                    db.prize_winners.delete_many({'lottery_id': lottery_id}),
-                    db.participants.delete_many({'lottery_id': lottery_id}),
-                    db.prizes.delete_many({'lottery_id': lottery_id}),
-                    db.lottery_settings.delete_many({'lottery_id': lottery_id}),
-                    db.lotteries.delete_one({'id': lottery_id})
-                )
+                title = lottery.get('settings', {}).get('title')
+
+                # 删除相关记录（大型抽奖的参与记录删除耗时可能远超 MONGO_TIMEOUT_MS）
+                with pymongo.timeout(MONGO_MAINTENANCE_TIMEOUT_SECONDS):
+                    delete_results = await asyncio.gather(
+                        db.prize_winners.delete_many({'lottery_id': lottery_id}),
+                        db.participants.delete_many({'lottery_id': lottery_id}),
+                        db.prizes.delete_many({'lottery_id': lottery_id}),
+                        db.lottery_settings.delete_many({'lottery_id': lottery_id}),
+                        db.lotteries.delete_one({'id': lottery_id}),
+                        db.outbox.delete_many({'lottery_id': lottery_id, 'status': {'$in': ['delivered', 'failed']}})
+                    )
+                lottery_cache.invalidate(lottery_id)
                 
                 # 记录删除结果
                 logger.info(
@@ -209,7 +155,8 @@ async def cleanup_old_lotteries():
                     f"- 参与记录: {delete_results[1].deleted_count}\n"
                     f"- 奖品记录: {delete_results[2].deleted_count}\n"
                     f"- 设置记录: {delete_results[3].deleted_count}\n"
-                    f"- 抽奖记录: {delete_results[4].deleted_count}"
+                    f"- 抽奖记录: {delete_results[4].deleted_count}\n"
+                    f"- 发件箱记录: {delete_results[5].deleted_count}"
                 )
                 
             except Exception as e:
@@ -1,7 +1,73 @@
+import asyncio
 from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional
 from telegram.ext import ContextTypes
 from utils import logger
-from app.database import MongoDBConnection
+from app.cache import AsyncTTLCache
+from app.database import MongoDBConnection, get_collection
+from bot.bot_instance import get_bot
+from config import MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_CACHE_TTL
+
+
+def is_member_status(member) -> bool:
+    """成员状态是否算作已加入（受限成员仍在群内时也算）"""
+    if member.status in ('member', 'administrator', 'creator'):
+        return True
+    return member.status == 'restricted' and bool(getattr(member, 'is_member', False))
+
+
+class MembershipVerifier:
+    """参与条件中的群组/频道成员验证
+
+    所有群组并发调用 get_chat_member，一次验证的耗时约等于一次 Bot API 往返；
+    已加入的结果按 (群组, 用户) 缓存 MEMBERSHIP_CACHE_TTL 秒，未加入的结果不缓存，
+    收到 chat_member 更新时失效。
+    """
+
+    def __init__(
+        self,
+        bot_getter: Callable = get_bot,
+        maxsize: int = MEMBERSHIP_CACHE_SIZE,
+        ttl: float = MEMBERSHIP_CACHE_TTL
+    ):
+        self._bot_getter = bot_getter
+        self._cache = AsyncTTLCache(maxsize, ttl, name='membership')
+
+    async def is_member(self, chat_id, user_id: int) -> bool:
+        """用户是否已加入群组/频道，无法验证（如机器人不在群内）时按已加入处理"""
+        key = (str(chat_id), int(user_id))
+        try:
+            joined = await self._cache.get_or_load(key, lambda: self._fetch(chat_id, user_id))
+        except Exception as e:
+            logger.error(f"检查用户 {user_id} 在 {chat_id} 的成员状态时出错: {e}")
+            return True
+        if not joined:
+            self._cache.invalidate(key)
+        return joined
+
+    async def _fetch(self, chat_id, user_id: int) -> bool:
+        bot = self._bot_getter()
+        if not bot:
+            raise RuntimeError("机器人实例未初始化")
+        return is_member_status(await bot.get_chat_member(chat_id, user_id))
+
+    async def first_missing_group(self, group_ids: Iterable, user_id: int) -> Optional[str]:
+        """并发验证所有群组，返回第一个（按配置顺序）未加入的群组，全部已加入时返回 None"""
+        group_ids = [g for g in group_ids if g and str(g).strip()]
+        if not group_ids:
+            return None
+        results = await asyncio.gather(*(self.is_member(g, user_id) for g in group_ids))
+        for group_id, joined in zip(group_ids, results):
+            if not joined:
+                return group_id
+        return None
+
+    def invalidate(self, chat_id, user_id: int) -> None:
+        self._cache.invalidate((str(chat_id), int(user_id)))
+
+
+# 全局成员验证实例
+membership_verifier = MembershipVerifier()
 
 
 async def check_channel_subscription(bot, user_id: int, channel_id: str = '@yangshyyds') -> bool:
@@ -30,13 +96,11 @@ async def check_lottery_creation(context: ContextTypes.DEFAULT_TYPE):
             return
             
         now = datetime.now(timezone.utc)
-        created_at = lottery['created_at']
-        created_at = created_at.replace(tzinfo=timezone.utc)
         time_diff = (now - lottery['created_at']).total_seconds()
         
         if lottery['status'] == 'draft':
             # 如果仍然是草稿状态，更新记录状态为 cancelled
-            await db.lotteries.update_one(
+            await get_collection(db, 'lotteries').update_one(
                 {'id': lottery_id},
                 {
                     '$set': {
@@ -52,7 +116,7 @@ async def check_lottery_creation(context: ContextTypes.DEFAULT_TYPE):
             )
             
         elif lottery['status'] == 'creating' and time_diff > 5400:  # 超过90分钟
-            await db.lotteries.update_one(
+            await get_collection(db, 'lotteries').update_one(
                 {'id': lottery_id},
                 {
                     '$set': {
@@ -99,9 +163,7 @@ async def check_lottery_status(lottery_id: str, user_id: str) -> dict:
             
         # 计算时间差
         now = datetime.now(timezone.utc)
-        created_at = lottery['created_at']
-        created_at = created_at.replace(tzinfo=timezone.utc)
-        time_diff = (now - created_at).total_seconds()
+        time_diff = (now - lottery['created_at']).total_seconds()
         
         # 验证创建者
         if str(lottery['creator_id']) != str(user_id):
@@ -120,7 +182,7 @@ async def check_lottery_status(lottery_id: str, user_id: str) -> dict:
         # 检查是否超时（60分钟）
         if time_diff > 3600 and lottery['status'] == 'draft':
             # 更新过期记录状态为 cancelled
-            await db.lotteries.update_one(
+            await get_collection(db, 'lotteries').update_one(
                 {'id': lottery_id},
                 {
                     '$set': {
@@ -137,7 +199,7 @@ async def check_lottery_status(lottery_id: str, user_id: str) -> dict:
             
         if time_diff < 3600 and lottery['status'] == 'draft':
             # 更新状态为 creating
-            await db.lotteries.update_one(
+            await get_collection(db, 'lotteries').update_one(
                 {'id': lottery_id},
                 {
                     '$set': {
@@ -1,4 +1,6 @@
 import os
+import socket
+import uuid
 from pathlib import Path
 from fastapi.templating import Jinja2Templates
 from dotenv import load_dotenv
@@ -25,6 +27,19 @@ YOUR_BOT = os.getenv('YOUR_BOT')
 MONGO_DB = os.getenv('MONGO_DB')
 MONGO_URI = os.getenv('MONGO_URI')
 
+# MongoDB 连接池配置
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 10))  # 启动时预热并保持的连接数
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 300000))  # 空闲连接关闭时间（毫秒）
+MONGO_COMPRESSORS = os.getenv('MONGO_COMPRESSORS', 'zstd,snappy,zlib')  # 按顺序与服务器协商，未安装的压缩库会被忽略
+MONGO_TIMEOUT_MS = int(os.getenv('MONGO_TIMEOUT_MS', 5000))  # 单次操作总超时（CSOT，含等待连接池、重试）
+MONGO_MAINTENANCE_TIMEOUT_SECONDS = int(os.getenv('MONGO_MAINTENANCE_TIMEOUT_SECONDS', 600))  # 维护操作（过期清理、参与人数修复）的超时，覆盖 MONGO_TIMEOUT_MS
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 10000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 10000))
+
+# 时间显示配置（数据库中统一存储 UTC）
+DISPLAY_TIMEZONE = os.getenv('DISPLAY_TIMEZONE', 'UTC')  # IANA 时区名，如 Asia/Shanghai
+
 # 媒体文件配置
 MEDIA_ROOT = BASE_DIR / 'media'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4'}
@@ -36,3 +51,53 @@ JOB_QUEUE_WORKERS = 4  # 工作线程数
 # 域名配置
 YOUR_DOMAIN = os.getenv('YOUR_DOMAIN')
 
+
+# 开奖调度配置
+DRAW_RECONCILE_INTERVAL = int(os.getenv('DRAW_RECONCILE_INTERVAL', 600))  # 对账扫描间隔（秒）
+DRAW_LEASE_SECONDS = int(os.getenv('DRAW_LEASE_SECONDS', 300))  # 开奖租约时长（秒），超时后可被其他实例接管
+LEADER_LEASE_SECONDS = int(os.getenv('LEADER_LEASE_SECONDS', 30))  # 领导者租约时长（秒），即故障转移的最长等待时间
+
+# 群组消息参与配置
+GROUP_INDEX_REFRESH_INTERVAL = int(os.getenv('GROUP_INDEX_REFRESH_INTERVAL', 60))  # 群组索引全量同步间隔（秒）
+KEYWORD_CONTAINS_MATCH = os.getenv('KEYWORD_CONTAINS_MATCH', 'false').lower() in ('true', '1', 'yes')  # 消息包含关键词即可参与
+MESSAGE_COUNT_FLUSH_INTERVAL = int(os.getenv('MESSAGE_COUNT_FLUSH_INTERVAL', 1000))  # 发言计数写回间隔（毫秒）
+MESSAGE_COUNT_FLUSH_SIZE = int(os.getenv('MESSAGE_COUNT_FLUSH_SIZE', 500))  # 累计多少条脏计数时立即写回
+MESSAGE_COUNT_CACHE_TTL = int(os.getenv('MESSAGE_COUNT_CACHE_TTL', 600))  # 无发言的计数在内存中保留的时间（秒）
+MESSAGE_BUCKET_RETENTION_HOURS = int(os.getenv('MESSAGE_BUCKET_RETENTION_HOURS', 168))  # 计数桶保留时长，即发言统计窗口上限（小时）
+GROUP_JOINED_CACHE_SIZE = int(os.getenv('GROUP_JOINED_CACHE_SIZE', 50000))  # 已参与发言数量抽奖的 (抽奖, 用户) 缓存，达标后不再重复查询
+GROUP_JOINED_CACHE_TTL = int(os.getenv('GROUP_JOINED_CACHE_TTL', 3600))  # 秒
+MESSAGE_BUCKET_SECONDS = int(os.getenv('MESSAGE_BUCKET_SECONDS', 300))  # 计数桶粒度（秒，需整除3600），窗口起点的统计误差不超过一个桶
+
+# 聊天信息缓存配置
+CHAT_CACHE_SIZE = int(os.getenv('CHAT_CACHE_SIZE', 10000))
+CHAT_CACHE_TTL = int(os.getenv('CHAT_CACHE_TTL', 3600))  # 秒
+CHAT_STORE_TTL = int(os.getenv('CHAT_STORE_TTL', 86400))  # chats 集合记录超过该时间（秒）后重新请求 Bot API
+
+# 成员验证缓存配置（只缓存已加入的结果）
+MEMBERSHIP_CACHE_SIZE = int(os.getenv('MEMBERSHIP_CACHE_SIZE', 50000))
+MEMBERSHIP_CACHE_TTL = int(os.getenv('MEMBERSHIP_CACHE_TTL', 300))  # 秒
+
+# 数据库迁移配置
+MIGRATION_BACKGROUND_INDEX_DOCS = int(os.getenv('MIGRATION_BACKGROUND_INDEX_DOCS', 100000))  # 文档数超过该值的集合在后台建索引，不阻塞启动
+MIGRATION_TIMEOUT_SECONDS = int(os.getenv('MIGRATION_TIMEOUT_SECONDS', 3600))  # 单个迁移步骤的超时，覆盖 MONGO_TIMEOUT_MS
+
+# 抽奖数据缓存配置（lottery_settings 和 prizes 创建后不再修改）
+LOTTERY_CACHE_SIZE = int(os.getenv('LOTTERY_CACHE_SIZE', 5000))
+LOTTERY_CACHE_TTL = int(os.getenv('LOTTERY_CACHE_TTL', 3600))  # 秒
+
+# 消息发送限速配置（Telegram 限制：全局约30条/秒，单个私聊约1条/秒，单个群组约20条/分钟）
+DISPATCH_GLOBAL_RATE = float(os.getenv('DISPATCH_GLOBAL_RATE', 30))
+DISPATCH_PRIVATE_CHAT_RATE = float(os.getenv('DISPATCH_PRIVATE_CHAT_RATE', 1))
+DISPATCH_GROUP_CHAT_RATE = float(os.getenv('DISPATCH_GROUP_CHAT_RATE', 20 / 60))
+DISPATCH_WORKERS = int(os.getenv('DISPATCH_WORKERS', 16))  # 并发发送协程数
+DISPATCH_MAX_RETRIES = int(os.getenv('DISPATCH_MAX_RETRIES', 3))
+
+# 实例标识（多实例部署时用于租约归属）
+INSTANCE_ID = os.getenv('INSTANCE_ID') or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+# 发件箱配置
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', 2))  # 每个实例的投递协程数
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50))  # 每批领取的消息数
+OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', 120))  # 领取租约时长
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 5))  # 空闲时的轮询间隔（秒）
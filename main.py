@@ -5,9 +5,12 @@ import json
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from app.routes import router as api_router
-from config import BASE_DIR, templates
-from app.database import MongoDBConnection, check_db
+from config import BASE_DIR, INSTANCE_ID, templates
+from app.database import MongoDBConnection, check_db, pool_monitor
 from bot import create_bot, start_background_tasks, stop_bot, bot_state
+from bot.leader import leader_elector
+from bot.lottery_cache import lottery_cache
+from bot.message_counter import message_count_buffer
 from utils import logger
 from fastapi import FastAPI, Response
 
@@ -18,6 +21,12 @@ async def lifespan(app: FastAPI):
     try:
         # 检查并初始化数据库
         await check_db()
+
+        # 预热数据库连接池
+        try:
+            await MongoDBConnection.warm_up()
+        except Exception as e:
+            logger.warning(f"MongoDB 连接池预热失败: {e}")
         
         # 初始化模板
         app.state.templates = templates
@@ -41,6 +50,13 @@ async def lifespan(app: FastAPI):
             await asyncio.gather(*bot_state.tasks, return_exceptions=True)
 
         await stop_bot()
+
+        # 机器人已停止处理更新，写回缓冲中尚未落库的发言计数
+        try:
+            written = await message_count_buffer.flush()
+            logger.info(f"已写回发言计数: {written} 条")
+        except Exception as e:
+            logger.error(f"关闭时写回发言计数失败: {e}", exc_info=True)
         logger.info("资源清理完成")
     except Exception as e:
         logger.error(f"生命周期管理出错: {e}", exc_info=True)
@@ -67,6 +83,10 @@ async def health_check(request: Request):
             "database": False,
             "bot": False,
             "background_tasks": False,
+            "role": leader_elector.role,
+            "instance_id": INSTANCE_ID,
+            "lottery_cache": lottery_cache.stats(),
+            "mongo_pool": pool_monitor.stats(),
             "details": [],
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
@@ -119,6 +139,12 @@ async def health_check(request: Request):
             status["details"].append(f"任务状态检查失败: {str(e)}")
             logger.error(f"健康检查 - 任务状态检查失败: {e}")
 
+        # 领导者选举状态
+        if leader_elector.is_leader:
+            status["details"].append("本实例为领导者，负责开奖对账和过期记录清理")
+        else:
+            status["details"].append(f"本实例为跟随者 (当前领导者: {leader_elector.leader_id or '未知'})")
+
         # 确定响应状态码和消息
         is_healthy = all([status["database"], status["bot"], status["background_tasks"]])
         response_data = {
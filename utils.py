@@ -1,6 +1,9 @@
 import logging
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
+from functools import lru_cache
 from typing import Optional
+from zoneinfo import ZoneInfo
+from config import DISPLAY_TIMEZONE
 
 # 修改初始化组件定义
 _INITIALIZED_COMPONENTS = {
@@ -55,6 +58,53 @@ def mark_initialized(component: str, force: bool = False) -> bool:
     return was_initialized
 
 
+# 显示时区
+_DISPLAY_TZ = ZoneInfo(DISPLAY_TIMEZONE)
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+# 缓存时区偏移的时间片（秒）
+_OFFSET_SLOT_SECONDS = 900
+
+
+def _offset_at(seconds: int) -> int:
+    return int(datetime.fromtimestamp(seconds, _DISPLAY_TZ).utcoffset().total_seconds())
+
+
+@lru_cache(maxsize=16384)
+def _slot_offset(slot: int) -> Optional[int]:
+    """UTC 时间片（自纪元起第几个 15 分钟）内的显示时区偏移（秒）
+
+    时区切换不一定在 UTC 整点（如 Australia/Adelaide 在 UTC 16:30，
+    America/St_Johns 曾在 UTC 2:31），时间片内发生切换时返回 None，由调用方逐个计算。
+    """
+    start = slot * _OFFSET_SLOT_SECONDS
+    offset = _offset_at(start)
+    return offset if _offset_at(start + _OFFSET_SLOT_SECONDS - 1) == offset else None
+
+
+@lru_cache(maxsize=4096)
+def _date_prefix(day: int) -> str:
+    return date.fromordinal(_EPOCH_ORDINAL + day).strftime('%Y-%m-%d ')
+
+
+def format_timestamp(value: Optional[datetime], default: str = '') -> str:
+    """将时间格式化为显示时区的 'YYYY-MM-DD HH:MM:SS'
+
+    时区偏移按 15 分钟（含切换点的时间片除外）、日期部分按天缓存，列表渲染时每条记录只做整数运算，
+    不创建中间 datetime 对象。无时区信息的时间按 UTC 处理。
+    """
+    if value is None:
+        return default
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    seconds = int(value.timestamp())
+    offset = _slot_offset(seconds // _OFFSET_SLOT_SECONDS)
+    seconds += offset if offset is not None else _offset_at(seconds)
+    day, rest = divmod(seconds, 86400)
+    return f"{_date_prefix(day)}{rest // 3600:02d}:{rest // 60 % 60:02d}:{rest % 60:02d}"
+
+
 def parse_time(time_str: str) -> str:
     """解析开奖时间字符串"""
     try:
@@ -75,8 +125,17 @@ def parse_time(time_str: str) -> str:
         return "时间格式错误"
 
 
+async def _resolve_username(username: str) -> Optional[int]:
+    """从聊天信息缓存和 chats 记录中查找用户名对应的 ID（不请求 Bot API）"""
+    from bot.chat_cache import chat_cache
+    return await chat_cache.resolve_username(username)
+
+
 async def parse_group_input(query: str) -> tuple[Optional[int], Optional[str]]:
-    """解析输入的群组/频道信息"""
+    """解析输入的群组/频道信息
+
+    用户名对应的聊天已被机器人见过时，同时返回其 ID
+    """
     try:
         # 1. 处理数字ID
         if query.startswith('-100'):
@@ -84,7 +143,7 @@ async def parse_group_input(query: str) -> tuple[Optional[int], Optional[str]]:
             
         # 2. 处理用户名
         elif query.startswith('@'):
-            return None, query
+            return await _resolve_username(query), query
            
         # 3. 处理链接
         elif 't.me/' in query:
@@ -99,13 +158,13 @@ async def parse_group_input(query: str) -> tuple[Optional[int], Optional[str]]:
             # 如果是公开链接
             else:
                 username = f'@{path.strip("/")}'
-                return None, username
+                return await _resolve_username(username), username
         # 4. 处理userID
         elif query.isdigit():
             return int(query), None
         # 5. 处理其他情况
         else:
-            return None, f'@{query}' 
+            return await _resolve_username(f'@{query}'), f'@{query}' 
     except Exception as e:
         logger.error(f"解析群组输入时出错: {e}")
         return None, None